@@ -0,0 +1,289 @@
+import io
+import json
+import mmap
+import os
+import pickle
+import platform
+import struct
+import zlib
+import joblib
+import numpy as np
+import sklearn
+from src import config
+
+MAGIC = b'AIRBNBM\x01'
+FORMAT_VERSION = 1
+ALIGNMENT = 64 # segments start on cache-line boundaries, so memory-mapped arrays are aligned
+MODEL_FORMATS = {'.joblib': 'joblib', '.artifact': 'artifact'}
+
+class IncompatibleArtifactError(ValueError):
+    """
+    Raised when an artifact was saved with library versions it cannot be loaded with.
+    """
+
+def version_fingerprint(boosters=()):
+    """
+    Returns the versions an artifact depends on. Python, numpy and scikit-learn are always
+    recorded, LightGBM and XGBoost only when the artifact holds one of their boosters.
+
+    Parameters
+    ----------
+    boosters : iterable of str, optional
+        The libraries of the boosters in the artifact (default is none).
+
+    Returns
+    -------
+    dict
+        The version of each library.
+    """
+    versions = {'format': str(FORMAT_VERSION), 'python': platform.python_version(),
+                'numpy': np.__version__, 'scikit-learn': sklearn.__version__}
+    for library in sorted(set(boosters)):
+        versions[library] = __import__(library).__version__
+    return versions
+
+def compatibility_errors(saved, current):
+    """
+    Compares the versions an artifact was saved with to the installed ones. The artifact
+    format must match exactly, scikit-learn and Python up to the minor version (pickled
+    estimators are not portable across them) and numpy and the boosters up to the major version.
+
+    Returns
+    -------
+    list of str
+        A description of each incompatible version, empty if the artifact can be loaded.
+    """
+    parts = {'format': 1, 'python': 2, 'scikit-learn': 2, 'numpy': 1, 'lightgbm': 1, 'xgboost': 1}
+    errors = []
+    for library, version in saved.items():
+        n = parts.get(library, 1)
+        if version.split('.')[:n] != current[library].split('.')[:n]:
+            errors.append(f"{library} {version} (installed: {current[library]})")
+    return errors
+
+class _ArtifactPickler(pickle.Pickler):
+    """
+    Pickles a model, storing its numeric arrays and boosters out of band.
+    """
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+        self.boosters = []
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            self.arrays.append(obj if obj.flags.f_contiguous and not obj.flags.c_contiguous else np.ascontiguousarray(obj))
+            return ('array', len(self.arrays) - 1)
+        module = type(obj).__module__.split('.')[0]
+        if type(obj).__name__ == 'Booster' and module == 'lightgbm':
+            self.boosters.append(('lightgbm', obj.model_to_string().encode()))
+            return ('booster', len(self.boosters) - 1)
+        if type(obj).__name__ == 'Booster' and module == 'xgboost':
+            self.boosters.append(('xgboost', bytes(obj.save_raw(raw_format='ubj'))))
+            return ('booster', len(self.boosters) - 1)
+        return None
+
+class _ArtifactUnpickler(pickle.Unpickler):
+    """
+    Unpickles a model, restoring its arrays as read-only views of the memory-mapped file and
+    its boosters from their native format.
+    """
+    def __init__(self, file, arrays, boosters):
+        super().__init__(file)
+        self.arrays = arrays
+        self.boosters = boosters
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        if kind == 'array':
+            return self.arrays[index]
+        library, data = self.boosters[index]
+        if library == 'lightgbm':
+            import lightgbm
+            return lightgbm.Booster(model_str=data.decode())
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(bytearray(data))
+        return booster
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write_artifact(model, path, compress=config.MODEL_COMPRESS):
+    """
+    Saves a model as an artifact: a JSON manifest followed by the pickled model structure,
+    its numeric arrays (raw, so they can be memory-mapped) and its LightGBM/XGBoost boosters
+    (in their native formats).
+
+    Parameters
+    ----------
+    model : object
+        The model, e.g. a fitted sklearn Pipeline.
+    path : str
+        The file to write.
+    compress : bool, optional
+        If True, the pickled structure and the boosters are zlib-compressed (default is config.MODEL_COMPRESS).
+    """
+    buffer = io.BytesIO()
+    pickler = _ArtifactPickler(buffer)
+    pickler.dump(model)
+
+    codec = 'zlib' if compress else None
+    pack = (lambda data: zlib.compress(data, 1)) if compress else bytes
+    segments = [pack(buffer.getvalue())]
+    segments += [np.asarray(array).tobytes(order='A') for array in pickler.arrays]
+    segments += [pack(data) for _, data in pickler.boosters]
+
+    offsets, offset = [], 0
+    for segment in segments:
+        offsets.append(offset)
+        offset = _aligned(offset + len(segment))
+
+    n_arrays = len(pickler.arrays)
+    manifest = {
+        'versions': version_fingerprint(library for library, _ in pickler.boosters),
+        'compression': codec,
+        'model': {'offset': offsets[0], 'nbytes': len(segments[0])},
+        'arrays': [{'offset': offsets[1 + i], 'nbytes': len(segments[1 + i]), 'dtype': array.dtype.str,
+                    'shape': list(array.shape), 'fortran_order': bool(array.flags.f_contiguous and not array.flags.c_contiguous)}
+                   for i, array in enumerate(pickler.arrays)],
+        'boosters': [{'library': library, 'offset': offsets[1 + n_arrays + i], 'nbytes': len(segments[1 + n_arrays + i])}
+                     for i, (library, _) in enumerate(pickler.boosters)],
+    }
+    header = json.dumps(manifest).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    # written to a temporary file and moved over the target, as processes that loaded the
+    # previous artifact keep memory-mapped views of it, which truncating it in place would break
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+            for offset, segment in zip(offsets, segments):
+                f.seek(data_start + offset)
+                f.write(segment)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_manifest(path):
+    """
+    Reads the manifest of an artifact.
+
+    Returns
+    -------
+    tuple
+        The manifest (dict) and the position of the first segment in the file.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise IncompatibleArtifactError(f"{path} is not a model artifact")
+        header_size, = struct.unpack('<Q', f.read(8))
+        manifest = json.loads(f.read(header_size))
+    return manifest, _aligned(len(MAGIC) + 8 + header_size)
+
+def read_artifact(path):
+    """
+    Loads a model saved with write_artifact. The numeric arrays are read-only views of the
+    memory-mapped file, so they are only read from disk when used.
+
+    Parameters
+    ----------
+    path : str
+        The artifact file.
+
+    Returns
+    -------
+    object
+        The model.
+
+    Raises
+    ------
+    IncompatibleArtifactError
+        If the artifact was saved with incompatible library versions.
+    """
+    manifest, data_start = read_manifest(path)
+    saved = manifest['versions']
+    errors = compatibility_errors(saved, version_fingerprint(b['library'] for b in manifest['boosters']))
+    if errors:
+        raise IncompatibleArtifactError(f"{path} was saved with incompatible versions: {', '.join(errors)}")
+
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    unpack = zlib.decompress if manifest['compression'] == 'zlib' else bytes
+
+    def segment(entry):
+        start = data_start + entry['offset']
+        return buffer[start:start + entry['nbytes']]
+
+    arrays = []
+    for entry in manifest['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        if count == 0:
+            arrays.append(np.empty(entry['shape'], dtype=dtype))
+            continue
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + entry['offset'])
+        arrays.append(array.reshape(entry['shape'], order='F' if entry['fortran_order'] else 'C'))
+    boosters = [(entry['library'], unpack(segment(entry))) for entry in manifest['boosters']]
+    return _ArtifactUnpickler(io.BytesIO(unpack(segment(manifest['model']))), arrays, boosters).load()
+
+def model_format(path):
+    """
+    Returns the format of a model file from its extension.
+    """
+    extension = os.path.splitext(path)[1]
+    if extension not in MODEL_FORMATS:
+        raise ValueError(f"Unknown model format: {path}")
+    return MODEL_FORMATS[extension]
+
+def save_model(model, path):
+    """
+    Saves a model in the format given by the extension of path: '.joblib' for a joblib
+    pickle or '.artifact' for an artifact (see write_artifact).
+
+    Parameters
+    ----------
+    model : object
+        The model.
+    path : str
+        The file to write.
+    """
+    if model_format(path) == 'joblib':
+        joblib.dump(model, path)
+    else:
+        write_artifact(model, path)
+
+def load_model(path):
+    """
+    Loads a model saved with save_model.
+
+    Parameters
+    ----------
+    path : str
+        The model file.
+
+    Returns
+    -------
+    object
+        The model.
+    """
+    if model_format(path) == 'joblib':
+        return joblib.load(path)
+    return read_artifact(path)
+
+def main():
+    """
+    Main function to convert the joblib models in output/models to the format of config.MODEL_FORMAT.
+    """
+    for path in [config.RFECV_PATH, config.DUMMY_PATH, config.LINEAR_PATH]:
+        legacy = os.path.splitext(path)[0] + '.joblib'
+        if legacy == path or not os.path.isfile(legacy):
+            continue
+        save_model(joblib.load(legacy), path)
+        print(f"{os.path.basename(legacy)} ({os.path.getsize(legacy):,} bytes) -> {os.path.basename(path)} ({os.path.getsize(path):,} bytes)")
+
+if __name__ == "__main__":
+    main()
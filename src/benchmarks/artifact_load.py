@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from src import config
+from src.artifacts import load_model, save_model, write_artifact
+
+COLD_START = "import time; start = time.perf_counter(); from src.artifacts import load_model; load_model({path!r}); print(time.perf_counter() - start)"
+
+def cold_start_time(path, repeats):
+    """
+    Measures the time to import the loader and load a model in a fresh interpreter.
+
+    Parameters
+    ----------
+    path : str
+        The model file.
+    repeats : int
+        The number of fresh interpreters to time.
+
+    Returns
+    -------
+    float
+        The median load time (s), imports included.
+    """
+    times = [float(subprocess.run([sys.executable, '-c', COLD_START.format(path=path)], cwd=config.ROOT_DIR,
+                                  capture_output=True, text=True, check=True).stdout.split()[-1])
+             for _ in range(repeats)]
+    return float(np.median(times))
+
+def warm_load_time(path, repeats):
+    """
+    Measures the time to load a model in this interpreter, where the libraries are already imported.
+
+    Returns
+    -------
+    float
+        The median load time (s).
+    """
+    load_model(path)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load_model(path)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def main(paths=(config.RFECV_PATH, config.DUMMY_PATH, config.LINEAR_PATH), repeats=5):
+    """
+    Main function to benchmark the size and load time of the saved models as joblib pickles
+    and as artifacts, with and without compression.
+
+    Parameters
+    ----------
+    paths : tuple, optional
+        The saved models (default is the RFECV, dummy and linear models).
+    repeats : int, optional
+        The number of times each load is timed (default is 5).
+    """
+    print(f"{'model':<14} {'format':<20} {'size (KB)':>10} {'cold (ms)':>10} {'warm (ms)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in paths:
+            if not os.path.isfile(path):
+                print(f"Error no file: {path} ")
+                continue
+            model = load_model(path)
+            name = os.path.splitext(os.path.basename(path))[0]
+            variants = {
+                'joblib': (os.path.join(tmp, f'{name}.joblib'), lambda p: save_model(model, p)),
+                'artifact': (os.path.join(tmp, f'{name}.artifact'), lambda p: write_artifact(model, p, compress=False)),
+                'artifact (zlib)': (os.path.join(tmp, f'{name}_zlib.artifact'), lambda p: write_artifact(model, p, compress=True)),
+            }
+            for label, (variant_path, save) in variants.items():
+                save(variant_path)
+                size = os.path.getsize(variant_path) / 1024
+                cold = cold_start_time(variant_path, repeats) * 1000
+                warm = warm_load_time(variant_path, repeats) * 1000
+                print(f"{name:<14} {label:<20} {size:>10.1f} {cold:>10.1f} {warm:>10.2f}")
+
+if __name__ == "__main__":
+    main()
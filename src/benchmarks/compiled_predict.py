@@ -0,0 +1,69 @@
+import os
+import time
+import numpy as np
+from src import config
+from src.artifacts import load_model
+from src.models.compiled import compile_pipeline
+from src.preprocessor import MODEL_FEATURES
+from src.storage import load_frame
+
+def resample_listings(X, n_rows, seed=123):
+    """
+    Draws listings with replacement to build a large batch.
+
+    Parameters
+    ----------
+    X : pd.DataFrame
+        The listings.
+    n_rows : int
+        The number of rows.
+    seed : int, optional
+        The random seed (default is 123).
+
+    Returns
+    -------
+    pd.DataFrame
+        The batch.
+    """
+    return X.sample(n_rows, replace=True, random_state=seed).reset_index(drop=True)
+
+def main(sizes=(10_000, 100_000, 1_000_000)):
+    """
+    Main function to benchmark the compiled RFECV model against the pipeline's predict.
+
+    Parameters
+    ----------
+    sizes : tuple, optional
+        The numbers of rows to benchmark.
+    """
+    # Check files exist
+    files = [config.RFECV_PATH, config.X_TEST_DATA]
+    for f in files:
+        if not os.path.isfile(f):
+            print(f"Error no file: {f} ")
+            return  # exit function
+
+    X_test = load_frame(config.X_TEST_DATA, columns=MODEL_FEATURES)
+    pipe_rfecv = load_model(config.RFECV_PATH)
+    start = time.perf_counter()
+    compiled = compile_pipeline(pipe_rfecv)
+    print(f"compile time: {time.perf_counter() - start:.3f} s")
+
+    print(f"{'rows':>12} {'pipeline (s)':>13} {'compiled (s)':>13} {'speedup':>8} {'max diff':>9}")
+    for n_rows in sizes:
+        X = resample_listings(X_test, n_rows)
+
+        start = time.perf_counter()
+        expected = pipe_rfecv.predict(X)
+        pipeline_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predicted = compiled.predict(X)
+        compiled_time = time.perf_counter() - start
+
+        difference = np.abs(predicted - expected).max()
+        assert np.allclose(predicted, expected, rtol=1e-12, atol=1e-12), "Compiled predictions do not match"
+        print(f'{n_rows:>12,} {pipeline_time:13.3f} {compiled_time:13.3f} {pipeline_time / compiled_time:7.1f}x {difference:9.2g}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import pandas as pd
+import numpy as np
+import time
+from src import config
+from src.clean_and_engineer import distance_from_city_center
+
+def rowwise_distance_from_city_center(df):
+    """
+    The original row-by-row implementation of distance_from_city_center, kept as a reference.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The input dataframe with 'latitude' and 'longitude' columns.
+
+    Returns
+    -------
+    pd.Series
+        The distance (km) of each listing from the NYC center.
+    """
+    nyc_center_lat, nyc_center_lon = config.CITY_CENTER
+
+    def distance_from_city(lat1, lon1, lat2, lon2):
+        R = 6371
+        dlat = np.radians(lat2 - lat1)
+        dlon = np.radians(lon2 - lon1)
+        a = np.sin(dlat / 2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon / 2)**2
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        return R * c
+
+    return df.apply(lambda row: distance_from_city(
+                row['latitude'], row['longitude'], nyc_center_lat, nyc_center_lon), axis=1)
+
+def random_coordinates(n_rows, seed=123):
+    """
+    Creates a dataframe of random listing coordinates spread over the NYC area.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of listings.
+    seed : int, optional
+        The random seed (default is 123).
+
+    Returns
+    -------
+    pd.DataFrame
+        A dataframe with 'latitude' and 'longitude' columns.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'latitude': rng.uniform(40.50, 40.91, n_rows), 
+                         'longitude': rng.uniform(-74.24, -73.71, n_rows)})
+
+def main(sizes=(50_000, 1_000_000, 10_000_000), rowwise_limit=1_000_000):
+    """
+    Main function to benchmark the vectorized haversine against the row-wise version. 
+
+    Parameters
+    ----------
+    sizes : tuple, optional
+        The numbers of rows to benchmark.
+    rowwise_limit : int, optional
+        The largest size the row-wise version is run on; above it its time is extrapolated 
+        from the per-row time of the largest measured size. 
+    """
+    per_row = None
+    print(f"{'rows':>12} {'row-wise (s)':>14} {'vectorized (s)':>15} {'anchors (s)':>12} {'speedup':>9}")
+    for n_rows in sizes:
+        df = random_coordinates(n_rows)
+
+        start = time.perf_counter()
+        vectorized = distance_from_city_center(df.copy())['distance_from_city_center']
+        vectorized_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        distance_from_city_center(df.copy(), anchors=config.NYC_ANCHORS)
+        anchors_time = time.perf_counter() - start
+
+        if n_rows <= rowwise_limit:
+            start = time.perf_counter()
+            rowwise = rowwise_distance_from_city_center(df)
+            rowwise_time = time.perf_counter() - start
+            per_row = rowwise_time / n_rows
+            assert np.allclose(rowwise, vectorized, rtol=1e-12, atol=1e-9), "Vectorized distances do not match"
+            label = f'{rowwise_time:14.3f}'
+        else:
+            rowwise_time = per_row * n_rows
+            label = f'{rowwise_time:13.3f}*'
+
+        print(f'{n_rows:>12,} {label} {vectorized_time:15.3f} {anchors_time:12.3f} {rowwise_time / vectorized_time:8.0f}x')
+    print(f'* extrapolated from the row-wise time per row at {rowwise_limit:,} rows')
+
+if __name__ == "__main__":
+    main()
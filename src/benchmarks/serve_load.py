@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+from src import config
+from src.serve import REQUIRED_FIELDS, OPTIONAL_FIELDS
+from src.storage import load_frame
+
+def sample_records(n_records, path=config.RAW_DATA):
+    """
+    Reads raw listings to send as requests, in the JSON form of the AB_NYC_2019 schema.
+
+    Parameters
+    ----------
+    n_records : int
+        The number of listings.
+    path : str, optional
+        The raw listings file (default is config.RAW_DATA).
+
+    Returns
+    -------
+    list of dict
+        The listings.
+    """
+    df = load_frame(path, columns=REQUIRED_FIELDS + OPTIONAL_FIELDS).head(n_records)
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+async def send_requests(host, port, bodies, latencies, errors):
+    """
+    Sends requests one after another over a single keep-alive connection, recording the
+    latency of each.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    for body in bodies:
+        start = time.perf_counter()
+        writer.write(
+            f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+    writer.close()
+
+async def run_load(host, port, records, n_requests, concurrency, listings_per_request):
+    """
+    Sends n_requests requests from concurrency clients.
+
+    Returns
+    -------
+    tuple
+        The latencies (s), the error status codes and the wall time (s).
+    """
+    bodies = [json.dumps([records[(i * listings_per_request + j) % len(records)] for j in range(listings_per_request)]).encode()
+              for i in range(n_requests)]
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(send_requests(host, port, bodies[i::concurrency], latencies, errors)
+                           for i in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - start
+
+async def wait_until_up(host, port, timeout=60):
+    """
+    Waits until the server accepts connections.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+def main(host=config.SERVE_HOST, port=config.SERVE_PORT, n_requests=5000, concurrency=64, listings_per_request=1,
+         start_server=False, max_batch=config.SERVE_MAX_BATCH, max_wait_ms=config.SERVE_MAX_WAIT_MS):
+    """
+    Main function to load test the prediction server and report its latency and throughput.
+
+    Parameters
+    ----------
+    host : str, optional
+        The address of the server (default is config.SERVE_HOST).
+    port : int, optional
+        The port of the server (default is config.SERVE_PORT).
+    n_requests : int, optional
+        The total number of requests (default is 5000).
+    concurrency : int, optional
+        The number of concurrent clients (default is 64).
+    listings_per_request : int, optional
+        The number of listings in each request (default is 1).
+    start_server : bool, optional
+        If True, a server is started for the test with max_batch and max_wait_ms and
+        stopped afterwards (default is False).
+    max_batch : int, optional
+        The micro-batch size of the started server (default is config.SERVE_MAX_BATCH).
+    max_wait_ms : float, optional
+        The micro-batch wait of the started server (default is config.SERVE_MAX_WAIT_MS).
+    """
+    records = sample_records(max(1000, listings_per_request))
+    server = None
+    if start_server:
+        server = subprocess.Popen([sys.executable, '-m', 'src.serve', '--host', host, '--port', str(port),
+                                   '--max-batch', str(max_batch), '--max-wait-ms', str(max_wait_ms)],
+                                  cwd=config.ROOT_DIR)
+    try:
+        asyncio.run(wait_until_up(host, port))
+        latencies, errors, wall_time = asyncio.run(
+            run_load(host, port, records, n_requests, concurrency, listings_per_request))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{'requests':<12} {n_requests:>10,}")
+    print(f"{'concurrency':<12} {concurrency:>10}")
+    print(f"{'listings/req':<12} {listings_per_request:>10}")
+    print(f"{'errors':<12} {len(errors):>10}")
+    print(f"{'req/s':<12} {n_requests / wall_time:>10.1f}")
+    print(f"{'p50 (ms)':<12} {np.percentile(latencies, 50) * 1000:>10.2f}")
+    print(f"{'p99 (ms)':<12} {np.percentile(latencies, 99) * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the price prediction server.")
+    parser.add_argument('--host', default=config.SERVE_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVE_PORT)
+    parser.add_argument('--requests', type=int, default=5000, help="total number of requests")
+    parser.add_argument('--concurrency', type=int, default=64, help="number of concurrent clients")
+    parser.add_argument('--listings', type=int, default=1, help="listings per request")
+    parser.add_argument('--start-server', action='store_true', help="start a server for the test and stop it afterwards")
+    parser.add_argument('--max-batch', type=int, default=config.SERVE_MAX_BATCH, help="micro-batch size of the started server")
+    parser.add_argument('--max-wait-ms', type=float, default=config.SERVE_MAX_WAIT_MS, help="micro-batch wait of the started server")
+    args = parser.parse_args()
+    main(args.host, args.port, args.requests, args.concurrency, args.listings,
+         args.start_server, args.max_batch, args.max_wait_ms)
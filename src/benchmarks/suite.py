@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import lightgbm
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.dummy import DummyRegressor
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import make_pipeline
+from src import config, transform_split
+from src.benchmarks.synthetic import SIZES, write_synthetic
+from src.clean_and_engineer import clean_listings, engineer_features
+from src.evaluate import evaluate_models
+from src.models.compiled import compile_pipeline
+from src.models.rfecv import create_rfecv_pipeline
+from src.preprocessor import create_preprocessor, MODEL_FEATURES
+from src.storage import load_frame, write_frame
+
+# In pipeline order: a stage runs untimed when it is not selected but a later selected stage needs its output
+BENCHMARKS = ['load_raw', 'clean_and_engineer', 'transform_split', 'preprocessor',
+              'fit_dummy', 'predict_dummy', 'fit_linear', 'predict_linear',
+              'fit_rfecv', 'predict_rfecv', 'predict_rfecv_compiled', 'evaluate']
+
+# Differences below these are treated as noise when comparing against a baseline
+MIN_SECONDS = 0.05
+MIN_MB = 1.0
+
+def measure(func, repeats, memory=True):
+    """
+    Times a function and measures its peak memory. The memory is measured in a separate
+    run, as tracing the allocations slows the function down.
+
+    Parameters
+    ----------
+    func : callable
+        The function to benchmark, called without arguments.
+    repeats : int
+        The number of timed runs.
+    memory : bool, optional
+        If True, the peak memory is measured with tracemalloc (default is True). Only
+        allocations made through Python (incl. NumPy and pandas) are traced, not those
+        inside LightGBM.
+
+    Returns
+    -------
+    tuple
+        The output of the last run and the measurements: the median time (s), the times
+        of all runs and the peak memory (MB, None if not measured).
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = func()
+        times.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return output, {'seconds': float(np.median(times)), 'runs': times, 'peak_mb': peak_mb}
+
+def environment():
+    """
+    Describes the machine and library versions the benchmarks were run with.
+
+    Returns
+    -------
+    dict
+        The environment.
+    """
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+            'lightgbm': lightgbm.__version__}
+
+def run_suite(raw_path, workdir, repeats=config.BENCHMARK_REPEATS, only=None, memory=True):
+    """
+    Benchmarks every pipeline stage and every model fit and predict on one raw dataset,
+    each stage working on the output of the previous one. The models are built without the
+    transformer cache, so every fit does the full work.
+
+    Parameters
+    ----------
+    raw_path : str
+        The raw listings in the AB_NYC_2019.csv schema.
+    workdir : str
+        The directory for the intermediate files.
+    repeats : int, optional
+        The number of timed runs of each stage (default is config.BENCHMARK_REPEATS).
+    only : list, optional
+        The benchmarks to run (default is all of BENCHMARKS).
+    memory : bool, optional
+        If True, the peak memory of each stage is measured (default is True).
+
+    Returns
+    -------
+    tuple
+        The number of raw listings and the measurements of each benchmark, with its rows per second.
+    """
+    selected = set(only or BENCHMARKS)
+    last = max(BENCHMARKS.index(name) for name in selected)
+    results = {}
+
+    def stage(name, func, n_rows):
+        if name not in selected:
+            return func()
+        output, result = measure(func, repeats, memory)
+        result['rows'] = len(output) if n_rows is None else n_rows
+        result['rows_per_s'] = result['rows'] / result['seconds']
+        results[name] = result
+        print(f"{name:<24} {result['seconds']:10.3f} s {result['rows_per_s']:14,.0f} rows/s"
+              + (f" {result['peak_mb']:10.1f} MB" if result['peak_mb'] is not None else ''))
+        return output
+
+    for name in BENCHMARKS[:last + 1]:
+        if name == 'load_raw':
+            raw = stage(name, lambda: load_frame(raw_path, report=False), None)
+            n_raw = len(raw)
+        elif name == 'clean_and_engineer':
+            df = stage(name, lambda: engineer_features(clean_listings(raw)), n_raw)
+            feat_eng_path = os.path.join(workdir, f'feature_engineered.{config.DATA_FORMAT}')
+            write_frame(df, feat_eng_path)
+            del raw, df
+        elif name == 'transform_split':
+            stage(name, lambda: transform_split.main(feat_eng_path, workdir, split_mode='random'), n_raw)
+            split = {part: os.path.join(workdir, f'{part}.{config.DATA_FORMAT}') for part in ['X_train', 'y_train', 'X_test', 'y_test']}
+            X_train = load_frame(split['X_train'], columns=MODEL_FEATURES, report=False)
+            y_train = load_frame(split['y_train'], report=False).values.ravel()
+            X_test = load_frame(split['X_test'], columns=MODEL_FEATURES, report=False)
+            y_test = load_frame(split['y_test'], report=False).values.ravel()
+        elif name == 'preprocessor':
+            stage(name, lambda: create_preprocessor().fit_transform(X_train), len(X_train))
+        elif name == 'fit_dummy':
+            pipe_dummy = stage(name, lambda: make_pipeline(create_preprocessor(), DummyRegressor()).fit(X_train, y_train), len(X_train))
+        elif name == 'predict_dummy':
+            stage(name, lambda: pipe_dummy.predict(X_test), len(X_test))
+        elif name == 'fit_linear':
+            pipe_linear = stage(name, lambda: make_pipeline(create_preprocessor(), Ridge()).fit(X_train, y_train), len(X_train))
+        elif name == 'predict_linear':
+            stage(name, lambda: pipe_linear.predict(X_test), len(X_test))
+        elif name == 'fit_rfecv':
+            pipe_rfecv = stage(name, lambda: create_rfecv_pipeline(cache=False).fit(X_train, y_train), len(X_train))
+        elif name == 'predict_rfecv':
+            stage(name, lambda: pipe_rfecv.predict(X_test), len(X_test))
+        elif name == 'predict_rfecv_compiled':
+            compiled = compile_pipeline(pipe_rfecv)
+            stage(name, lambda: compiled.predict(X_test), len(X_test))
+        elif name == 'evaluate':
+            models = {'RFECV': pipe_rfecv, 'Dummy': pipe_dummy, 'Linear': pipe_linear}
+            stage(name, lambda: evaluate_models(models, X_test, y_test), len(X_test))
+    return n_raw, results
+
+def compare(results, baseline, tolerance=config.BENCHMARK_TOLERANCE):
+    """
+    Compares benchmark results against a baseline. A benchmark regresses when its time or
+    peak memory grew by more than the tolerance and by more than the noise floor
+    (MIN_SECONDS, MIN_MB).
+
+    Parameters
+    ----------
+    results : dict
+        The benchmark results, as saved by main.
+    baseline : dict
+        The baseline results.
+    tolerance : float, optional
+        The relative growth allowed (default is config.BENCHMARK_TOLERANCE).
+
+    Returns
+    -------
+    list
+        The regressions, as (benchmark, metric, baseline value, new value).
+    """
+    if results['rows'] != baseline['rows']:
+        print(f"Warning: comparing {results['rows']:,} rows against a baseline of {baseline['rows']:,} rows")
+
+    regressions = []
+    print(f"{'benchmark':<24} {'baseline (s)':>12} {'new (s)':>10} {'change':>8} {'baseline (MB)':>14} {'new (MB)':>10} {'change':>8}")
+    for name, new in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            continue
+        line = f"{name:<24} {old['seconds']:12.3f} {new['seconds']:10.3f} {new['seconds'] / old['seconds'] - 1:+8.0%}"
+        if new['seconds'] > old['seconds'] * (1 + tolerance) and new['seconds'] - old['seconds'] > MIN_SECONDS:
+            regressions.append((name, 'seconds', old['seconds'], new['seconds']))
+        if old['peak_mb'] is not None and new['peak_mb'] is not None:
+            line += f" {old['peak_mb']:14.1f} {new['peak_mb']:10.1f} {new['peak_mb'] / max(old['peak_mb'], 1e-9) - 1:+8.0%}"
+            if new['peak_mb'] > old['peak_mb'] * (1 + tolerance) and new['peak_mb'] - old['peak_mb'] > MIN_MB:
+                regressions.append((name, 'peak_mb', old['peak_mb'], new['peak_mb']))
+        print(line)
+
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name}: {metric} {old:.3f} -> {new:.3f}")
+    if not regressions:
+        print(f"No regressions (tolerance {tolerance:.0%})")
+    return regressions
+
+def baseline_path(n_rows):
+    """
+    Returns the path of the saved baseline for a dataset size.
+    """
+    return os.path.join(config.BENCHMARK_OUTPUT_DIR, f'baseline_{n_rows}.json')
+
+def main(n_rows=SIZES[0], repeats=config.BENCHMARK_REPEATS, data=None, output=None, only=None,
+         memory=True, save_baseline=False, check=False):
+    """
+    Main function to run the benchmark suite on synthetic listings and save the results as JSON.
+
+    Parameters
+    ----------
+    n_rows : int, optional
+        The number of synthetic listings (default is 50,000).
+    repeats : int, optional
+        The number of timed runs of each stage (default is config.BENCHMARK_REPEATS).
+    data : str, optional
+        Raw listings to benchmark on instead of generating them, e.g. from src.benchmarks.synthetic.
+    output : str, optional
+        The results file (default is output/benchmarks/benchmark_<n_rows>.json).
+    only : list, optional
+        The benchmarks to run (default is all of BENCHMARKS).
+    memory : bool, optional
+        If True, the peak memory of each stage is measured (default is True).
+    save_baseline : bool, optional
+        If True, the results are also saved as the baseline of this dataset size.
+    check : bool, optional
+        If True, the results are compared against the saved baseline.
+
+    Returns
+    -------
+    list
+        The regressions found against the baseline (empty if not checked).
+    """
+    if data is not None and not os.path.isfile(data):
+        print(f"Error no file: {data} ")
+        return []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if data is None:
+            data = os.path.join(workdir, 'AB_NYC_synthetic.csv')
+            print(f"Generating {n_rows:,} synthetic listings")
+            write_synthetic(data, n_rows)
+        n_rows, results = run_suite(data, workdir, repeats, only, memory)
+
+    report = {'rows': n_rows, 'repeats': repeats, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'environment': environment(), 'benchmarks': results}
+    os.makedirs(config.BENCHMARK_OUTPUT_DIR, exist_ok=True)
+    paths = [output or os.path.join(config.BENCHMARK_OUTPUT_DIR, f'benchmark_{n_rows}.json')]
+    if save_baseline:
+        paths.append(baseline_path(n_rows))
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+
+    if not check:
+        return []
+    if not os.path.isfile(baseline_path(n_rows)):
+        print(f"Error no file: {baseline_path(n_rows)} ")
+        return []
+    with open(baseline_path(n_rows)) as f:
+        return compare(report, json.load(f))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and models on synthetic listings.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="run the benchmarks")
+    run.add_argument('--rows', type=int, default=SIZES[0], help=f"number of synthetic listings, e.g. {', '.join(f'{s:,}' for s in SIZES)}")
+    run.add_argument('--repeats', type=int, default=config.BENCHMARK_REPEATS)
+    run.add_argument('--data', default=None, help="raw listings to use instead of generating them")
+    run.add_argument('--output', default=None, help="results file (default output/benchmarks/benchmark_<rows>.json)")
+    run.add_argument('--only', nargs='+', choices=BENCHMARKS, default=None, help="benchmarks to run")
+    run.add_argument('--skip-memory', action='store_true', help="do not measure the peak memory")
+    run.add_argument('--save-baseline', action='store_true', help="also save the results as the baseline")
+    run.add_argument('--check', action='store_true', help="flag regressions against the saved baseline")
+    check = commands.add_parser('compare', help="flag regressions of saved results against a baseline")
+    check.add_argument('results', help="results file")
+    check.add_argument('--baseline', default=None, help="baseline file (default output/benchmarks/baseline_<rows>.json)")
+    check.add_argument('--tolerance', type=float, default=config.BENCHMARK_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        regressions = main(args.rows, args.repeats, args.data, args.output, args.only,
+                           not args.skip_memory, args.save_baseline, args.check)
+    else:
+        with open(args.results) as f:
+            results = json.load(f)
+        with open(args.baseline or baseline_path(results['rows'])) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+    sys.exit(1 if regressions else 0)
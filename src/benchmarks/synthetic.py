@@ -0,0 +1,189 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from src import config
+from src.storage import FrameWriter
+
+# The dataset sizes the benchmarks are run at: the size of AB_NYC_2019.csv, and 20x and 200x it
+SIZES = (50_000, 1_000_000, 10_000_000)
+
+# Share of listings, center (latitude, longitude), spread and log-price effect of each borough,
+# and some of its neighbourhoods, roughly as in AB_NYC_2019.csv
+BOROUGHS = {
+    'Manhattan': (0.443, (40.7831, -73.9712), (0.030, 0.020), 0.35,
+                  ['Harlem', 'Upper West Side', "Hell's Kitchen", 'East Village', 'Upper East Side',
+                   'Midtown', 'East Harlem', 'Chelsea', 'Lower East Side', 'Washington Heights']),
+    'Brooklyn': (0.411, (40.6782, -73.9442), (0.035, 0.040), 0.05,
+                 ['Williamsburg', 'Bedford-Stuyvesant', 'Bushwick', 'Crown Heights', 'Greenpoint',
+                  'Flatbush', 'Clinton Hill', 'Park Slope', 'Prospect-Lefferts Gardens', 'Fort Greene']),
+    'Queens': (0.116, (40.7282, -73.7949), (0.050, 0.070), -0.15,
+               ['Astoria', 'Long Island City', 'Flushing', 'Ridgewood', 'Sunnyside', 'Ditmars Steinway',
+                'Jamaica', 'Jackson Heights', 'Woodside', 'Elmhurst']),
+    'Bronx': (0.022, (40.8448, -73.8648), (0.030, 0.035), -0.25,
+              ['Kingsbridge', 'Mott Haven', 'Concourse', 'Fordham', 'Longwood', 'Wakefield']),
+    'Staten Island': (0.008, (40.5795, -74.1502), (0.040, 0.050), -0.20,
+                      ['St. George', 'Tompkinsville', 'Stapleton', 'Concord', 'Arrochar']),
+}
+
+# Share and log-price of each room type
+ROOM_TYPES = {'Entire home/apt': (0.520, 5.05), 'Private room': (0.457, 4.25), 'Shared room': (0.023, 3.95)}
+
+# Share of the most common minimum nights
+MINIMUM_NIGHTS = {1: 0.26, 2: 0.24, 3: 0.16, 4: 0.07, 5: 0.06, 6: 0.015, 7: 0.04, 10: 0.01, 14: 0.02,
+                  30: 0.08, 60: 0.01, 90: 0.01, 365: 0.015}
+
+HOST_NAMES = ['Michael', 'David', 'John', 'Alex', 'Sarah', 'Daniel', 'Maria', 'Jessica', 'Mark', 'Anna',
+              'Sonder (NYC)', 'Blueground', 'Kara', 'Jennifer', 'Chris', 'Laura', 'James', 'Emily']
+NAME_WORDS = ['Cozy', 'Sunny', 'Spacious', 'Bright', 'Charming', 'Modern', 'Quiet', 'Beautiful', 'Large', 'Lovely']
+
+def host_assignments(n_rows, rng):
+    """
+    Assigns listings to hosts with a heavy-tailed number of listings per host, most hosts
+    having one listing and a few having hundreds, as in AB_NYC_2019.csv.
+
+    Returns
+    -------
+    tuple
+        The host id of each listing and the number of listings of its host.
+    """
+    sizes = np.minimum(rng.zipf(2.8, size=n_rows), 350)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n_rows) + 1]
+    hosts = rng.permutation(np.repeat(np.arange(len(sizes)), sizes))[:n_rows]
+    host_ids = rng.integers(2000, 274_000_000, size=len(sizes))
+    return host_ids[hosts], np.bincount(hosts)[hosts]
+
+def synthetic_listings(n_rows, seed=123, start_id=2539):
+    """
+    Generates listings in the AB_NYC_2019.csv schema, with realistic distributions: listings
+    clustered around neighbourhood centers of the five boroughs, room type and borough shares
+    as in the original data, log-normal prices depending on the room type, borough and
+    distance to Midtown, and heavy-tailed reviews, minimum nights and host listing counts.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of listings.
+    seed : int or np.random.SeedSequence, optional
+        The random seed (default is 123).
+    start_id : int, optional
+        The id of the first listing, ids increase with gaps (default is 2539, as in AB_NYC_2019.csv).
+
+    Returns
+    -------
+    pd.DataFrame
+        The listings.
+    """
+    rng = np.random.default_rng(seed)
+    boroughs = list(BOROUGHS)
+    borough = rng.choice(len(boroughs), size=n_rows, p=[BOROUGHS[b][0] for b in boroughs])
+
+    # each neighbourhood is centered at a fixed offset from its borough center
+    latitude, longitude, borough_effect = np.empty(n_rows), np.empty(n_rows), np.empty(n_rows)
+    neighbourhood = np.empty(n_rows, dtype=object)
+    for i, name in enumerate(boroughs):
+        _, (lat, lon), (lat_sd, lon_sd), effect, names = BOROUGHS[name]
+        rows = borough == i
+        offsets = np.random.default_rng(i).normal(0, 1, size=(len(names), 2)) * (lat_sd, lon_sd)
+        local = rng.integers(0, len(names), size=rows.sum())
+        neighbourhood[rows] = np.asarray(names, dtype=object)[local]
+        latitude[rows] = lat + offsets[local, 0] + rng.normal(0, lat_sd / 3, size=rows.sum())
+        longitude[rows] = lon + offsets[local, 1] + rng.normal(0, lon_sd / 3, size=rows.sum())
+        borough_effect[rows] = effect
+
+    rooms = list(ROOM_TYPES)
+    room = rng.choice(len(rooms), size=n_rows, p=[ROOM_TYPES[r][0] for r in rooms])
+
+    # reviews: a fifth of listings have none, the others a heavy-tailed count and a last review mostly in 2019
+    number_of_reviews = np.where(rng.random(n_rows) < 0.2, 0, 1 + rng.negative_binomial(0.5, 0.5 / 29.5, size=n_rows))
+    months_listed = rng.uniform(1, 100, size=n_rows)
+    reviews_per_month = np.where(number_of_reviews > 0, np.clip(number_of_reviews / months_listed, 0.01, 20).round(2), np.nan)
+    days_ago = np.minimum(rng.exponential(200, size=n_rows), 3000).astype(np.int64)
+    last_review = pd.Series(pd.Timestamp(config.REFERENCE_DATE) - pd.to_timedelta(days_ago, unit='D'))
+    last_review = last_review.dt.strftime('%Y-%m-%d').where(number_of_reviews > 0)
+
+    nights = np.fromiter(MINIMUM_NIGHTS, dtype=np.int64)
+    minimum_nights = rng.choice(nights, size=n_rows, p=np.fromiter(MINIMUM_NIGHTS.values(), dtype=float) / sum(MINIMUM_NIGHTS.values()))
+    availability_365 = np.where(rng.random(n_rows) < 0.36, 0, rng.integers(1, 366, size=n_rows))
+    host_ids, host_listings = host_assignments(n_rows, rng)
+
+    # log-normal price: room type and borough effects, a premium near Midtown and noise
+    center_lat, center_lon = config.CITY_CENTER
+    distance = np.hypot(latitude - center_lat, (longitude - center_lon) * np.cos(np.radians(center_lat))) * 111
+    log_price = (np.array([ROOM_TYPES[r][1] for r in rooms])[room] + borough_effect - 0.015 * distance
+                 + 0.0005 * availability_365 + rng.normal(0, 0.55, size=n_rows))
+    price = np.clip(np.exp(log_price).round(), 10, 10_000).astype(np.int64)
+    price[rng.random(n_rows) < 0.0002] = 0 # a few free listings, removed by the cleaning
+
+    words = np.asarray(NAME_WORDS, dtype=object)[rng.integers(0, len(NAME_WORDS), size=n_rows)]
+    room_words = np.array(['apartment', 'room', 'shared room'], dtype=object)[room]
+    return pd.DataFrame({
+        'id': start_id + np.cumsum(rng.integers(1, 20, size=n_rows)),
+        'name': words + ' ' + room_words + ' in ' + neighbourhood,
+        'host_id': host_ids,
+        'host_name': np.asarray(HOST_NAMES, dtype=object)[host_ids % len(HOST_NAMES)],
+        'neighbourhood_group': np.asarray(boroughs, dtype=object)[borough],
+        'neighbourhood': neighbourhood,
+        'latitude': latitude.round(5),
+        'longitude': longitude.round(5),
+        'room_type': np.asarray(rooms, dtype=object)[room],
+        'price': price,
+        'minimum_nights': minimum_nights,
+        'number_of_reviews': number_of_reviews,
+        'last_review': last_review.to_numpy(),
+        'reviews_per_month': reviews_per_month,
+        'calculated_host_listings_count': host_listings,
+        'availability_365': availability_365,
+    })
+
+def write_synthetic(path, n_rows, seed=123, chunksize=1_000_000):
+    """
+    Writes synthetic listings to a file chunk by chunk, so datasets larger than memory can
+    be generated. Every chunk has its own random stream, so the data only depends on the seed,
+    the number of rows and the chunk size.
+
+    Parameters
+    ----------
+    path : str
+        The output path ending in .csv, .parquet or .feather.
+    n_rows : int
+        The number of listings.
+    seed : int, optional
+        The random seed (default is 123).
+    chunksize : int, optional
+        The number of listings generated at once (default is 1,000,000).
+    """
+    starts = range(0, n_rows, chunksize)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    next_id = 2539
+    with FrameWriter(path) as writer:
+        for start, chunk_seed in zip(starts, seeds):
+            chunk = synthetic_listings(min(chunksize, n_rows - start), chunk_seed, start_id=next_id)
+            next_id = int(chunk['id'].iloc[-1]) + 1
+            writer.write(chunk)
+
+def main(n_rows=SIZES[0], path=None, seed=123):
+    """
+    Main function to generate a synthetic AB_NYC_2019.csv.
+
+    Parameters
+    ----------
+    n_rows : int, optional
+        The number of listings (default is 50,000).
+    path : str, optional
+        The output file (default is data/synthetic/AB_NYC_<n_rows>.csv).
+    seed : int, optional
+        The random seed (default is 123).
+    """
+    path = path or os.path.join(config.ROOT_DIR, 'data', 'synthetic', f'AB_NYC_{n_rows}.csv')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_synthetic(path, n_rows, seed)
+    print(f"Wrote {n_rows:,} listings to {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic listings in the AB_NYC_2019.csv schema.")
+    parser.add_argument('--rows', type=int, default=SIZES[0], help=f"number of listings, e.g. {', '.join(f'{s:,}' for s in SIZES)}")
+    parser.add_argument('--output', default=None, help="output file (.csv, .parquet or .feather)")
+    parser.add_argument('--seed', type=int, default=123)
+    args = parser.parse_args()
+    main(args.rows, args.output, args.seed)
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 from src import config
-from datetime import datetime
+from src.profiling import profiled
+from src.storage import load_frame, read_frame, write_frame, FrameWriter
 import os 
 
 def estimated_listed_months(df): 
@@ -43,7 +44,7 @@ def availability_ratio(df):
 
     return df 
 
-def days_since_last_review(df): 
+def days_since_last_review(df, reference_date=None): 
     """
     This function appends a new column 'days_since_last_review' to the dataframe (df) 
     which provides a numeric value for the number of days since the last review.
@@ -52,70 +53,276 @@ def days_since_last_review(df):
     ----------
     df : pandas.DataFrame
         The input dataframe. 
+    reference_date : str or datetime, optional
+        The date the days are counted up to (default is config.REFERENCE_DATE).
 
     Returns
     -------
     pd.DataFrame
         The dataframe with the new column. 
     """
-    df['days_since_last_review'] = (datetime.now() - df['last_review']).dt.days
+    reference_date = pd.Timestamp(reference_date or config.REFERENCE_DATE)
+    df['days_since_last_review'] = (reference_date - df['last_review']).dt.days
     df.loc[df['last_review'] == pd.Timestamp('1900-01-01'), 'days_since_last_review'] = 10000000000 # set listings with no reviews to a large number
 
     return df 
 
 
-def distance_from_city_center(df): 
+@profiled(rows=0)
+def haversine_distances(lat, lon, anchor_lats, anchor_lons, block_size=1_000_000):
+    """
+    Computes the haversine distance (km) between every listing and every anchor point 
+    using whole lat/lon arrays instead of one row at a time.
+
+    Parameters
+    ----------
+    lat : array-like
+        The latitudes of the listings.
+    lon : array-like
+        The longitudes of the listings.
+    anchor_lats : array-like
+        The latitudes of the anchor points.
+    anchor_lons : array-like
+        The longitudes of the anchor points.
+    block_size : int, optional
+        The number of listings processed at once, to bound the size of the temporary arrays.
+
+    Returns
+    -------
+    np.ndarray
+        An array of shape (n_listings, n_anchors) with the distances in km. 
+    """
+    R = 6371
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    anchor_lats = np.asarray(anchor_lats, dtype=np.float64)[np.newaxis, :]
+    anchor_lons = np.asarray(anchor_lons, dtype=np.float64)[np.newaxis, :]
+    cos_anchor_lats = np.cos(np.radians(anchor_lats))
+
+    distances = np.empty((len(lat), anchor_lats.shape[1]), dtype=np.float64)
+    for start in range(0, len(lat), block_size):
+        lat1 = lat[start:start + block_size, np.newaxis]
+        lon1 = lon[start:start + block_size, np.newaxis]
+        dlat = np.radians(anchor_lats - lat1)
+        dlon = np.radians(anchor_lons - lon1)
+        a = np.sin(dlat / 2)**2 + np.cos(np.radians(lat1)) * cos_anchor_lats * np.sin(dlon / 2)**2
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        distances[start:start + block_size] = R * c
+    return distances
+
+def distance_from_city_center(df, center=config.CITY_CENTER, anchors=None): 
     """
     This function appends a new column distance_from_city_center' to the dataframe (df) 
     which provides a numeric value for the number of km  the listing is from the NYC center.
+    Distances to any additional anchor points are computed in the same pass and appended 
+    as 'distance_to_<name>' columns.
 
     Parameters
     ----------
     df : pandas.DataFrame
         The input dataframe. 
+    center : tuple, optional
+        The (latitude, longitude) of the city center (default is config.CITY_CENTER).
+    anchors : dict, optional
+        A mapping of anchor names to (latitude, longitude) tuples, e.g. config.NYC_ANCHORS.
 
     Returns
     -------
     pd.DataFrame
-        The dataframe with the new column. 
+        The dataframe with the new column(s). 
     """
-    # calculate distance from city center (using haversine formula)
-    nyc_center_lat = 40.7549
-    nyc_center_lon = -73.9845
-
-    def distance_from_city(lat1, lon1, lat2, lon2):
-        R = 6371
-        dlat = np.radians(lat2 - lat1)
-        dlon = np.radians(lon2 - lon1)
-        a = np.sin(dlat / 2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon / 2)**2
-        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-        return R * c
+    anchors = anchors or {}
+    names = ['distance_from_city_center'] + [f'distance_to_{name}' for name in anchors]
+    points = np.array([center] + list(anchors.values()), dtype=np.float64)
 
-    df['distance_from_city_center'] = df.apply(lambda row: distance_from_city(
-                row['latitude'], row['longitude'], nyc_center_lat, nyc_center_lon), axis=1)        
+    # calculate distances to all points at once (using haversine formula)
+    distances = haversine_distances(df['latitude'], df['longitude'], points[:, 0], points[:, 1])
+    for n, name in enumerate(names):
+        df[name] = distances[:, n]
     return df
 
-def main():
+@profiled(rows=0)
+def clean_listings(df):
     """
-    Main function to orchestrate cleaning the data and engineering new features. 
-    """
-    # CLEANING
-    df = pd.read_csv(config.RAW_DATA, encoding="utf-8")
+    Removes listings with a price of 0 and imputes the missing review values.
 
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The raw listings dataframe. 
+
+    Returns
+    -------
+    pd.DataFrame
+        The cleaned dataframe. 
+    """
     # Remove rows with price = 0 
     df = df[df['price'] != 0].copy()
 
-    # Impute values 
+    return impute_missing(df)
+
+def impute_missing(df):
+    """
+    Imputes the missing review values of listings with no reviews. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The listings dataframe. 
+
+    Returns
+    -------
+    pd.DataFrame
+        The dataframe with the imputed values. 
+    """
     df.loc[:, 'reviews_per_month'] = df['reviews_per_month'].fillna(0)
     df.loc[:, 'last_review'] = df['last_review'].fillna(pd.Timestamp('1900-01-01')) # to represent no previous reviews
     df['last_review'] = pd.to_datetime(df['last_review'], errors='coerce')
 
-    # FEATURE ENGINEERING
+    return df
+
+@profiled(rows=0)
+def engineer_features(df, reference_date=None, center=config.CITY_CENTER, anchors=config.DISTANCE_ANCHORS):
+    """
+    Appends all of the engineered features to the cleaned dataframe (df). 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The cleaned dataframe. 
+    reference_date : str or datetime, optional
+        The date used for 'days_since_last_review' (default is config.REFERENCE_DATE).
+    center : tuple, optional
+        The (latitude, longitude) of the city center (default is config.CITY_CENTER).
+    anchors : dict, optional
+        Additional anchor points to compute distances to (default is config.DISTANCE_ANCHORS).
+
+    Returns
+    -------
+    pd.DataFrame
+        The dataframe with the engineered features. 
+    """
     df = estimated_listed_months(df)
     df = availability_ratio(df)
-    df = days_since_last_review(df)
-    df = distance_from_city_center(df)
-    df.to_csv(config.FEAT_ENG_DATA, index=False)
+    df = days_since_last_review(df, reference_date)
+    df = distance_from_city_center(df, center=center, anchors=anchors)
+
+    return df
+
+@profiled
+def stream_clean_and_engineer(input_path, output_path, chunksize, reference_date=None):
+    """
+    Cleans the raw data and engineers the features one chunk of rows at a time, appending 
+    each chunk to the output file so memory use does not grow with the size of the input. 
+
+    Parameters
+    ----------
+    input_path : str
+        The path to the raw data.
+    output_path : str
+        The path where to save the feature engineered data.
+    chunksize : int
+        The number of raw rows read per chunk.
+    reference_date : str or datetime, optional
+        The date used for 'days_since_last_review' (default is config.REFERENCE_DATE).
+    """
+    chunks = load_frame(input_path, chunksize=chunksize)
+    with FrameWriter(output_path) as writer:
+        for chunk in chunks:
+            writer.write(engineer_features(clean_listings(chunk), reference_date))
+
+def content_hashes(df, reference_date=None):
+    """
+    Computes a hash of each cleaned listing's contents and of the settings the engineered 
+    features depend on, so a listing's cached features can be reused while its hash is unchanged. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The cleaned dataframe. 
+    reference_date : str or datetime, optional
+        The date used for 'days_since_last_review' (default is config.REFERENCE_DATE).
+
+    Returns
+    -------
+    pd.Series
+        The uint64 content hash of each listing. 
+    """
+    settings = repr((str(pd.Timestamp(reference_date or config.REFERENCE_DATE)), 
+                     config.CITY_CENTER, sorted(config.DISTANCE_ANCHORS.items())))
+    return pd.util.hash_pandas_object(df.assign(feature_settings=settings), index=False)
+
+@profiled
+def incremental_clean_and_engineer(input_path, output_path, cache_path, reference_date=None):
+    """
+    Cleans the raw data and engineers the features only for listings that are new or whose 
+    contents changed since the last run, reusing the cached features (keyed on 'id') for the rest. 
+
+    Parameters
+    ----------
+    input_path : str
+        The path to the raw data.
+    output_path : str
+        The path where to save the feature engineered data.
+    cache_path : str
+        The path of the per-listing content hash and feature cache.
+    reference_date : str or datetime, optional
+        The date used for 'days_since_last_review' (default is config.REFERENCE_DATE).
+    """
+    df = load_frame(input_path)
+    df = clean_listings(df)
+    hashes = content_hashes(df, reference_date)
+
+    # identify listings whose hash matches the cache
+    unchanged = pd.Series(False, index=df.index)
+    if os.path.isfile(cache_path):
+        cache = read_frame(cache_path).drop_duplicates('id', keep='last').set_index('id')
+        known = df['id'].isin(cache.index)
+        cached_hashes = cache.loc[df.loc[known, 'id'], 'content_hash'].to_numpy(dtype='uint64')
+        unchanged[known] = cached_hashes == hashes[known].to_numpy()
+
+    # compute features for new/changed listings only and merge with the cached ones
+    changed_df = engineer_features(df[~unchanged].copy(), reference_date)
+    feature_cols = [col for col in changed_df.columns if col not in df.columns]
+    if unchanged.any():
+        unchanged_df = df[unchanged].copy()
+        for col in feature_cols:
+            unchanged_df[col] = cache.loc[unchanged_df['id'], col].to_numpy(dtype=changed_df[col].dtype)
+        df = pd.concat([unchanged_df, changed_df]).sort_index()
+    else:
+        df = changed_df
+    print(f"Engineered features for {len(changed_df)} of {len(df)} listings")
+
+    write_frame(df, output_path)
+    write_frame(df[['id'] + feature_cols].assign(content_hash=hashes), cache_path)
+
+@profiled(report=True)
+def main(chunksize=config.CLEAN_CHUNKSIZE, incremental=config.INCREMENTAL_FEATURES):
+    """
+    Main function to orchestrate cleaning the data and engineering new features. 
+
+    Parameters
+    ----------
+    chunksize : int, optional
+        If set, the raw data is streamed in chunks of this many rows (default is config.CLEAN_CHUNKSIZE).
+    incremental : bool, optional
+        If True, features are only recomputed for new or changed listings (default is config.INCREMENTAL_FEATURES).
+    """
+    if incremental:
+        incremental_clean_and_engineer(config.RAW_DATA, config.FEAT_ENG_DATA, config.FEATURE_CACHE)
+        return
+
+    if chunksize:
+        stream_clean_and_engineer(config.RAW_DATA, config.FEAT_ENG_DATA, chunksize)
+        return
+
+    # CLEANING
+    df = load_frame(config.RAW_DATA)
+    df = clean_listings(df)
+
+    # FEATURE ENGINEERING
+    df = engineer_features(df)
+    write_frame(df, config.FEAT_ENG_DATA)
 
 if __name__ == "__main__":
     os.makedirs(config.DATA_OUTPUT_DIR, exist_ok=True)
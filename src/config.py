@@ -8,14 +8,62 @@ IMG_OUTPUT_DIR = os.path.join(ROOT_DIR, 'output', 'img')
 DATA_OUTPUT_DIR = os.path.join(ROOT_DIR, 'data', 'output')
 MODEL_OUTPUT_DIR = os.path.join(ROOT_DIR, 'output', 'models')
 RESULTS_OUTPUT_DIR = os.path.join(ROOT_DIR, 'output', 'results')
+BENCHMARK_OUTPUT_DIR = os.path.join(ROOT_DIR, 'output', 'benchmarks')
+PROFILE_OUTPUT_DIR = os.path.join(ROOT_DIR, 'output', 'profiles')
 
 # Data 
 RAW_DATA = os.path.join(ROOT_DIR, 'data', 'AB_NYC_2019.csv')
-FEAT_ENG_DATA = os.path.join(ROOT_DIR, 'data', 'output', 'feature_engineered.csv')
-X_TRAIN_DATA = os.path.join(ROOT_DIR, 'data', 'output', 'X_train.csv')
-Y_TRAIN_DATA = os.path.join(ROOT_DIR, 'data', 'output', 'y_train.csv')
-X_TEST_DATA = os.path.join(ROOT_DIR, 'data', 'output', 'X_test.csv')
-Y_TEST_DATA = os.path.join(ROOT_DIR, 'data', 'output', 'y_test.csv')
+DATA_FORMAT = 'parquet' # format of the data handed between stages: 'csv', 'parquet' or 'feather'
+FEAT_ENG_DATA = os.path.join(ROOT_DIR, 'data', 'output', f'feature_engineered.{DATA_FORMAT}')
+X_TRAIN_DATA = os.path.join(ROOT_DIR, 'data', 'output', f'X_train.{DATA_FORMAT}')
+Y_TRAIN_DATA = os.path.join(ROOT_DIR, 'data', 'output', f'y_train.{DATA_FORMAT}')
+X_TEST_DATA = os.path.join(ROOT_DIR, 'data', 'output', f'X_test.{DATA_FORMAT}')
+Y_TEST_DATA = os.path.join(ROOT_DIR, 'data', 'output', f'y_test.{DATA_FORMAT}')
+REPORT_MEMORY = False # set to print the memory use of every loaded dataframe
+EDA_AGGREGATE = False # set to aggregate the EDA chart data (histograms, quantiles, densities, 2-D bins) in pandas, so chart size does not grow with the listings (the charts differ slightly from the committed ones)
+EDA_SAMPLE_ROWS = 2000 # listings drawn (stratified on the room type) for the point marks of the aggregated EDA charts, 0 for none
+CORR_CHUNKSIZE = None # rows per chunk; set to stream the data through the correlation engine (src/correlations.py) in bounded memory
+CORR_CACHE_DIR = os.path.join(ROOT_DIR, 'data', 'cache', 'correlations') # correlation statistics, reused while the data file is unchanged
+RENDER_CACHE_DIR = os.path.join(ROOT_DIR, 'data', 'cache', 'render') # fingerprints of the saved charts, unchanged charts are not rendered again
+SPLIT_MODE = 'random' # 'random' (train_test_split) or 'hash' (stable, streamed split on the listing id)
+SPLIT_CHUNKSIZE = 100_000 # rows per chunk for the 'hash' split
+CLEAN_CHUNKSIZE = None # rows per chunk; set to stream the raw data through clean_and_engineer in bounded memory
+INCREMENTAL_FEATURES = False # set to only recompute features for new or changed listings
+FEATURE_CACHE = os.path.join(ROOT_DIR, 'data', 'output', f'feature_cache.{DATA_FORMAT}')
+REFERENCE_DATE = '2019-07-08' # 'days_since_last_review' is counted up to this date (last review in AB_NYC_2019)
+RAW_CITY_DATA = os.path.join(ROOT_DIR, 'data', 'cities', '*.csv') # directory or glob of raw listings, one file per city
+CITY_FEAT_ENG_DIR = os.path.join(ROOT_DIR, 'data', 'output', 'feature_engineered_by_city')
+N_JOBS = -1 # number of worker processes, -1 uses all cores
+TRANSFORMER_CACHE = True # cache fitted transformers on disk, shared by the model scripts
+TRANSFORMER_CACHE_DIR = os.path.join(ROOT_DIR, 'data', 'cache', 'transformers')
+TRANSFORMER_CACHE_BYTES = '2G' # least recently used entries are evicted above this size
+SHAP_CACHE_DIR = os.path.join(ROOT_DIR, 'data', 'cache', 'shap') # SHAP values of the RFECV model, reused while the model and test set are unchanged
+SHAP_MAX_ROWS = None # set to explain a sample of at most this many test listings, stratified on the price
+SHAP_CHUNKSIZE = 2000 # test listings explained per worker task
+SHAP_SEED = 123
+SPATIAL_FEATURES = False # set to add k-nearest-neighbour price/density features to the preprocessor
+MODEL_FORMAT = 'artifact' # format of the saved models: 'joblib' (pickle) or 'artifact' (memory-mapped arrays and native boosters)
+MODEL_COMPRESS = True # zlib-compress the model structure and boosters of artifacts (arrays stay uncompressed for memory mapping)
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8000
+SERVE_MAX_BATCH = 256 # most listings predicted together in one micro-batch
+SERVE_MAX_WAIT_MS = 5 # longest a request waits for other requests to join its micro-batch
+EXPLAIN_TOP_K = 5 # price drivers returned per listing by src.explain
+COMPILED_PREDICTOR = True # serve the RFECV model compiled into NumPy lookup tables (src/models/compiled.py) instead of the sklearn pipeline
+FAST_RFECV = True # set to False to select features with sklearn's RFECV instead of the Gram-matrix implementation
+RFECV_STEP = 1 # number (>= 1) or share (< 1) of features removed at each RFECV iteration
+TREE_CATEGORICAL = False # set to pass categoricals (incl. neighbourhood) to XGBoost/LGBM as native categorical codes
+SEARCH_MODE = 'random' # 'random' for full-budget random search, 'halving' for successive halving with early stopping
+EARLY_STOPPING_ROUNDS = 20 # boosting rounds without improvement before XGBoost/LGBM stop in halving mode
+EARLY_STOPPING_FRACTION = 0.1 # share of each training fold held out to monitor early stopping
+BOOTSTRAP_RESAMPLES = 2000 # bootstrap resamples of the test set for the confidence intervals of src.evaluate
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 123
+BOOTSTRAP_BLOCK_BYTES = 256 * 2**20 # memory budget of the resampled indices and counts of each bootstrap task (fewer resamples per task for large test sets)
+BENCHMARK_REPEATS = 3 # timed runs of each stage in src.benchmarks.suite, the median is reported
+BENCHMARK_TOLERANCE = 0.2 # slowdown or memory growth over the baseline flagged as a regression
+PROFILE_ENV = 'AIRBNB_PROFILE' # set this environment variable to 1 (or an output directory) to record stage profiles, see src/profiling.py
+PROFILE_RUN_ENV = 'AIRBNB_PROFILE_RUN' # id of the profiled run, inherited by its child processes; the traces of each run are kept in their own directory
 
 # Images
 CAT_BAR_PATH = os.path.join(IMG_OUTPUT_DIR, "categorical_barcharts.png")
@@ -30,9 +78,10 @@ SHAP_LESS_PATH = os.path.join(IMG_OUTPUT_DIR, 'shap_less_plot.png')
 SHAP_GR_PATH = os.path.join(IMG_OUTPUT_DIR, 'shap_gr_plot.png')
 
 # Models 
-RFECV_PATH = os.path.join(MODEL_OUTPUT_DIR, 'model_rfecv.joblib')
-DUMMY_PATH = os.path.join(MODEL_OUTPUT_DIR, 'model_dummy.joblib')
-LINEAR_PATH = os.path.join(MODEL_OUTPUT_DIR, 'model_linear.joblib')
+RFECV_PATH = os.path.join(MODEL_OUTPUT_DIR, f'model_rfecv.{MODEL_FORMAT}')
+DUMMY_PATH = os.path.join(MODEL_OUTPUT_DIR, f'model_dummy.{MODEL_FORMAT}')
+LINEAR_PATH = os.path.join(MODEL_OUTPUT_DIR, f'model_linear.{MODEL_FORMAT}')
+EVAL_MODELS = {'RFECV': RFECV_PATH, 'Dummy': DUMMY_PATH, 'Linear': LINEAR_PATH} # models scored by src.evaluate, by report name
 
 # Results
 CV_RFECV_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'cv_results_RFECV.joblib') 
@@ -47,4 +96,30 @@ CV_LGBM_TUNED_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'cv_results_lgbm_tuned.job
 FEAT_IMP_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'feat_imp_rfecv.csv') 
 SELECTED_FEAT_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'selected_feat.joblib') 
 FINAL_R2_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'final_r2.npy') 
-MAE_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'mae_comparison.csv')
\ No newline at end of file
+MAE_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'mae_comparison.csv')
+EVAL_REPORT_PATH = os.path.join(RESULTS_OUTPUT_DIR, 'evaluation_report.csv')
+
+# Geography (latitude, longitude)
+CITY_CENTER = (40.7549, -73.9845) # Midtown Manhattan
+NYC_ANCHORS = {
+    'jfk_airport': (40.6413, -73.7781),
+    'lga_airport': (40.7769, -73.8740),
+    'ewr_airport': (40.6895, -74.1745),
+    'grand_central': (40.7527, -73.9772),
+    'penn_station': (40.7506, -73.9935),
+    'atlantic_terminal': (40.6844, -73.9778),
+}
+DISTANCE_ANCHORS = {} # set to NYC_ANCHORS to add a distance_to_<name> column per anchor
+CITY_CENTERS = { # keyed by the city name in the raw file name, e.g. AB_NYC_2019.csv -> 'nyc'
+    'nyc': CITY_CENTER,
+    'boston': (42.3555, -71.0605),
+    'chicago': (41.8827, -87.6233),
+    'los_angeles': (34.0522, -118.2437),
+    'san_francisco': (37.7880, -122.4075),
+    'seattle': (47.6097, -122.3331),
+    'london': (51.5080, -0.1281),
+    'paris': (48.8566, 2.3522),
+}
+CITY_REFERENCE_DATES = { # the scrape date of each city's export, other cities use their latest review
+    'nyc': REFERENCE_DATE,
+}
@@ -0,0 +1,440 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from src import config
+from src.profiling import profiled
+from src.storage import load_frame, file_hash
+
+METHODS = ('pearson', 'spearman')
+CACHE_VERSION = 2 # cached statistics of other versions are recomputed
+
+# Statistics computed by this process, by source hash and columns
+MEMO = {}
+
+def value_counts(chunks, columns):
+    """
+    Counts the distinct non-missing values of each column over chunks of rows and, for the
+    pairs of columns of which at least one has missing values, of both columns over the
+    rows where both are present (the pair's complete rows, which pandas ranks the pair on).
+
+    A pair is tracked from the first chunk with a missing value in one of its columns; both
+    were complete in the earlier chunks, so its counts start from the counts of the columns.
+
+    Parameters
+    ----------
+    chunks : iterable of pd.DataFrame
+        The chunks of rows.
+    columns : list
+        The columns to count.
+
+    Returns
+    -------
+    tuple
+        The counts of each column, and the counts of both columns of each tracked pair
+        (i, j) of column positions, as pd.Series indexed by the sorted values.
+    """
+    counts = {col: pd.Series(dtype=np.float64) for col in columns}
+    pair_counts = {}
+    for chunk in chunks:
+        present = chunk[columns].notna().to_numpy()
+        for j in np.flatnonzero(~present.all(axis=0)):
+            for i in range(len(columns)):
+                pair = (min(i, j), max(i, j))
+                if i != j and pair not in pair_counts:
+                    pair_counts[pair] = [counts[columns[pair[0]]].copy(), counts[columns[pair[1]]].copy()]
+        for (i, j), pair_count in pair_counts.items():
+            both = present[:, i] & present[:, j]
+            for side, col in enumerate((columns[i], columns[j])):
+                pair_count[side] = pair_count[side].add(chunk[col][both].value_counts(), fill_value=0)
+        for col in columns:
+            counts[col] = counts[col].add(chunk[col].value_counts(), fill_value=0)
+    return ({col: count.sort_index() for col, count in counts.items()},
+            {pair: [count.sort_index() for count in pair_count] for pair, pair_count in pair_counts.items()})
+
+def rank_table(count):
+    """
+    Computes the average rank of each distinct value of a column, as pandas' rank(), from
+    its counts: the values tied at ranks a..b all get (a + b) / 2.
+
+    Parameters
+    ----------
+    count : pd.Series
+        The counts, indexed by the sorted values.
+
+    Returns
+    -------
+    tuple
+        The sorted values and their average ranks, as np.ndarray.
+    """
+    counts = count.to_numpy(dtype=np.float64)
+    ends = np.cumsum(counts)
+    return count.index.to_numpy(dtype=np.float64), ends - (counts - 1) / 2
+
+def to_ranks(values, table):
+    """
+    Replaces values by their ranks in a rank table, missing values stay NaN.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values of a column.
+    table : tuple
+        The sorted values and their ranks (see rank_table).
+
+    Returns
+    -------
+    np.ndarray
+        The ranks.
+    """
+    sorted_values, ranks = table
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return np.where(np.isnan(values), np.nan, ranks[positions])
+
+class CorrelationStats:
+    """
+    The sufficient statistics of the Pearson correlations of the columns and of their ranks
+    (Spearman), over the pairwise complete rows as in pd.DataFrame.corr, accumulated chunk
+    by chunk. The missing value masks are shared by the values and the ranks, so both
+    methods come from the same matrix products.
+
+    The ranks are those of each column among all its non-missing values, which gives
+    pandas' Spearman correlations for the pairs of complete columns. For a pair with missing
+    values pandas ranks both columns on the pair's complete rows instead, so the sums of
+    these pair ranks are accumulated separately for those (few) pairs (see update_pairs).
+
+    Parameters
+    ----------
+    columns : list
+        The column names.
+    shift : np.ndarray
+        The (2, n_columns) values subtracted from the values and ranks before they are
+        accumulated, near their means, for numerical stability.
+    """
+    def __init__(self, columns, shift):
+        k = len(columns)
+        self.columns = list(columns)
+        self.shift = np.asarray(shift, dtype=np.float64)
+        self.count = np.zeros((k, k)) # rows where both columns are present
+        self.sums = np.zeros((2, k, k)) # [m, i, j]: sum of column i where column j is present
+        self.squares = np.zeros((2, k, k))
+        self.products = np.zeros((2, k, k))
+        self.pairs = np.zeros((0, 2), dtype=np.int64) # column positions of the pairs ranked on their complete rows
+        self.pair_shift = np.zeros(0) # near the mean rank of each pair
+        self.pair_sums = np.zeros((0, 6)) # n, sums of the ranks of both columns, of their squares and products
+
+    def update(self, values, ranks):
+        """
+        Adds a chunk of rows.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            The (n_rows, n_columns) values, NaN where missing.
+        ranks : np.ndarray
+            The ranks of the values (see to_ranks).
+        """
+        present = ~np.isnan(values)
+        mask = present.astype(np.float64)
+        data = np.stack([values, ranks]) - self.shift[:, None, :]
+        data[:, ~present] = 0.0
+        data_t = data.transpose(0, 2, 1)
+        self.count += mask.T @ mask
+        self.sums += data_t @ mask
+        self.squares += (data_t * data_t) @ mask
+        self.products += data_t @ data
+
+    def update_pairs(self, values, tables):
+        """
+        Adds a chunk of rows to the statistics of the pairs ranked on their complete rows.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            The (n_rows, n_columns) values, NaN where missing.
+        tables : list
+            The rank tables of both columns of each pair (see rank_table).
+        """
+        for p, ((i, j), (table_i, table_j)) in enumerate(zip(self.pairs, tables)):
+            both = ~np.isnan(values[:, i]) & ~np.isnan(values[:, j])
+            x = to_ranks(values[both, i], table_i) - self.pair_shift[p]
+            y = to_ranks(values[both, j], table_j) - self.pair_shift[p]
+            self.pair_sums[p] += [len(x), x.sum(), y.sum(), x @ x, y @ y, x @ y]
+
+    def correlation(self, method='pearson'):
+        """
+        Computes the correlation matrix.
+
+        Parameters
+        ----------
+        method : str, optional
+            'pearson' or 'spearman' (default is 'pearson').
+
+        Returns
+        -------
+        pd.DataFrame
+            The correlations, NaN where a column of the pair is constant over their complete rows.
+        """
+        m = METHODS.index(method)
+        n = np.where(self.count > 0, self.count, np.nan)
+        sums, squares = self.sums[m], self.squares[m]
+        covariance = self.products[m] - sums * sums.T / n
+        variance = squares - sums ** 2 / n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = covariance / np.sqrt(variance * variance.T)
+        corr[(variance <= 0) | (variance.T <= 0)] = np.nan
+        if method == 'spearman' and len(self.pairs):
+            n, sx, sy, sxx, syy, sxy = (self.pair_sums[:, c] for c in range(6))
+            n = np.where(n > 0, n, np.nan)
+            vx, vy = sxx - sx ** 2 / n, syy - sy ** 2 / n
+            with np.errstate(invalid='ignore', divide='ignore'):
+                pair_corr = np.where((vx > 0) & (vy > 0), (sxy - sx * sy / n) / np.sqrt(vx * vy), np.nan)
+            corr[self.pairs[:, 0], self.pairs[:, 1]] = pair_corr
+            corr[self.pairs[:, 1], self.pairs[:, 0]] = pair_corr
+        corr = np.clip(corr, -1.0, 1.0)
+        diagonal = np.diag_indices_from(corr)
+        corr[diagonal] = np.where(np.isnan(corr[diagonal]), np.nan, 1.0)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def subset(self, columns):
+        """
+        Returns the statistics of some of the columns.
+        """
+        idx = [self.columns.index(col) for col in columns]
+        stats = CorrelationStats(columns, self.shift[:, idx])
+        stats.count = self.count[np.ix_(idx, idx)]
+        stats.sums, stats.squares, stats.products = (a[:, idx][:, :, idx] for a in (self.sums, self.squares, self.products))
+        position = {old: new for new, old in enumerate(idx)}
+        kept = [p for p, (i, j) in enumerate(self.pairs) if i in position and j in position]
+        stats.pairs = np.array([[position[i], position[j]] for i, j in self.pairs[kept]], dtype=np.int64).reshape(-1, 2)
+        stats.pair_shift, stats.pair_sums = self.pair_shift[kept], self.pair_sums[kept]
+        return stats
+
+    def save(self, path):
+        """
+        Saves the statistics to an .npz file.
+        """
+        np.savez(path, columns=np.array(self.columns), shift=self.shift, count=self.count,
+                 sums=self.sums, squares=self.squares, products=self.products,
+                 pairs=self.pairs, pair_shift=self.pair_shift, pair_sums=self.pair_sums)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads statistics saved with save.
+        """
+        with np.load(path) as saved:
+            stats = cls(saved['columns'].tolist(), saved['shift'])
+            stats.count, stats.sums, stats.squares, stats.products = (saved[a] for a in ('count', 'sums', 'squares', 'products'))
+            stats.pairs, stats.pair_shift, stats.pair_sums = (saved[a] for a in ('pairs', 'pair_shift', 'pair_sums'))
+        return stats
+
+def numeric_columns(df, exclude=None):
+    """
+    Returns the numeric columns of a dataframe, except those in exclude.
+    """
+    return [col for col in df.select_dtypes(include='number').columns if col not in (exclude or [])]
+
+def numeric_values(chunk, columns):
+    """
+    Returns the columns of a chunk as a float64 array, NaN where missing.
+    """
+    return np.column_stack([chunk[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in columns])
+
+@profiled
+def accumulate(chunks, columns):
+    """
+    Computes the correlation statistics of columns in two passes over chunks of rows: the
+    first counts the distinct values of each column (and of the pairs with missing values),
+    from which the ranks are derived once, and the second accumulates the statistics of the
+    values and ranks.
+
+    Parameters
+    ----------
+    chunks : callable
+        Returns a new iterable of the chunks (pd.DataFrame) at each call.
+    columns : list
+        The numeric columns.
+
+    Returns
+    -------
+    CorrelationStats
+        The statistics.
+    """
+    counts, pair_counts = value_counts(chunks(), columns)
+    tables = [rank_table(counts[col]) for col in columns]
+    totals = np.array([counts[col].sum() for col in columns])
+    means = [np.dot(counts[col].index.to_numpy(dtype=np.float64), counts[col].to_numpy()) / max(total, 1)
+             for col, total in zip(columns, totals)]
+    stats = CorrelationStats(columns, [means, (totals + 1) / 2])
+    stats.pairs = np.array(sorted(pair_counts), dtype=np.int64).reshape(-1, 2)
+    stats.pair_shift = np.array([(pair_counts[tuple(pair)][0].sum() + 1) / 2 for pair in stats.pairs])
+    stats.pair_sums = np.zeros((len(stats.pairs), 6))
+    pair_tables = [[rank_table(count) for count in pair_counts[tuple(pair)]] for pair in stats.pairs]
+    for chunk in chunks():
+        values = numeric_values(chunk, columns)
+        ranks = np.column_stack([to_ranks(values[:, i], table) for i, table in enumerate(tables)])
+        stats.update(values, ranks)
+        stats.update_pairs(values, pair_tables)
+    return stats
+
+def frame_statistics(df, chunksize=config.CORR_CHUNKSIZE):
+    """
+    Computes the correlation statistics of the columns of a dataframe in memory.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The numeric columns.
+    chunksize : int, optional
+        The number of rows per matrix product, to bound the temporary arrays, None for all
+        rows at once (default is config.CORR_CHUNKSIZE).
+
+    Returns
+    -------
+    CorrelationStats
+        The statistics.
+    """
+    step = chunksize or max(len(df), 1)
+    return accumulate(lambda: (df.iloc[start:start + step] for start in range(0, len(df), step)), list(df.columns))
+
+def file_statistics(path, columns, chunksize=config.CORR_CHUNKSIZE):
+    """
+    Computes the correlation statistics of columns of a data file, streamed in chunks of
+    rows if chunksize is set, so files larger than memory can be summarised.
+
+    Parameters
+    ----------
+    path : str
+        The path ending in .csv, .parquet or .feather.
+    columns : list
+        The numeric columns.
+    chunksize : int, optional
+        The number of rows per chunk, None to load the columns at once (default is config.CORR_CHUNKSIZE).
+
+    Returns
+    -------
+    CorrelationStats
+        The statistics.
+    """
+    if chunksize is None:
+        return frame_statistics(load_frame(path, columns=columns), chunksize)
+    return accumulate(lambda: load_frame(path, columns=columns, chunksize=chunksize), columns)
+
+def cached_statistics(path, columns, df=None, chunksize=config.CORR_CHUNKSIZE, cache_dir=config.CORR_CACHE_DIR):
+    """
+    Returns the correlation statistics of columns of a data file, from the statistics cached
+    for the same file contents and any superset of the columns, otherwise computes and caches
+    them. The statistics are also kept in memory for the rest of the process.
+
+    Parameters
+    ----------
+    path : str
+        The data file, whose hash identifies the cached statistics.
+    columns : list
+        The numeric columns.
+    df : pandas.DataFrame, optional
+        The file's data if already loaded, used instead of reading the file.
+    chunksize : int, optional
+        The number of rows per chunk (default is config.CORR_CHUNKSIZE).
+    cache_dir : str, optional
+        The cache directory (default is config.CORR_CACHE_DIR).
+
+    Returns
+    -------
+    CorrelationStats
+        The statistics.
+    """
+    source = file_hash(path)
+    for (memo_source, memo_columns), stats in MEMO.items():
+        if memo_source == source and set(columns) <= set(memo_columns):
+            return stats.subset(columns)
+
+    # the metadata is written last, so an interrupted write is never used
+    for meta_path in glob.glob(os.path.join(cache_dir, '*.json')):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') == CACHE_VERSION and meta['source'] == source and set(columns) <= set(meta['columns']):
+            stats = CorrelationStats.load(meta_path[:-len('.json')] + '.npz')
+            MEMO[(source, tuple(stats.columns))] = stats
+            print(f"Using the cached correlation statistics in {meta_path[:-len('.json')]}.npz")
+            return stats.subset(columns)
+
+    if df is not None:
+        stats = frame_statistics(df[columns], chunksize)
+    else:
+        stats = file_statistics(path, columns, chunksize)
+    MEMO[(source, tuple(columns))] = stats
+
+    key = hashlib.sha256(json.dumps([source, list(columns)]).encode()).hexdigest()[:16]
+    os.makedirs(cache_dir, exist_ok=True)
+    stats.save(os.path.join(cache_dir, f'{key}.npz'))
+    with open(os.path.join(cache_dir, f'{key}.json'), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'source': source, 'path': os.path.relpath(path, config.ROOT_DIR), 'columns': list(columns)}, f, indent=2)
+    return stats
+
+def correlation_matrices(path, columns, df=None, chunksize=config.CORR_CHUNKSIZE):
+    """
+    Computes the Pearson and Spearman correlation matrices of columns of a data file in one
+    pass, reusing the cached statistics (see cached_statistics).
+
+    Parameters
+    ----------
+    path : str
+        The data file.
+    columns : list
+        The numeric columns.
+    df : pandas.DataFrame, optional
+        The file's data if already loaded.
+    chunksize : int, optional
+        The number of rows per chunk (default is config.CORR_CHUNKSIZE).
+
+    Returns
+    -------
+    dict
+        The correlation matrix (pd.DataFrame) of each method.
+    """
+    stats = cached_statistics(path, columns, df, chunksize)
+    return {method: stats.correlation(method) for method in METHODS}
+
+def main(path=config.RAW_DATA, chunksize=config.CORR_CHUNKSIZE):
+    """
+    Main function to check the correlation engine against pandas on a data file and time both.
+
+    Parameters
+    ----------
+    path : str, optional
+        The data file (default is config.RAW_DATA).
+    chunksize : int, optional
+        The number of rows per chunk of the engine (default is config.CORR_CHUNKSIZE).
+    """
+    # Check file exists
+    if not os.path.isfile(path):
+        print(f"Error no file: {path} ")
+        return  # exit function
+
+    df = load_frame(path)
+    columns = numeric_columns(df, exclude=['id', 'host_id'])
+    start = time.perf_counter()
+    expected = {method: df[columns].corr(method=method) for method in METHODS}
+    pandas_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = frame_statistics(df[columns], chunksize)
+    engine = {method: stats.correlation(method) for method in METHODS}
+    engine_time = time.perf_counter() - start
+    for method in METHODS:
+        difference = (engine[method] - expected[method]).abs().max().max()
+        print(f"{method}: largest difference to pandas {difference:.3g}")
+    print(f"Both methods for {len(df):,} rows: pandas {pandas_time:.3f} s, engine {engine_time:.3f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the correlation engine against pandas.")
+    parser.add_argument('path', nargs='?', default=config.RAW_DATA)
+    parser.add_argument('--chunksize', type=int, default=config.CORR_CHUNKSIZE, help="rows per chunk")
+    args = parser.parse_args()
+    main(args.path, args.chunksize)
@@ -1,14 +1,165 @@
 import pandas as pd
+import numpy as np
 import altair as alt
 import altair_ally as aly
 import vegafusion
 import os 
 from src import config
+from src.profiling import profiled
+from src.storage import load_frame
+from src.correlations import correlation_matrices, numeric_columns
+from src.render import render_charts
 
 alt.data_transformers.enable("vegafusion")
 aly.alt.data_transformers.enable('vegafusion')
 
-def cat_distributions(df, columns, titles):
+def stratified_sample(df, by, n_rows, seed=123):
+    """
+    Draws about n_rows rows of the dataframe (df), the same share from each group, for the
+    point marks of the aggregated charts.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataset.
+    by : str
+        The column defining the groups.
+    n_rows : int
+        The number of rows to draw, 0 for none.
+    seed : int, optional
+        The random seed (default is 123).
+
+    Returns
+    -------
+    pandas.DataFrame
+        The sample.
+    """
+    if n_rows >= len(df):
+        return df
+    return df.groupby(by, observed=True, group_keys=False).sample(frac=n_rows / len(df), random_state=seed)
+
+def histogram_table(values, bins=30, value_range=None):
+    """
+    Counts the values in bins with NumPy.
+
+    Parameters
+    ----------
+    values : pandas.Series or np.ndarray
+        The values, missing values are ignored.
+    bins : int or np.ndarray, optional
+        The number of equal-width bins or the bin edges (default is 30).
+    value_range : tuple, optional
+        The range of the bins (default is the range of the values).
+
+    Returns
+    -------
+    pandas.DataFrame
+        The bin_start, bin_end and count of each bin.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    counts, edges = np.histogram(values[~np.isnan(values)], bins=bins, range=value_range)
+    return pd.DataFrame({'bin_start': edges[:-1], 'bin_end': edges[1:], 'count': counts})
+
+def density_table(values, steps=200, fine_bins=4096):
+    """
+    Estimates the density of the values with a Gaussian kernel and the bandwidth of Vega's
+    density transform (Scott's rule), over the range of the values. The values are first
+    counted in fine bins and the counts convolved with the kernel, so the cost does not
+    depend on the kernel evaluations per value.
+
+    Parameters
+    ----------
+    values : pandas.Series or np.ndarray
+        The values, missing values are ignored.
+    steps : int, optional
+        The number of points the density is given at (default is 200).
+    fine_bins : int, optional
+        The number of bins the values are counted in (default is 4096).
+
+    Returns
+    -------
+    pandas.DataFrame
+        The value and density of each point.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    low, high = values.min(), values.max()
+    q1, q3 = np.percentile(values, [25, 75])
+    spread = min(values.std(ddof=1), (q3 - q1) / 1.34) or values.std(ddof=1)
+    bandwidth = 1.06 * spread * len(values) ** -0.2
+    grid = np.linspace(low, high, steps)
+    if high == low or bandwidth == 0:
+        return pd.DataFrame({'value': grid, 'density': np.zeros(steps)})
+
+    counts, edges = np.histogram(values, bins=fine_bins, range=(low, high))
+    width = edges[1] - edges[0]
+    reach = min(int(np.ceil(4 * bandwidth / width)), fine_bins - 1)
+    kernel = np.exp(-0.5 * (np.arange(-reach, reach + 1) * width / bandwidth) ** 2) / (np.sqrt(2 * np.pi) * bandwidth)
+    density = np.convolve(counts, kernel)[reach:reach + fine_bins] / len(values)
+    centers = (edges[:-1] + edges[1:]) / 2
+    return pd.DataFrame({'value': grid, 'density': np.interp(grid, centers, density)})
+
+def box_table(df, value, group=None, max_outliers=50, seed=123):
+    """
+    Computes box plot statistics as Vega-Lite's boxplot: the quartiles, whiskers at the
+    furthest values within 1.5 IQR of the box, and the outliers beyond them, of which at
+    most max_outliers per group are kept (always including the extremes).
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataset.
+    value : str
+        The column to summarise.
+    group : str, optional
+        The column to group by (default is no grouping).
+    max_outliers : int, optional
+        The most outliers kept per group (default is 50).
+    seed : int, optional
+        The random seed of the kept outliers (default is 123).
+
+    Returns
+    -------
+    tuple
+        The statistics (lower, q1, median, q3, upper and count) of each group and the kept outliers.
+    """
+    rng = np.random.default_rng(seed)
+    groups = df.groupby(group, observed=True)[value] if group else [(None, df[value])]
+    stats, outliers = [], []
+    for key, values in groups:
+        values = values.dropna().to_numpy(dtype=np.float64)
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        inside = values[(values >= low) & (values <= high)]
+        stats.append({'lower': inside.min(), 'q1': q1, 'median': median, 'q3': q3, 'upper': inside.max(), 'count': len(values)})
+        outside = values[(values < low) | (values > high)]
+        if len(outside) > max_outliers:
+            outside = np.concatenate([[outside.min(), outside.max()], rng.choice(outside, max_outliers - 2, replace=False)])
+        outliers.append(pd.DataFrame({value: outside}))
+        if group:
+            stats[-1][group] = key
+            outliers[-1][group] = key
+    return pd.DataFrame(stats), pd.concat(outliers, ignore_index=True)
+
+def box_chart(stats, outliers, value, title, group=None, group_title=None):
+    """
+    Draws a box plot from the output of box_table.
+
+    Returns
+    -------
+    alt.LayerChart
+        The whiskers, boxes, medians and outliers.
+    """
+    y = {'y': alt.Y(f'{group}:N', title=group_title)} if group else {}
+    base = alt.Chart(stats)
+    whiskers = base.mark_rule().encode(x=alt.X('lower:Q', title=title), x2='upper:Q', **y)
+    boxes = base.mark_bar(size=14).encode(x='q1:Q', x2='q3:Q', tooltip=['median:Q', 'count:Q'], **y)
+    medians = base.mark_tick(color='white', size=14).encode(x='median:Q', **y)
+    points = alt.Chart(outliers).mark_point(size=15).encode(x=f'{value}:Q', **y)
+    return alt.layer(whiskers, boxes, medians, points)
+
+@profiled(rows=0)
+def cat_distributions(df, columns, titles, aggregate=config.EDA_AGGREGATE):
     """
     Creates bar plots for given columns in the DataFrame (df).
 
@@ -20,6 +171,8 @@ def cat_distributions(df, columns, titles):
         A list of columns in df to plot distributions for.
     titles : list
         A list of names corresponding to the columns list, to display on plot title. 
+    aggregate : bool, optional
+        If True, the counts are computed in pandas (default is config.EDA_AGGREGATE).
 
     Returns
     -------
@@ -28,9 +181,13 @@ def cat_distributions(df, columns, titles):
     """
     categ_dist_plot = []
     for n, col in enumerate(columns):
-        categ_cols_dist = alt.Chart(df, title = f'{titles[n]} Distribution').mark_bar().encode(
+        if aggregate:
+            source, count = df[col].value_counts().rename_axis(col).reset_index(name='count'), alt.X('count:Q', title='Count of Records')
+        else:
+            source, count = df, 'count()'
+        categ_cols_dist = alt.Chart(source, title = f'{titles[n]} Distribution').mark_bar().encode(
             y = alt.Y(col,type='nominal', title=titles[n]),
-            x ='count()',
+            x = count,
         ).properties(
             width = 400,
             height = 200
@@ -40,7 +197,8 @@ def cat_distributions(df, columns, titles):
     combined_plot = alt.hconcat(*categ_dist_plot)
     return combined_plot
 
-def num_distributions(df, exclude_col=None):
+@profiled(rows=0)
+def num_distributions(df, exclude_col=None, aggregate=config.EDA_AGGREGATE, sample_rows=config.EDA_SAMPLE_ROWS):
     """
     Creates density plots for the numeric columns in the dataframe (df), except for columns specified, if any.
 
@@ -50,6 +208,11 @@ def num_distributions(df, exclude_col=None):
         The dataset containing the columns to plot.
     exclude_col : list, optional
         A list of columns to not include in the plots.
+    aggregate : bool, optional
+        If True, the densities are estimated with density_table and the rug shows a
+        stratified sample of the listings, as in aly.dist otherwise (default is config.EDA_AGGREGATE).
+    sample_rows : int, optional
+        The number of listings in the rugs of the aggregated plots (default is config.EDA_SAMPLE_ROWS).
 
     Returns
     -------
@@ -57,12 +220,31 @@ def num_distributions(df, exclude_col=None):
         The combined density plots for the numeric columns. 
     """
     df_numeric_feat = df.select_dtypes(include='number').drop(columns=exclude_col)
-    num_dist_plot = aly.dist(df_numeric_feat).properties(
+    if not aggregate:
+        num_dist_plot = aly.dist(df_numeric_feat).properties(
+            title="Distributions of Numerical Features"
+        )
+        return num_dist_plot
+
+    # laid out as aly.dist: a square grid of density plots with rugs, in reverse column order
+    sample = stratified_sample(df, 'room_type', sample_rows)
+    columns = df_numeric_feat.columns.tolist()[::-1]
+    n_columns = len(columns) if len(columns) <= 3 else int(np.ceil(np.sqrt(len(columns))))
+    plots = []
+    for col in columns:
+        density = alt.Chart(density_table(df_numeric_feat[col])).mark_area(opacity=0.9).encode(
+            x=alt.X('value:Q', title=col, axis=alt.Axis(grid=False)),
+            y=alt.Y('density:Q', title=None)
+        ).properties(width=185, height=120)
+        rug = alt.Chart(sample[[col]]).mark_tick(color='black', opacity=0.3, yOffset=57, height=7).encode(x=f'{col}:Q')
+        plots.append(density + rug)
+    num_dist_plot = alt.concat(*plots, columns=n_columns).properties(
         title="Distributions of Numerical Features"
     )
     return num_dist_plot
 
-def target_distribution(df): 
+@profiled(rows=0)
+def target_distribution(df, aggregate=config.EDA_AGGREGATE): 
     """
     Creates a histrogram and box plot for the target variable in the dataframe (df). 
 
@@ -70,12 +252,33 @@ def target_distribution(df):
     ----------
     df : pandas.DataFrame
         The dataset containing the target variable 'price'.
+    aggregate : bool, optional
+        If True, the histogram and box plot statistics are computed in NumPy (default is config.EDA_AGGREGATE).
        
     Returns
     -------
     alt.Chart 
         The combined plots for the distribution of the target variable. 
     """
+    if aggregate:
+        # the bins of alt.Bin(step=70), which start at 0
+        prices = df.loc[df['price'] <= 4000, 'price']
+        histogram = alt.Chart(histogram_table(prices, bins=np.arange(0, prices.max() + 70, 70))).mark_bar().encode(
+            x=alt.X('bin_start:Q', bin='binned', scale=alt.Scale(domain=(1, 4000)), title='Price ($/night)'),
+            x2='bin_end:Q',
+            y=alt.Y('count:Q', title='Count of Records'),
+        ).properties(
+            title='Distribution of Listing Prices', 
+            width=400, 
+            height=250
+        )
+        price_box_plot = box_chart(*box_table(df, 'price'), 'price', 'Price ($/night)').properties(
+            title="Box Plot for Listing Prices", 
+            width=400,
+            height=250
+        )
+        return alt.hconcat(histogram, price_box_plot)
+
     df_filtered = df[df['price'] <= 4000]
 
     histogram = alt.Chart(df_filtered).mark_bar().encode(
@@ -99,7 +302,8 @@ def target_distribution(df):
     combined_plot = alt.hconcat(histogram, price_box_plot)
     return combined_plot
 
-def target_dist_grouped(df):
+@profiled(rows=0)
+def target_dist_grouped(df, aggregate=config.EDA_AGGREGATE, sample_rows=config.EDA_SAMPLE_ROWS):
     """
     Creates distribution plots for the target variable in the dataframe (df) grouped by key features in the dataframe. 
 
@@ -107,12 +311,21 @@ def target_dist_grouped(df):
     ----------
     df : pandas.DataFrame
         The dataset containing the target variable 'price'.
+    aggregate : bool, optional
+        If True, the box plots, histograms and 2-D binned counts of the scatter plot are
+        computed in pandas (default is config.EDA_AGGREGATE).
+    sample_rows : int, optional
+        The number of listings drawn on the binned counts of the aggregated scatter plot
+        (default is config.EDA_SAMPLE_ROWS).
        
     Returns
     -------
     tuple
         The combined plots for the distribution of the target variable as a tuple. 
     """
+    if aggregate:
+        return target_dist_grouped_aggregated(df, sample_rows)
+
     # Plot grouped by Room Type and Neighboorhood group
     roomtype_price = alt.Chart(df, title='Price Distribution Based on Room Type').mark_boxplot().encode(
     x=alt.X('price:Q', title='Price'), 
@@ -123,7 +336,7 @@ def target_dist_grouped(df):
     )
     neighborhood_price = alt.Chart(df, title = 'Price Distribution Based on Neighborhood').mark_boxplot().encode(
         x = alt.X('price:Q', title = 'Price'), 
-        y = alt.Y('neighbourhood_group').axis(title = 'Neighbourhood Group') 
+        y = alt.Y('neighbourhood_group:N').axis(title = 'Neighbourhood Group') 
     ).properties(
         height = 200,
         width = 400 
@@ -170,7 +383,86 @@ def target_dist_grouped(df):
     combined_num = (( reviews_price_scatter | hist_reviews ) & hist_price)
     return (combined_cat, combined_num)
 
-def corr_plot(df, corr_type='pearson', exclude_cols=None, title='Correlation Plot'):
+def target_dist_grouped_aggregated(df, sample_rows):
+    """
+    Creates the plots of target_dist_grouped from aggregated tables: box plot statistics,
+    histograms and the counts of a 2-D binned scatter plot, overlaid with a stratified
+    sample of the listings.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataset containing the target variable 'price'.
+    sample_rows : int
+        The number of listings drawn on the binned counts.
+
+    Returns
+    -------
+    tuple
+        The combined plots for the distribution of the target variable as a tuple.
+    """
+    roomtype_price = box_chart(*box_table(df, 'price', 'room_type'), 'price', 'Price', 'room_type', 'Room Type').properties(
+        title='Price Distribution Based on Room Type',
+        height=200,
+        width=400
+    )
+    neighborhood_price = box_chart(*box_table(df, 'price', 'neighbourhood_group'), 'price', 'Price',
+                                   'neighbourhood_group', 'Neighbourhood Group').properties(
+        title='Price Distribution Based on Neighborhood',
+        height=200,
+        width=400
+    )
+    combined_cat = (roomtype_price | neighborhood_price)
+
+    # Binned counts of listings by price and number of reviews, with a sample of the listings
+    counts, price_edges, review_edges = np.histogram2d(df['price'], df['number_of_reviews'], bins=40)
+    price_bin, review_bin = np.nonzero(counts)
+    bins = pd.DataFrame({'price_start': price_edges[price_bin], 'price_end': price_edges[price_bin + 1],
+                         'reviews_start': review_edges[review_bin], 'reviews_end': review_edges[review_bin + 1],
+                         'count': counts[price_bin, review_bin]})
+    reviews_price_bins = alt.Chart(bins, title='Price Distribution Based on Number of Reviews').mark_rect().encode(
+        x=alt.X('price_start:Q', title='Price'),
+        x2='price_end:Q',
+        y=alt.Y('reviews_start:Q', title='Number of Reviews'),
+        y2='reviews_end:Q',
+        color=alt.Color('count:Q', scale=alt.Scale(type='log', scheme='viridis'), title='Listings'),
+        tooltip=['price_start:Q', 'reviews_start:Q', 'count:Q']
+    )
+    sample = stratified_sample(df[['price', 'number_of_reviews', 'room_type']], 'room_type', sample_rows)
+    sample_points = alt.Chart(sample).mark_circle(opacity=0.3, size=8, color='black').encode(
+        x='price:Q',
+        y='number_of_reviews:Q',
+        tooltip=['number_of_reviews:Q', 'price:Q']
+    )
+    reviews_price_scatter = (reviews_price_bins + sample_points).properties(
+        height=200,
+        width=400
+    ).interactive()
+
+    # Marginal histograms for price and number of reviews
+    hist_price = alt.Chart(histogram_table(df['price'])).mark_bar().encode(
+        x=alt.X('bin_start:Q', bin='binned', title='Price'),
+        x2='bin_end:Q',
+        y=alt.Y('count:Q', title='Count')
+    ).properties(
+        height=100,
+        width=400
+    )
+    hist_reviews = alt.Chart(histogram_table(df['number_of_reviews'])).mark_bar().encode(
+        y=alt.Y('bin_start:Q', bin='binned', title='Number of Reviews'),
+        y2='bin_end:Q',
+        x=alt.X('count:Q', title='Count')
+    ).properties(
+        height=200,
+        width=100
+    )
+
+    # Combine Plots
+    combined_num = (( reviews_price_scatter | hist_reviews ) & hist_price)
+    return (combined_cat, combined_num)
+
+@profiled(rows=0)
+def corr_plot(df, corr_type='pearson', exclude_cols=None, title='Correlation Plot', corr=None):
     """
     Creates Pearson and Spearman correlation heatmaps for the numeric columns in the dataframe (df). 
     
@@ -184,14 +476,17 @@ def corr_plot(df, corr_type='pearson', exclude_cols=None, title='Correlation Plo
         Title of the plot (default is 'Correlation Plot')
     exclude_cols : list
         A list of the mumeric column names not to include in the correlation plots. 
+    corr : pandas.DataFrame, optional
+        The correlation matrix, if already computed (e.g. by correlation_matrices). 
        
     Returns
     -------
     alt.Chart
         The correlation heatmap.  
     """
-    df_numeric = df.select_dtypes(include='number').drop(columns=exclude_cols)
-    df_corr = df_numeric.corr(method=corr_type).stack().reset_index(name='corr')
+    if corr is None:
+        corr = df.select_dtypes(include='number').drop(columns=exclude_cols).corr(method=corr_type)
+    df_corr = corr.stack().reset_index(name='corr')
 
     # heatmap plot
     corr_heatmap = alt.Chart(df_corr).mark_rect().encode(
@@ -212,6 +507,7 @@ def corr_plot(df, corr_type='pearson', exclude_cols=None, title='Correlation Plo
     corr_plot = corr_heatmap + text
     return corr_plot
 
+@profiled(report=True)
 def main():
     """
     Main function to orchestrate generating the EDA plots and export plots to PNG files.
@@ -223,7 +519,7 @@ def main():
     OUTPUT_PATH : str
         The path where the plots will be saved.
     """
-    df = pd.read_csv(config.RAW_DATA, encoding="utf-8")
+    df = load_frame(config.RAW_DATA)
 
     # Categorical Columns Distributions
     categ_cols = ['room_type','neighbourhood_group']
@@ -240,18 +536,22 @@ def main():
     # Target Distributions (grouped)
     target_cat, target_num = target_dist_grouped(df)
 
-    # Correlation Plot
-    pear_corr_plot = corr_plot(df, exclude_cols=['id', 'host_id'], title='Pearson Correlations')
-    spear_corr_plot = corr_plot(df, corr_type='spearman', exclude_cols=['id', 'host_id'], title='Spearman Correlations')
+    # Correlation Plot (both methods from one pass over the ranked columns)
+    corr_cols = numeric_columns(df, exclude=['id', 'host_id'])
+    corr = correlation_matrices(config.RAW_DATA, corr_cols, df)
+    pear_corr_plot = corr_plot(df, title='Pearson Correlations', corr=corr['pearson'])
+    spear_corr_plot = corr_plot(df, corr_type='spearman', title='Spearman Correlations', corr=corr['spearman'])
     combined_corr = alt.hconcat(pear_corr_plot, spear_corr_plot)
     
-    # Save plots
-    cat_barplots.save(config.CAT_BAR_PATH)
-    num_density_plots.save(config.NUM_DENSITY_PATH)
-    target_dist_plots.save(config.TAR_DIST_PATH)
-    target_cat.save(config.TAR_CAT_PATH)
-    target_num.save(config.TAR_NUM_PATH)
-    combined_corr.save(config.CORR_PATH)
+    # Save plots, in parallel and skipping the unchanged ones
+    render_charts({
+        config.CAT_BAR_PATH: cat_barplots,
+        config.NUM_DENSITY_PATH: num_density_plots,
+        config.TAR_DIST_PATH: target_dist_plots,
+        config.TAR_CAT_PATH: target_cat,
+        config.TAR_NUM_PATH: target_num,
+        config.CORR_PATH: combined_corr,
+    }, inputs=[config.RAW_DATA])
 
 if __name__ == "__main__":
     os.makedirs(config.IMG_OUTPUT_DIR, exist_ok=True)
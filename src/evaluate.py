@@ -1,77 +1,222 @@
-import pandas as pd 
-import joblib
+import pandas as pd
 import os
-from src import config
+import time
+import joblib
 import numpy as np
-from sklearn.metrics import mean_absolute_error
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.pipeline import Pipeline
-from sklearn.linear_model import Ridge
-from sklearn.dummy import DummyRegressor
-from sklearn.metrics import mean_absolute_error
-from lightgbm import LGBMRegressor
-from sklearn.feature_selection import RFECV
-from sklearn.metrics import r2_score
-from sklearn.pipeline import Pipeline
-   
-def mae_convert_calc(model, X_test, y_test):
+from src import config
+from src.profiling import profiled
+from src.artifacts import load_model
+from src.storage import load_frame
+from src.preprocessor import MODEL_FEATURES
+
+BOOTSTRAP_BLOCK = 250 # most resamples drawn per task, fixed for a test set size so the results do not depend on the number of workers
+
+@profiled(rows=1)
+def predict_models(models, X_test):
+    """
+    Predicts the test set once with every model. Pipelines starting with the same fitted
+    preprocessor (equal joblib hashes, e.g. the RFECV, dummy and linear models fitted on the
+    same training set) share one transform of the test set.
+
+    Parameters
+    ----------
+    models : dict
+        The fitted models keyed by name.
+    X_test : pd.DataFrame
+        The test set features.
+
+    Returns
+    -------
+    dict
+        For each model: its predictions and its batch inference latency (s), which includes
+        the shared preprocessing.
+    """
+    transformed = {}
+    results = {}
+    for name, model in models.items():
+        if isinstance(model, Pipeline) and len(model.steps) > 1:
+            key = joblib.hash(model.steps[0][1])
+            if key not in transformed:
+                start = time.perf_counter()
+                transformed[key] = (model[:1].transform(X_test), time.perf_counter() - start)
+            X_transformed, preprocess_time = transformed[key]
+            start = time.perf_counter()
+            y_pred = model[1:].predict(X_transformed)
+            results[name] = (y_pred, preprocess_time + time.perf_counter() - start)
+        else:
+            start = time.perf_counter()
+            y_pred = model.predict(X_test)
+            results[name] = (y_pred, time.perf_counter() - start)
+    return results
+
+def block_size(n_rows, memory=config.BOOTSTRAP_BLOCK_BYTES):
     """
-    This function coverts the target values into their original units and calculates the MAE. 
-    
+    Returns the number of resamples per task: at most BOOTSTRAP_BLOCK, and few enough that
+    the resampled indices and counts of a task (16 bytes per resample and row) fit in memory.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of test rows.
+    memory : int, optional
+        The memory budget of a task in bytes (default is config.BOOTSTRAP_BLOCK_BYTES).
+
+    Returns
+    -------
+    int
+        The number of resamples per task.
+    """
+    return int(max(1, min(BOOTSTRAP_BLOCK, memory // (16 * max(n_rows, 1)))))
+
+def bootstrap_block(columns, n_resamples, seed):
+    """
+    Computes the bootstrap sums of the columns for one block of resamples. The resampled
+    row indices are drawn as an (n_resamples, n_rows) matrix and turned into counts, so the
+    sums of all columns over all resamples are a single matrix product. The block size is
+    chosen by block_size to bound the memory of these matrices.
+
     Parameters
-    ----------   
-    model : sklearn.Pipeline 
-        The model to evaluate. 
-    X_test : pd.DataFrame 
-        The test set features.  
-    y_test : pd.DataFrame 
-        The test set target values.  
+    ----------
+    columns : np.ndarray
+        The (n_rows, n_columns) values to sum.
+    n_resamples : int
+        The number of resamples.
+    seed : np.random.SeedSequence
+        The seed of the block.
 
     Returns
-    -------   
-    mae : int
-        The mean absolute error of the model in the original units.     
+    -------
+    np.ndarray
+        The (n_resamples, n_columns) sums.
     """
-    y_pred = model.predict(X_test)
-    y_pred_convert = np.exp(y_pred)
-    y_test_convert = np.exp(y_test)
-    mae = mean_absolute_error(y_test_convert, y_pred_convert)
-    print(f'MAE test score: {mae:.3f}') 
-    return mae 
+    n_rows = len(columns)
+    indices = np.random.default_rng(seed).integers(0, n_rows, size=(n_resamples, n_rows))
+    # offset each resample's indices to its own row of counts, so one bincount counts them all
+    indices += np.arange(n_resamples)[:, np.newaxis] * n_rows
+    counts = np.bincount(indices.ravel(), minlength=n_resamples * n_rows)
+    del indices
+    return counts.reshape(n_resamples, n_rows).astype(np.float64) @ columns
 
+@profiled(rows=0)
+def bootstrap_metrics(y_test, predictions, n_resamples=config.BOOTSTRAP_RESAMPLES,
+                      confidence=config.BOOTSTRAP_CONFIDENCE, seed=config.BOOTSTRAP_SEED, n_jobs=config.N_JOBS):
+    """
+    Computes bootstrap confidence intervals of the R² (log-price) and MAE (price) of every
+    model. All models are scored on the same resamples, which are drawn in blocks run in
+    parallel.
+
+    Parameters
+    ----------
+    y_test : np.ndarray
+        The test set target (log-prices).
+    predictions : dict
+        The predictions of each model, keyed by name.
+    n_resamples : int, optional
+        The number of bootstrap resamples (default is config.BOOTSTRAP_RESAMPLES).
+    confidence : float, optional
+        The confidence level of the percentile intervals (default is config.BOOTSTRAP_CONFIDENCE).
+    seed : int, optional
+        The random seed (default is config.BOOTSTRAP_SEED).
+    n_jobs : int, optional
+        The number of worker processes, -1 uses all cores (default is config.N_JOBS).
+
+    Returns
+    -------
+    dict
+        For each model: the lower and upper bounds of its R² and MAE.
+    """
+    names = list(predictions)
+    y_pred = np.column_stack([predictions[name] for name in names])
+    # per-row terms whose resampled sums give the metrics: y and y² for the total sum of squares,
+    # then the squared errors and the absolute price errors of each model
+    columns = np.column_stack([y_test, y_test ** 2, (y_test[:, None] - y_pred) ** 2,
+                               np.abs(np.exp(y_test)[:, None] - np.exp(y_pred))])
+
+    block = block_size(len(y_test))
+    sizes = [min(block, n_resamples - start) for start in range(0, n_resamples, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    sums = np.vstack(Parallel(n_jobs=n_jobs)(
+        delayed(bootstrap_block)(columns, size, block_seed) for size, block_seed in zip(sizes, seeds)
+    ))
+
+    n_rows, n_models = len(y_test), len(names)
+    sst = sums[:, 1] - sums[:, 0] ** 2 / n_rows
+    r2 = 1 - sums[:, 2:2 + n_models] / sst[:, None]
+    mae = sums[:, 2 + n_models:] / n_rows
+    tails = [100 * (1 - confidence) / 2, 100 * (1 + confidence) / 2]
+    r2_bounds, mae_bounds = np.percentile(r2, tails, axis=0), np.percentile(mae, tails, axis=0)
+    return {name: {'R2_low': r2_bounds[0, i], 'R2_high': r2_bounds[1, i],
+                   'MAE_low': mae_bounds[0, i], 'MAE_high': mae_bounds[1, i]}
+            for i, name in enumerate(names)}
+
+def evaluate_models(models, X_test, y_test):
+    """
+    Scores every model in one pass: one prediction of the test set per model, the point
+    and bootstrap interval R² and MAE, and the batch inference latency.
+
+    Parameters
+    ----------
+    models : dict
+        The fitted models keyed by name, predicting log-prices.
+    X_test : pd.DataFrame
+        The test set features.
+    y_test : np.ndarray
+        The test set target values (log-prices).
+
+    Returns
+    -------
+    pd.DataFrame
+        The R², MAE in the original units, their confidence intervals, the latency (ms)
+        and the throughput (rows/s) of each model, sorted by MAE.
+    """
+    results = predict_models(models, X_test)
+    predictions = {name: y_pred for name, (y_pred, _) in results.items()}
+    intervals = bootstrap_metrics(y_test, predictions)
+
+    rows = []
+    for name, (y_pred, latency) in results.items():
+        rows.append({'Model': name,
+                     'R2': r2_score(y_test, y_pred),
+                     'R2_low': intervals[name]['R2_low'], 'R2_high': intervals[name]['R2_high'],
+                     'MAE': mean_absolute_error(np.exp(y_test), np.exp(y_pred)),
+                     'MAE_low': intervals[name]['MAE_low'], 'MAE_high': intervals[name]['MAE_high'],
+                     'latency_ms': latency * 1000,
+                     'rows_per_s': len(X_test) / latency})
+    return pd.DataFrame(rows).sort_values('MAE')
+
+@profiled(report=True)
 def main():
     """
-    Main function to ochestrate the R^2 and MAE test score calculations.     
+    Main function to ochestrate the R^2 and MAE test score calculations.
     """
-    # Check files exist 
-    files = [config.RFECV_PATH, config.X_TEST_DATA, config.Y_TEST_DATA, config.DUMMY_PATH, config.LINEAR_PATH]
-    for f in files: 
+    # Check files exist
+    files = [config.X_TEST_DATA, config.Y_TEST_DATA] + list(config.EVAL_MODELS.values())
+    for f in files:
         if not os.path.isfile(f):
             print(f"Error no file: {f} ")
             return  # exit function
-    
+
     # Load files
-    X_test = pd.read_csv(config.X_TEST_DATA)
-    y_test = pd.read_csv(config.Y_TEST_DATA)
-    pipe_rfecv = joblib.load(config.RFECV_PATH)
-    pipe_dummy = joblib.load(config.DUMMY_PATH)
-    pipe_linear = joblib.load(config.LINEAR_PATH)
-
-    # calculate r2 
-    final_r2 = pipe_rfecv.score(X_test, y_test)
-    print(f'R² test score: {final_r2:.3f}')
+    X_test = load_frame(config.X_TEST_DATA, columns=MODEL_FEATURES)
+    y_test = load_frame(config.Y_TEST_DATA).values.ravel()
+    models = {name: load_model(path) for name, path in config.EVAL_MODELS.items()}
 
-    # calculate mae and compare models 
-    mae_rfecv = mae_convert_calc(pipe_rfecv, X_test, y_test) 
-    mae_dummy = mae_convert_calc(pipe_dummy, X_test, y_test) 
-    mae_linear = mae_convert_calc(pipe_linear, X_test, y_test) 
-    
-    mae_comparison = pd.DataFrame(data={'Model': ['RFECV', 'Dummy', 'Linear'],
-                                        'MAE': [mae_rfecv, mae_dummy, mae_linear]
-    }).sort_values('MAE')
+    # score all models
+    report = evaluate_models(models, X_test, y_test)
+    with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 120):
+        print(report.to_string(index=False))
+
+    final_r2 = report.set_index('Model').loc['RFECV', 'R2']
+    print(f'R² test score: {final_r2:.3f}')
+    mae_comparison = report[['Model', 'MAE']]
 
     # Save results
     np.save(config.FINAL_R2_PATH, np.array(final_r2))
     mae_comparison.to_csv(config.MAE_PATH, index=False)
+    report.to_csv(config.EVAL_REPORT_PATH, index=False)
 
 if __name__ == "__main__":
     os.makedirs(config.RESULTS_OUTPUT_DIR , exist_ok=True)
@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import time
+import joblib
+import numpy as np
+from src import config
+from src.artifacts import load_model
+from src.models.compiled import compile_preprocessing
+from src.preprocessor import MODEL_FEATURES
+from src.serve import validate_records, prepare_listings
+from src.storage import load_frame
+
+def top_drivers(contributions, top_k):
+    """
+    Finds the features with the largest absolute contributions of each listing.
+
+    Parameters
+    ----------
+    contributions : np.ndarray
+        The (n_listings, n_features) SHAP values.
+    top_k : int
+        The number of features per listing.
+
+    Returns
+    -------
+    np.ndarray
+        The (n_listings, top_k) feature indices, by decreasing absolute contribution.
+    """
+    top_k = min(top_k, contributions.shape[1])
+    magnitude = -np.abs(contributions)
+    top = np.argpartition(magnitude, top_k - 1, axis=1)[:, :top_k]
+    order = np.argsort(np.take_along_axis(magnitude, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+class ListingExplainer:
+    """
+    Explains the prices predicted by the RFECV model with LightGBM's native TreeSHAP
+    (pred_contrib), the path-dependent algorithm of shap.TreeExplainer, without building a
+    shap explainer per call. The preprocessing is folded into a FeatureProjection when the
+    pipeline can be compiled, so a single listing is explained in milliseconds.
+
+    The contributions are in log-price, the model's target: the base value plus the
+    contributions of all features is the predicted log-price.
+
+    Parameters
+    ----------
+    pipe_rfecv : sklearn.Pipeline
+        The fitted rfecv model.
+    selected_features : list
+        The names of the features selected by the RFECV, as saved in config.SELECTED_FEAT_PATH.
+    """
+    def __init__(self, pipe_rfecv, selected_features):
+        self.booster = pipe_rfecv.steps[-1][1].booster_
+        self.features = list(selected_features)
+        if self.booster.num_feature() != len(self.features):
+            raise ValueError(f"the model has {self.booster.num_feature()} features, but {len(self.features)} names were given")
+        try:
+            self.transform = compile_preprocessing(pipe_rfecv.steps[:-1]).transform
+        except ValueError:
+            self.transform = pipe_rfecv[:-1].transform
+
+    def contributions(self, X):
+        """
+        Computes the SHAP values of listings.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            The model features (MODEL_FEATURES) of the listings.
+
+        Returns
+        -------
+        tuple
+            The encoded features and the (n_listings, n_features + 1) SHAP values, the last
+            column is the base value.
+        """
+        encoded = self.transform(X)
+        return np.asarray(encoded, dtype=np.float64), self.booster.predict(encoded, pred_contrib=True)
+
+    def explain_frame(self, X, top_k=config.EXPLAIN_TOP_K):
+        """
+        Explains the predicted prices of listings given by their model features.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            The model features (MODEL_FEATURES) of the listings.
+        top_k : int, optional
+            The number of drivers per listing (default is config.EXPLAIN_TOP_K).
+
+        Returns
+        -------
+        list of dict
+            For each listing: the predicted price and log-price, the base value and its
+            top_k drivers by absolute contribution, each with the feature name, its encoded
+            value and its contribution (log-price).
+        """
+        encoded, contributions = self.contributions(X)
+        values, base_values = contributions[:, :-1], contributions[:, -1]
+        log_prices = contributions.sum(axis=1)
+        explanations = []
+        for i, drivers in enumerate(top_drivers(values, top_k)):
+            explanations.append({
+                'price': float(np.exp(log_prices[i])),
+                'log_price': float(log_prices[i]),
+                'base_value': float(base_values[i]),
+                'drivers': [{'feature': self.features[j], 'value': float(encoded[i, j]),
+                             'contribution': float(values[i, j])} for j in drivers],
+            })
+        return explanations
+
+    def explain(self, records, top_k=config.EXPLAIN_TOP_K):
+        """
+        Explains the predicted prices of raw listings, in the AB_NYC_2019.csv format.
+
+        Parameters
+        ----------
+        records : dict or list of dict
+            One raw listing or a list of them.
+        top_k : int, optional
+            The number of drivers per listing (default is config.EXPLAIN_TOP_K).
+
+        Returns
+        -------
+        list of dict
+            The explanation of each listing (see explain_frame).
+
+        Raises
+        ------
+        ValueError
+            If a listing misses a required field.
+        """
+        return self.explain_frame(prepare_listings(validate_records(records)), top_k)
+
+def load_explainer(model_path=config.RFECV_PATH, selected_path=config.SELECTED_FEAT_PATH):
+    """
+    Loads the ListingExplainer of the saved RFECV model.
+
+    Returns
+    -------
+    ListingExplainer
+        The explainer.
+    """
+    pipe_rfecv = load_model(model_path)
+    _, selected_features = joblib.load(selected_path)
+    return ListingExplainer(pipe_rfecv, selected_features)
+
+def check(explainer, n_rows=1000, repeats=200):
+    """
+    Compares the explainer with shap.TreeExplainer (if shap is installed) and the pipeline's
+    predictions on the test set, and measures its single-listing latency.
+
+    Parameters
+    ----------
+    explainer : ListingExplainer
+        The explainer.
+    n_rows : int, optional
+        The number of test listings compared (default is 1000).
+    repeats : int, optional
+        The number of single-listing explanations timed (default is 200).
+    """
+    X_test = load_frame(config.X_TEST_DATA, columns=MODEL_FEATURES).iloc[:n_rows]
+    pipe_rfecv = load_model(config.RFECV_PATH)
+    _, contributions = explainer.contributions(X_test)
+    difference = np.abs(contributions.sum(axis=1) - pipe_rfecv.predict(X_test)).max()
+    print(f"Largest difference of base value + contributions to the prediction: {difference:.3g}")
+
+    try:
+        import shap
+    except ImportError:
+        print("shap is not installed, skipping the comparison with shap.TreeExplainer")
+    else:
+        from src.shap_values import encode_test_set
+        selected_features_mask, selected_features = joblib.load(config.SELECTED_FEAT_PATH)
+        X_test_enc = encode_test_set(pipe_rfecv, X_test, selected_features_mask, selected_features)
+        tree_explainer = shap.TreeExplainer(pipe_rfecv.named_steps["lgbmregressor"])
+        difference = np.abs(contributions[:, :-1] - tree_explainer.shap_values(X_test_enc)).max()
+        print(f"Largest difference to shap.TreeExplainer: {difference:.3g}")
+
+    times = []
+    for i in range(repeats):
+        row = X_test.iloc[[i % len(X_test)]]
+        start = time.perf_counter()
+        explainer.explain_frame(row)
+        times.append(time.perf_counter() - start)
+    print(f"Single listing latency: p50 {np.percentile(times, 50) * 1000:.2f} ms, p99 {np.percentile(times, 99) * 1000:.2f} ms")
+
+def main(records_path=None, top_k=config.EXPLAIN_TOP_K, run_check=False):
+    """
+    Main function to explain the predicted prices of raw listings, or to check the explainer.
+
+    Parameters
+    ----------
+    records_path : str, optional
+        A JSON file with one raw listing or a list of them.
+    top_k : int, optional
+        The number of drivers per listing (default is config.EXPLAIN_TOP_K).
+    run_check : bool, optional
+        If True, the explainer is checked on the test set (default is False).
+    """
+    # Check files exist
+    files = [config.RFECV_PATH, config.SELECTED_FEAT_PATH] + ([records_path] if records_path else [])
+    if run_check:
+        files.append(config.X_TEST_DATA)
+    for f in files:
+        if not os.path.isfile(f):
+            print(f"Error no file: {f} ")
+            return  # exit function
+
+    explainer = load_explainer()
+    if records_path:
+        with open(records_path) as f:
+            print(json.dumps(explainer.explain(json.load(f), top_k), indent=2))
+    if run_check:
+        check(explainer)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explain the prices predicted by the RFECV model.")
+    parser.add_argument('records', nargs='?', default=None, help="JSON file with one raw listing or a list of them")
+    parser.add_argument('--top-k', type=int, default=config.EXPLAIN_TOP_K, help="drivers returned per listing")
+    parser.add_argument('--check', action='store_true', help="compare with shap.TreeExplainer and time single listings")
+    args = parser.parse_args()
+    main(args.records, args.top_k, args.check)
@@ -2,11 +2,14 @@ import pandas as pd
 import joblib
 import os
 from src import config
+from src.profiling import profiled, record_cv
+from src.artifacts import save_model
+from src.storage import load_frame
 from sklearn.model_selection import cross_validate
-from sklearn.pipeline import make_pipeline
 from sklearn.dummy import DummyRegressor
-from src.preprocessor import create_preprocessor
+from src.preprocessor import create_preprocessor, make_cached_pipeline, reduce_transformer_cache, MODEL_FEATURES
 
+@profiled(report=True)
 def main():
     """
     Main function to create the baseline model. 
@@ -21,20 +24,22 @@ def main():
         return  # exit function
     
     # load data
-    X_train = pd.read_csv(config.X_TRAIN_DATA)
-    y_train = pd.read_csv(config.Y_TRAIN_DATA)
+    X_train = load_frame(config.X_TRAIN_DATA, columns=MODEL_FEATURES)
+    y_train = load_frame(config.Y_TRAIN_DATA)
     
     # train model
     preprocessor = create_preprocessor()
-    pipe_dummy = make_pipeline(preprocessor, DummyRegressor())
+    pipe_dummy = make_cached_pipeline(preprocessor, DummyRegressor())
     cv_dummy = pd.DataFrame(cross_validate(pipe_dummy, X_train, y_train, return_train_score=True, scoring='r2'))
 
+    record_cv('Dummy', cv_dummy)
     cv_results = {'Dummy': cv_dummy.agg(['mean', 'std']).round(3).T}    
     pipe_dummy.fit(X_train, y_train)
     
     # save results
-    joblib.dump(pipe_dummy, config.DUMMY_PATH) 
+    save_model(pipe_dummy.set_params(memory=None), config.DUMMY_PATH) 
     joblib.dump(cv_results, config.CV_DUMMY_PATH)
+    reduce_transformer_cache()
 
 if __name__ == "__main__":
     os.makedirs(config.RESULTS_OUTPUT_DIR, exist_ok=True)
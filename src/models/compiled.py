@@ -0,0 +1,560 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_selection import SelectorMixin
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
+from lightgbm import LGBMRegressor
+from src import config
+from src.artifacts import load_model
+from src.preprocessor import CategoricalCodes, MODEL_FEATURES
+from src.storage import load_frame
+
+# Kinds of model features in a FeatureProjection
+SCALED, INDICATOR, CODE = 0, 1, 2
+
+# LightGBM missing value handling of a split (MissingType in LightGBM's tree.h)
+MISSING_TYPES = {'None': 0, 'Zero': 1, 'NaN': 2}
+ZERO_THRESHOLD = 1e-35 # kZeroThreshold, values this close to zero are missing for 'Zero' splits
+
+# Objectives whose raw score is the prediction
+IDENTITY_OBJECTIVES = {'regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape'}
+
+WORD_BITS = 64
+CHUNK_WORDS = 1 << 15 # leaf mask words per chunk of rows, sized to stay in the CPU cache
+
+class FeatureProjection:
+    """
+    The preprocessing of a fitted pipeline folded into one projection from the raw columns
+    to the model features. Each model feature reads a single raw column, so the projection
+    matrix has one non-zero per model feature and is stored by column as: the raw column it
+    reads (source), how it reads it (kind) and its shift and scale.
+
+    - SCALED: (x - offset) / scale, a standardized numeric column (StandardScaler or passthrough).
+    - INDICATOR: 1 if the category code is category else 0, a one-hot column (OneHotEncoder).
+    - CODE: the value given to the category code by code_values, an ordinal column
+      (OrdinalEncoder, optionally followed by CategoricalCodes).
+
+    Unknown categories have code -1, giving 0 for indicators and the last entry of code_values
+    (NaN) for codes, as the encoders do.
+
+    Parameters
+    ----------
+    numeric_columns : list of str
+        The raw numeric columns.
+    categorical_columns : list of str
+        The raw categorical columns.
+    categories : list of np.ndarray
+        The categories of each categorical column.
+    features : dict
+        The names, kind, source, offset, scale, category and code_values of the model features.
+    """
+    def __init__(self, numeric_columns, categorical_columns, categories, features):
+        self.numeric_columns = numeric_columns
+        self.categorical_columns = categorical_columns
+        self.categories = categories
+        self.names = list(features['names'])
+        self.kind = np.asarray(features['kind'], dtype=np.int8)
+        self.source = np.asarray(features['source'], dtype=np.intp)
+        self.offset = np.asarray(features['offset'], dtype=np.float64)
+        self.scale = np.asarray(features['scale'], dtype=np.float64)
+        self.category = np.asarray(features['category'], dtype=np.int64)
+        self.code_values = list(features['code_values'])
+
+    def scaled_values(self, X, features):
+        """
+        Computes standardized model features of raw listings.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            The raw columns.
+        features : np.ndarray
+            The indices of SCALED model features.
+
+        Returns
+        -------
+        np.ndarray
+            The features, one column per index.
+        """
+        columns = [self.numeric_columns[i] for i in self.source[features]]
+        # same operations as StandardScaler, so the features are bit-identical
+        return (X[columns].to_numpy(dtype=np.float64) - self.offset[features]) / self.scale[features]
+
+    def category_codes(self, X, source):
+        """
+        Returns the code of each listing in the categories of a categorical column, -1 if unknown.
+        """
+        return pd.Categorical(X[self.categorical_columns[source]], categories=self.categories[source]).codes
+
+    def category_values(self, feature, codes):
+        """
+        Returns the values of an INDICATOR or CODE model feature for category codes.
+        """
+        if self.kind[feature] == INDICATOR:
+            return (codes == self.category[feature]).astype(np.float64)
+        return self.code_values[feature][codes]
+
+    def transform(self, X):
+        """
+        Computes the model features of raw listings.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            The raw columns.
+
+        Returns
+        -------
+        np.ndarray
+            The model features (float64).
+        """
+        out = np.empty((len(X), len(self.names)), dtype=np.float64)
+        scaled = np.flatnonzero(self.kind == SCALED)
+        if len(scaled):
+            out[:, scaled] = self.scaled_values(X, scaled)
+        for source in range(len(self.categorical_columns)):
+            codes = self.category_codes(X, source)
+            for j in np.flatnonzero((self.kind != SCALED) & (self.source == source)):
+                out[:, j] = self.category_values(j, codes)
+        return out
+
+def _scaler_parameters(transformer, n_columns):
+    """
+    Returns the shift and scale of a fitted StandardScaler, or of a passthrough.
+    """
+    if transformer == 'passthrough':
+        return np.zeros(n_columns), np.ones(n_columns)
+    offset = transformer.mean_ if transformer.mean_ is not None else np.zeros(n_columns)
+    scale = transformer.scale_ if transformer.scale_ is not None else np.ones(n_columns)
+    return offset, scale
+
+def compile_preprocessing(steps):
+    """
+    Folds the transforming steps of a fitted pipeline into a FeatureProjection: a
+    ColumnTransformer of StandardScaler, OneHotEncoder and OrdinalEncoder pipelines,
+    followed by any feature selectors (e.g. RFECV) and a CategoricalCodes step.
+
+    Parameters
+    ----------
+    steps : list of tuple
+        The (name, transformer) steps before the final estimator.
+
+    Returns
+    -------
+    FeatureProjection
+        The projection from the raw columns to the model features.
+
+    Raises
+    ------
+    ValueError
+        If a step or transformer cannot be folded into a projection (e.g. the spatial features).
+    """
+    (_, preprocessor), *rest = steps
+    if not isinstance(preprocessor, ColumnTransformer):
+        raise ValueError(f"cannot compile a pipeline starting with {type(preprocessor).__name__}")
+
+    numeric_columns, categorical_columns, categories = [], [], []
+    features = {key: [] for key in ['names', 'kind', 'source', 'offset', 'scale', 'category', 'code_values']}
+
+    def add(name, kind, source, offset=0.0, scale=1.0, category=-1, code_values=None):
+        for key, value in zip(features, [name, kind, source, offset, scale, category, code_values]):
+            features[key].append(value)
+
+    for _, transformer, columns in preprocessor.transformers_:
+        if transformer == 'drop' or len(columns) == 0:
+            continue
+        encoder = transformer.steps[-1][1] if isinstance(transformer, Pipeline) and len(transformer.steps) == 1 else transformer
+        if encoder == 'passthrough' or isinstance(encoder, StandardScaler):
+            offset, scale = _scaler_parameters(encoder, len(columns))
+            for col, o, s in zip(columns, offset, scale):
+                add(col, SCALED, len(numeric_columns), o, s)
+                numeric_columns.append(col)
+        elif isinstance(encoder, (OneHotEncoder, OrdinalEncoder)):
+            if isinstance(encoder, OneHotEncoder) and (encoder.drop_idx_ is not None or encoder._infrequent_enabled):
+                raise ValueError("cannot compile a OneHotEncoder with dropped or infrequent categories")
+            for col, cats in zip(columns, encoder.categories_):
+                if pd.isna(cats).any():
+                    raise ValueError(f"cannot compile the missing value category of {col}")
+                source = len(categorical_columns)
+                categorical_columns.append(col)
+                categories.append(cats)
+                if isinstance(encoder, OneHotEncoder):
+                    for k, cat in enumerate(cats):
+                        add(f'{col}_{cat}', INDICATOR, source, category=k)
+                else:
+                    # the ordinal code of each category, then NaN for unknown categories (code -1)
+                    add(col, CODE, source, code_values=np.append(np.arange(len(cats), dtype=np.float64), np.nan))
+        else:
+            raise ValueError(f"cannot compile the {type(encoder).__name__} of the preprocessor")
+
+    for _, step in rest:
+        if isinstance(step, SelectorMixin):
+            support = step.get_support()
+            features = {key: [value for value, keep in zip(values, support) if keep] for key, values in features.items()}
+        elif isinstance(step, CategoricalCodes):
+            # LightGBM reads a category column as the position of the value in the fitted categories
+            for j, name in enumerate(features['names']):
+                if features['kind'][j] == CODE and name in step.categories_:
+                    fitted = step.categories_[name]
+                    positions = np.full(len(features['code_values'][j]), np.nan)
+                    codes = features['code_values'][j][:-1].astype(np.int64)
+                    found = np.isin(codes, fitted)
+                    positions[:-1][found] = np.searchsorted(fitted, codes[found])
+                    features['code_values'][j] = positions
+        else:
+            raise ValueError(f"cannot compile the {type(step).__name__} step")
+
+    return FeatureProjection(numeric_columns, categorical_columns, categories, features)
+
+def flatten_trees(booster):
+    """
+    Flattens the trees of a LightGBM booster into contiguous node arrays. The split nodes
+    of each tree are numbered depth first, left child first, so its leaves are numbered from
+    left to right and the leaves under any node form a contiguous range.
+
+    Parameters
+    ----------
+    booster : lightgbm.Booster
+        The booster.
+
+    Returns
+    -------
+    dict
+        For each split node: its tree, feature, threshold, missing type, default direction,
+        whether it is categorical, the slice of cat_values it sends left (cat_bounds) and the
+        range of leaves under its left child (left_start, left_stop). The leaf values of all
+        trees (leaf_value) and the position of the first leaf of each tree (leaf_offset).
+    """
+    info = booster.dump_model()
+    objective = str(info.get('objective', 'regression')).split()[0]
+    if objective not in IDENTITY_OBJECTIVES or info.get('num_class', 1) != 1:
+        raise ValueError(f"cannot compile a booster with the {objective} objective")
+
+    nodes = {key: [] for key in ['tree', 'feature', 'threshold', 'missing_type', 'default_left',
+                                 'categorical', 'left_start', 'left_stop']}
+    cat_values, cat_bounds, leaf_value = [], [0], []
+
+    def visit(node, tree, first_leaf):
+        # returns the number of leaves under node, whose first leaf is numbered first_leaf
+        if 'leaf_value' in node:
+            leaf_value.append(node['leaf_value'])
+            return 1
+        categorical = node['decision_type'] == '=='
+        position = len(nodes['tree'])
+        for key, value in [('tree', tree), ('feature', node['split_feature']), ('missing_type', MISSING_TYPES[node['missing_type']]),
+                           ('default_left', node['default_left']), ('categorical', categorical), ('left_start', first_leaf)]:
+            nodes[key].append(value)
+        nodes['threshold'].append(np.nan if categorical else float(node['threshold']))
+        nodes['left_stop'].append(None)
+        if categorical:
+            cat_values.extend(int(c) for c in str(node['threshold']).split('||'))
+        cat_bounds.append(len(cat_values))
+        n_left = visit(node['left_child'], tree, first_leaf)
+        nodes['left_stop'][position] = first_leaf + n_left
+        return n_left + visit(node['right_child'], tree, first_leaf + n_left)
+
+    leaf_offset = [0]
+    for tree, tree_info in enumerate(info['tree_info']):
+        if tree_info.get('is_linear'):
+            raise ValueError("cannot compile linear trees")
+        leaf_offset.append(leaf_offset[-1] + visit(tree_info['tree_structure'], tree, 0))
+
+    flat = {'tree': np.asarray(nodes['tree'], dtype=np.intp), 'feature': np.asarray(nodes['feature'], dtype=np.intp),
+            'threshold': np.asarray(nodes['threshold'], dtype=np.float64),
+            'missing_type': np.asarray(nodes['missing_type'], dtype=np.int8),
+            'default_left': np.asarray(nodes['default_left'], dtype=bool),
+            'categorical': np.asarray(nodes['categorical'], dtype=bool),
+            'left_start': np.asarray(nodes['left_start'], dtype=np.intp), 'left_stop': np.asarray(nodes['left_stop'], dtype=np.intp),
+            'cat_values': np.asarray(cat_values, dtype=np.int64), 'cat_bounds': np.asarray(cat_bounds, dtype=np.intp),
+            'leaf_value': np.asarray(leaf_value, dtype=np.float64), 'leaf_offset': np.asarray(leaf_offset, dtype=np.intp)}
+    flat['n_features'] = len(info['feature_names'])
+    return flat
+
+def numerical_goes_right(threshold, missing_type, default_left, value):
+    """
+    Returns whether numerical splits send a value right, with LightGBM's rules: a NaN is
+    read as 0 unless the missing type is 'NaN', and a missing value ('NaN' type) or a zero
+    ('Zero' type) follows the default direction.
+    """
+    if np.isnan(value):
+        missing = missing_type == MISSING_TYPES['NaN']
+        value = np.where(missing, np.nan, 0.0)
+    else:
+        missing = np.zeros(len(threshold), dtype=bool)
+    missing = missing | ((missing_type == MISSING_TYPES['Zero']) & (np.abs(value) <= ZERO_THRESHOLD))
+    return np.where(missing, ~default_left, ~(value <= threshold))
+
+class CompiledForest:
+    """
+    The trees of a LightGBM booster compiled for batch prediction.
+
+    A row reaches the leftmost leaf of a tree that no split on its path eliminates, where a
+    split sending the row right eliminates every leaf under its left child. Leaves are
+    numbered from left to right, so the eliminated leaves of a split are a bit mask, and the
+    leaf of the row is the lowest bit left after AND-ing the masks of all splits sending it
+    right (QuickScorer, Lucchese et al. 2015). The splits on a numerical feature sending a
+    value x right are those with a threshold below x, so the AND of their masks in every tree
+    is precomputed for each of the feature's distinct thresholds, in a table indexed by
+    searchsorted(thresholds, x). A categorical feature has a table indexed by category.
+    Predicting a batch is then one table lookup per feature and row instead of a tree walk.
+
+    Parameters
+    ----------
+    trees : dict
+        The output of flatten_trees.
+    """
+    def __init__(self, trees):
+        self.trees = trees
+        self.n_features = trees['n_features']
+        self.n_trees = len(trees['leaf_offset']) - 1
+        n_leaves = np.diff(trees['leaf_offset'])
+        self.n_words = max(1, -(-int(n_leaves.max()) // WORD_BITS))
+        self.tables = self.build_tables()
+
+        # leaf values padded to n_words * WORD_BITS per tree, so a leaf is found from its tree and bit
+        width = self.n_words * WORD_BITS
+        leaf_trees = np.repeat(np.arange(self.n_trees), n_leaves)
+        positions = np.arange(len(trees['leaf_value'])) - trees['leaf_offset'][leaf_trees]
+        self.leaf_values = np.zeros(self.n_trees * width)
+        self.leaf_values[leaf_trees * width + positions] = trees['leaf_value']
+
+    def leaf_masks(self):
+        """
+        Returns for each split the bit mask of the leaves of its tree it does not eliminate.
+        """
+        bits = np.arange(self.n_words * WORD_BITS)
+        kept = ~((bits >= self.trees['left_start'][:, None]) & (bits < self.trees['left_stop'][:, None]))
+        return np.packbits(kept, axis=1, bitorder='little').view('<u8')
+
+    def build_tables(self):
+        """
+        Builds the lookup table of each feature used by a split.
+
+        Returns
+        -------
+        dict
+            For each feature: whether it is categorical, its distinct thresholds (numerical)
+            or number of categories (categorical) and its table of shape (n_rows, n_trees, n_words).
+        """
+        trees = self.trees
+        masks = self.leaf_masks()
+        ones = np.full((self.n_trees, self.n_words), np.iinfo(np.uint64).max, dtype=np.uint64)
+        tables = {}
+        for feature in np.unique(trees['feature']):
+            nodes = np.flatnonzero(trees['feature'] == feature)
+            if trees['categorical'][nodes].all():
+                # one row per category sent left by a split, then one for all other values
+                sets = [trees['cat_values'][trees['cat_bounds'][i]:trees['cat_bounds'][i + 1]] for i in nodes]
+                n_codes = int(max(s.max() for s in sets)) + 1
+                table = np.broadcast_to(ones, (n_codes + 1,) + ones.shape).copy()
+                for i, categories in zip(nodes, sets):
+                    goes_right = np.ones(n_codes + 1, dtype=bool)
+                    goes_right[categories] = False
+                    table[goes_right, trees['tree'][i]] &= masks[i]
+                tables[int(feature)] = (True, n_codes, table)
+            elif not trees['categorical'][nodes].any():
+                # row k: the splits at the k lowest thresholds send the value right, then rows for NaN and zero
+                thresholds, group = np.unique(trees['threshold'][nodes], return_inverse=True)
+                table = np.broadcast_to(ones, (len(thresholds) + 3,) + ones.shape).copy()
+                np.bitwise_and.at(table, (group + 1, trees['tree'][nodes]), masks[nodes])
+                table[:len(thresholds) + 1] = np.bitwise_and.accumulate(table[:len(thresholds) + 1], axis=0)
+                for row, value in [(len(thresholds) + 1, np.nan), (len(thresholds) + 2, 0.0)]:
+                    goes_right = numerical_goes_right(trees['threshold'][nodes], trees['missing_type'][nodes],
+                                                      trees['default_left'][nodes], value)
+                    np.bitwise_and.at(table[row], trees['tree'][nodes[goes_right]], masks[nodes[goes_right]])
+                tables[int(feature)] = (False, thresholds, table)
+            else:
+                raise ValueError(f"feature {feature} has both numerical and categorical splits")
+        return tables
+
+    def feature_rows(self, feature, values):
+        """
+        Returns the row of the table of a feature for each of its values.
+        """
+        categorical, thresholds, _ = self.tables[feature]
+        if categorical:
+            n_codes = thresholds
+            # LightGBM truncates the value to an integer, and sends NaN and negative values right
+            codes = np.trunc(np.clip(np.nan_to_num(values, nan=-1.0), -1, n_codes))
+            return np.where((codes < 0) | (codes >= n_codes), n_codes, codes).astype(np.intp)
+        rows = np.searchsorted(thresholds, values, side='left')
+        rows[np.abs(values) <= ZERO_THRESHOLD] = len(thresholds) + 2
+        rows[np.isnan(values)] = len(thresholds) + 1
+        return rows
+
+    def predict_rows(self, lookups, n_rows, chunk_size=None):
+        """
+        Predicts from table lookups: the leaves of each row and tree are the AND of the rows
+        of all tables.
+
+        Parameters
+        ----------
+        lookups : list of tuple
+            The tables, of shape (n_table_rows, n_trees, n_words), and the table row of each row.
+        n_rows : int
+            The number of rows.
+        chunk_size : int, optional
+            The number of rows predicted together (default is None, sized so the leaf masks of a
+            chunk stay in the CPU cache).
+
+        Returns
+        -------
+        np.ndarray
+            The predictions.
+        """
+        chunk_size = chunk_size or max(1, CHUNK_WORDS // (self.n_trees * self.n_words))
+        # the lowest set bit 2**b is read from its float64 exponent 1023 + b, shifted to the leaf values of its tree
+        base = np.arange(self.n_trees) * self.n_words * WORD_BITS - 1023
+        leaves = np.empty((min(chunk_size, n_rows), self.n_trees, self.n_words), dtype=np.uint64)
+        buffer = np.empty_like(leaves)
+        out = np.empty(n_rows)
+        for start in range(0, n_rows, chunk_size):
+            stop = min(start + chunk_size, n_rows)
+            chunk_leaves, chunk_buffer = leaves[:stop - start], buffer[:stop - start]
+            if not lookups: # only single-leaf trees
+                chunk_leaves.fill(np.iinfo(np.uint64).max)
+            for k, (table, rows) in enumerate(lookups):
+                np.take(table, rows[start:stop], axis=0, out=chunk_buffer if k else chunk_leaves)
+                if k:
+                    chunk_leaves &= chunk_buffer
+
+            if self.n_words > 1:
+                word = np.argmax(chunk_leaves != 0, axis=2)
+                bits = np.take_along_axis(chunk_leaves, word[..., None], axis=2)[..., 0]
+                offset = base + word * WORD_BITS
+            else:
+                bits, offset = chunk_leaves[..., 0], base
+            lowest = bits & (~bits + np.uint64(1))
+            values = self.leaf_values[(lowest.astype(np.float64).view(np.int64) >> 52) + offset]
+            # summed tree by tree, in the same order as LightGBM
+            out[start:stop] = np.add.accumulate(values, axis=1)[:, -1]
+        return out
+
+    def predict(self, X, chunk_size=None):
+        """
+        Predicts the raw scores of the booster.
+
+        Parameters
+        ----------
+        X : np.ndarray
+            The model features.
+        chunk_size : int, optional
+            The number of rows predicted together (default is None, see predict_rows).
+
+        Returns
+        -------
+        np.ndarray
+            The predictions, the sum of the leaf values as in LightGBM.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, the booster expects {self.n_features}")
+        lookups = [(table, self.feature_rows(feature, X[:, feature])) for feature, (_, _, table) in self.tables.items()]
+        return self.predict_rows(lookups, len(X), chunk_size)
+
+class CompiledPredictor:
+    """
+    A fitted LGBM pipeline compiled into a FeatureProjection and a CompiledForest, predicting
+    the same values without sklearn or LightGBM. The tables of the model features encoding one
+    categorical column (its one-hot columns or its codes) are AND-ed into one table indexed by
+    category, so each categorical column costs a single lookup per row.
+
+    Parameters
+    ----------
+    projection : FeatureProjection
+        The preprocessing of the pipeline.
+    forest : CompiledForest
+        The trees of the pipeline.
+    """
+    def __init__(self, projection, forest):
+        if len(projection.names) != forest.n_features:
+            raise ValueError(f"the preprocessing gives {len(projection.names)} features, the booster expects {forest.n_features}")
+        self.projection = projection
+        self.forest = forest
+
+        used = np.array(sorted(forest.tables), dtype=np.intp)
+        self.scaled = used[projection.kind[used] == SCALED]
+        self.category_tables = {}
+        for source, categories in enumerate(projection.categories):
+            features = used[(projection.kind[used] != SCALED) & (projection.source[used] == source)]
+            # one row per category, then one for unknown categories (code -1)
+            codes = np.append(np.arange(len(categories)), -1)
+            for j in features:
+                rows = forest.tables[j][2][forest.feature_rows(j, projection.category_values(j, codes))]
+                self.category_tables[source] = self.category_tables[source] & rows if source in self.category_tables else rows
+
+    def predict(self, X):
+        """
+        Predicts raw listings, as the pipeline's predict.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            The raw columns.
+
+        Returns
+        -------
+        np.ndarray
+            The predictions.
+        """
+        lookups = []
+        if len(self.scaled):
+            values = self.projection.scaled_values(X, self.scaled)
+            lookups += [(self.forest.tables[j][2], self.forest.feature_rows(j, values[:, i]))
+                        for i, j in enumerate(self.scaled)]
+        for source, table in self.category_tables.items():
+            codes = self.projection.category_codes(X, source)
+            lookups.append((table, np.where(codes < 0, len(table) - 1, codes)))
+        return self.forest.predict_rows(lookups, len(X))
+
+def compile_pipeline(pipe):
+    """
+    Compiles a fitted pipeline ending with an LGBMRegressor, e.g. the RFECV model.
+
+    Parameters
+    ----------
+    pipe : sklearn.Pipeline
+        The fitted pipeline.
+
+    Returns
+    -------
+    CompiledPredictor
+        The compiled pipeline.
+
+    Raises
+    ------
+    ValueError
+        If a step of the pipeline cannot be compiled.
+    """
+    *steps, (_, model) = pipe.steps
+    if not isinstance(model, LGBMRegressor):
+        raise ValueError(f"cannot compile a pipeline ending with {type(model).__name__}")
+    return CompiledPredictor(compile_preprocessing(steps), CompiledForest(flatten_trees(model.booster_)))
+
+def main():
+    """
+    Main function to compile the RFECV model and check it against the pipeline on the test set.
+    """
+    # Check files exist
+    files = [config.RFECV_PATH, config.X_TEST_DATA]
+    for f in files:
+        if not os.path.isfile(f):
+            print(f"Error no file: {f} ")
+            return  # exit function
+
+    X_test = load_frame(config.X_TEST_DATA, columns=MODEL_FEATURES)
+    pipe_rfecv = load_model(config.RFECV_PATH)
+
+    start = time.perf_counter()
+    compiled = compile_pipeline(pipe_rfecv)
+    compile_time = time.perf_counter() - start
+
+    difference = np.abs(compiled.predict(X_test) - pipe_rfecv.predict(X_test)).max()
+    print(f"Compiled {compiled.forest.n_trees} trees on {compiled.forest.n_features} features in {compile_time * 1000:.0f} ms")
+    print(f"Largest difference to the pipeline on the test set: {difference:.3g}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import numpy as np
+import time
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import KFold
+from src import config
+from src.profiling import profiled, record_cv
+
+def preprocess_fold(preprocessor, X, y, train, test):
+    """
+    Fits a copy of the preprocessor on the training part of a fold and transforms both parts. 
+
+    Parameters
+    ----------
+    preprocessor : sklearn transformer
+        The unfitted preprocessor.
+    X : pandas.DataFrame
+        The features.
+    y : np.ndarray
+        The target.
+    train : np.ndarray
+        The row indices of the training part.
+    test : np.ndarray
+        The row indices of the validation part.
+
+    Returns
+    -------
+    tuple
+        The transformed training features, training target, transformed validation features and validation target. 
+    """
+    preprocessor = clone(preprocessor)
+    X_train = preprocessor.fit_transform(X.iloc[train], y[train])
+    X_test = preprocessor.transform(X.iloc[test])
+    return X_train, y[train], X_test, y[test]
+
+def fit_and_score(estimator, X_train, y_train, X_test, y_test, return_train_score=True):
+    """
+    Fits a copy of the estimator on one preprocessed fold and scores it (R² for regressors). 
+
+    Parameters
+    ----------
+    estimator : sklearn estimator
+        The unfitted model.
+    X_train, y_train : np.ndarray
+        The preprocessed training features and target of the fold.
+    X_test, y_test : np.ndarray
+        The preprocessed validation features and target of the fold.
+    return_train_score : bool, optional
+        If True, the training score is also computed (default is True).
+
+    Returns
+    -------
+    dict
+        The fit_time, score_time, test_score and (optionally) train_score of the fold. 
+    """
+    estimator = clone(estimator)
+    start = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    test_score = estimator.score(X_test, y_test)
+    scores = {'fit_time': fit_time, 'score_time': time.perf_counter() - start, 'test_score': test_score}
+    if return_train_score:
+        scores['train_score'] = estimator.score(X_train, y_train)
+    return scores
+
+@profiled(rows=1)
+def cross_validate_models(estimators, X, y, preprocessor, cv=10, n_jobs=config.N_JOBS, return_train_score=True):
+    """
+    Cross-validates several models in one pass. The folds are built and preprocessed once, 
+    then every (model, fold) fit is run as a task on a pool of worker processes. 
+
+    The folds match those of sklearn's cross_validate for regressors (unshuffled KFold), so 
+    the scores are the same as cross-validating make_pipeline(preprocessor, model) per model. 
+    The fit_time excludes the shared preprocessing. 
+
+    Parameters
+    ----------
+    estimators : dict
+        The unfitted models keyed by name.
+    X : pandas.DataFrame
+        The features.
+    y : array-like
+        The target.
+    preprocessor : sklearn transformer
+        The unfitted preprocessor shared by all models.
+    cv : int, optional
+        The number of folds (default is 10).
+    n_jobs : int, optional
+        The number of worker processes, -1 uses all cores (default is config.N_JOBS).
+    return_train_score : bool, optional
+        If True, the training scores are also computed (default is True).
+
+    Returns
+    -------
+    dict
+        For each model, a dict of per-fold arrays in the format returned by cross_validate. 
+    """
+    y = np.asarray(y).ravel()
+    folds = list(KFold(n_splits=cv).split(X))
+    fold_data = Parallel(n_jobs=n_jobs)(
+        delayed(preprocess_fold)(preprocessor, X, y, train, test) for train, test in folds
+    )
+
+    tasks = [(name, n) for name in estimators for n in range(len(folds))]
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(fit_and_score)(estimators[name], *fold_data[n], return_train_score) for name, n in tasks
+    )
+
+    results = {name: {} for name in estimators}
+    for (name, n), fold_scores in zip(tasks, scores):
+        for key, value in fold_scores.items():
+            results[name].setdefault(key, []).append(value)
+    results = {name: {key: np.array(values) for key, values in result.items()} for name, result in results.items()}
+    for name, result in results.items():
+        record_cv(name, result)
+    return results
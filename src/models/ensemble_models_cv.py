@@ -2,14 +2,18 @@ import pandas as pd
 import joblib
 import os
 from src import config
-from sklearn.model_selection import cross_validate
-from sklearn.pipeline import make_pipeline
+from src.profiling import profiled
+from src.storage import load_frame
 from sklearn.ensemble import RandomForestRegressor
 from xgboost import XGBRegressor
 from lightgbm import LGBMRegressor
 
-from src.preprocessor import create_preprocessor
+from sklearn.pipeline import make_pipeline
+
+from src.preprocessor import create_preprocessor, create_tree_preprocessor, CategoricalCodes, MODEL_FEATURES
+from src.models.cv_engine import cross_validate_models
 
+@profiled(report=True)
 def main():
     """
     Main function to create the ensemble models. 
@@ -24,26 +28,31 @@ def main():
         return  # exit function
     
     # Load data
-    X_train = pd.read_csv(config.X_TRAIN_DATA)
-    y_train = pd.read_csv(config.Y_TRAIN_DATA)
+    X_train = load_frame(config.X_TRAIN_DATA, columns=MODEL_FEATURES)
+    y_train = load_frame(config.Y_TRAIN_DATA)
     y_train = y_train.values.ravel()
     
     preprocessor = create_preprocessor()   
 
-    # Train RF 
-    pipe_rf = make_pipeline(preprocessor, RandomForestRegressor(random_state=123, max_depth=10))
-    cv_rf = pd.DataFrame(cross_validate(pipe_rf, X_train, y_train, cv=10, return_train_score=True))
-    results_rf = {'Random Forest' : cv_rf.agg(['mean', 'std']).round(3).T}
-
-    # Train XGboost 
-    pipe_xgb = make_pipeline(preprocessor, XGBRegressor(random_state=123, verbosity=0, max_depth=3, gamma=3, learning_rate=0.3))
-    cv_xgb = pd.DataFrame(cross_validate(pipe_xgb, X_train, y_train, cv = 10, return_train_score = True))
-    results_xgb = {'XGBoost' : cv_xgb.agg(['mean', 'std']).round(3).T}
+    # Cross-validate RF, XGBoost and LGBM together, sharing the preprocessed folds
+    estimators = {
+        'Random Forest': RandomForestRegressor(random_state=123, max_depth=10),
+        'XGBoost': XGBRegressor(random_state=123, verbosity=0, max_depth=3, gamma=3, learning_rate=0.3, 
+                                enable_categorical=config.TREE_CATEGORICAL),
+        'LGBM': LGBMRegressor(random_state=123, verbosity = 0)
+    }
+    if config.TREE_CATEGORICAL:
+        # XGBoost and LGBM get integer-coded categoricals, RF keeps the one-hot encoding
+        boosters = {name: estimators.pop(name) for name in ['XGBoost', 'LGBM']}
+        tree_preprocessor = make_pipeline(create_tree_preprocessor(), CategoricalCodes())
+        cv_models = cross_validate_models(boosters, X_train, y_train, tree_preprocessor, cv=10, n_jobs=config.N_JOBS)
+        cv_models.update(cross_validate_models(estimators, X_train, y_train, preprocessor, cv=10, n_jobs=config.N_JOBS))
+    else:
+        cv_models = cross_validate_models(estimators, X_train, y_train, preprocessor, cv=10, n_jobs=config.N_JOBS)
 
-    # Train LGBM
-    pipe_lgbm = make_pipeline(preprocessor, LGBMRegressor(random_state=123, verbosity = 0))
-    cv_lgbm = pd.DataFrame(cross_validate(pipe_lgbm, X_train, y_train, cv = 10, return_train_score = True))
-    results_lgbm = {'LGBM' : cv_lgbm.agg(['mean', 'std']).round(3).T}
+    results_rf = {'Random Forest' : pd.DataFrame(cv_models['Random Forest']).agg(['mean', 'std']).round(3).T}
+    results_xgb = {'XGBoost' : pd.DataFrame(cv_models['XGBoost']).agg(['mean', 'std']).round(3).T}
+    results_lgbm = {'LGBM' : pd.DataFrame(cv_models['LGBM']).agg(['mean', 'std']).round(3).T}
 
     # Save results
     joblib.dump(results_rf, config.CV_RF_PATH)
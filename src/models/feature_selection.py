@@ -0,0 +1,292 @@
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, clone
+from sklearn.feature_selection import SelectorMixin
+from sklearn.linear_model import Lasso, lasso_path
+from sklearn.model_selection import KFold
+from src import config
+from src.profiling import profiled
+
+def gram_statistics(X, y):
+    """
+    Computes the sufficient statistics of a Lasso fit with intercept: the Gram matrix
+    and the correlations of the centered features and target. Removing features from the
+    model only selects rows and columns of these, so they are computed once per fold.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        The training features.
+    y : np.ndarray
+        The training target.
+
+    Returns
+    -------
+    dict
+        The centered features (X, Fortran ordered) and target (y), their means, the Gram
+        matrix (gram) and the feature-target correlations (Xy).
+    """
+    X_mean, y_mean = X.mean(axis=0), y.mean()
+    X_centered = np.asfortranarray(X - X_mean)
+    y_centered = y - y_mean
+    return {'X': X_centered, 'y': y_centered, 'X_mean': X_mean, 'y_mean': y_mean,
+            'gram': X_centered.T @ X_centered, 'Xy': X_centered.T @ y_centered}
+
+def fit_lasso(stats, features, alpha, coef_init=None, tol=1e-4, max_iter=1000):
+    """
+    Fits a Lasso on a subset of features from precomputed Gram statistics, starting from
+    the coefficients of a previous fit (warm start) when given.
+
+    Parameters
+    ----------
+    stats : dict
+        The output of gram_statistics.
+    features : np.ndarray
+        The indices of the features to fit on.
+    alpha : float
+        The Lasso regularization strength.
+    coef_init : np.ndarray, optional
+        The initial coefficients of the features (default is None, all zero).
+    tol : float, optional
+        The tolerance of the coordinate descent (default is 1e-4, as Lasso).
+    max_iter : int, optional
+        The maximum number of coordinate descent iterations (default is 1000, as Lasso).
+
+    Returns
+    -------
+    np.ndarray
+        The coefficients of the features.
+    """
+    gram = np.ascontiguousarray(stats['gram'][np.ix_(features, features)])
+    Xy = np.ascontiguousarray(stats['Xy'][features])
+    # the features are only used for their shape as the Gram matrix is given
+    _, coefs, _ = lasso_path(stats['X'][:, features], stats['y'], alphas=[alpha], precompute=gram, Xy=Xy,
+                             coef_init=coef_init, tol=tol, max_iter=max_iter, check_input=False)
+    return coefs[:, 0]
+
+def r2_from_statistics(stats, test_stats, features, coef):
+    """
+    Computes the R² on a validation fold of a Lasso fitted on the training fold, from the
+    Gram statistics of the validation fold centered on the training means.
+
+    Parameters
+    ----------
+    stats : dict
+        The output of gram_statistics for the training fold.
+    test_stats : dict
+        The output of validation_statistics for the validation fold.
+    features : np.ndarray
+        The indices of the features of the fit.
+    coef : np.ndarray
+        The coefficients of the features.
+
+    Returns
+    -------
+    float
+        The R² score.
+    """
+    # features with a zero coefficient are left out, so that removing them gives exactly the same score
+    nonzero = coef != 0
+    features, coef = features[nonzero], coef[nonzero]
+    sse = (coef @ test_stats['gram'][np.ix_(features, features)] @ coef
+           - 2 * coef @ test_stats['Xy'][features] + test_stats['yy'])
+    return 1 - sse / test_stats['sst']
+
+def validation_statistics(stats, X, y):
+    """
+    Computes the statistics of a validation fold needed by r2_from_statistics.
+
+    Parameters
+    ----------
+    stats : dict
+        The output of gram_statistics for the training fold.
+    X : np.ndarray
+        The validation features.
+    y : np.ndarray
+        The validation target.
+
+    Returns
+    -------
+    dict
+        The Gram matrix (gram), feature-target correlations (Xy) and squared norm (yy) of
+        the validation fold centered on the training means, and its total sum of squares (sst).
+    """
+    X_centered = X - stats['X_mean']
+    y_centered = y - stats['y_mean']
+    return {'gram': X_centered.T @ X_centered, 'Xy': X_centered.T @ y_centered,
+            'yy': y_centered @ y_centered, 'sst': np.sum((y - y.mean()) ** 2)}
+
+def eliminate_features(stats, alpha, step, n_features_to_select, test_stats=None):
+    """
+    Recursively removes the features with the smallest squared Lasso coefficients until
+    n_features_to_select remain, as RFE does, warm starting each fit from the previous one.
+
+    Parameters
+    ----------
+    stats : dict
+        The output of gram_statistics.
+    alpha : float
+        The Lasso regularization strength.
+    step : int
+        The number of features removed at each iteration.
+    n_features_to_select : int
+        The number of features to keep.
+    test_stats : dict, optional
+        The output of validation_statistics, to score every iteration (default is None).
+
+    Returns
+    -------
+    tuple
+        The support mask, the ranking of the features and the validation scores from
+        all features down to n_features_to_select (empty if test_stats is None).
+    """
+    n_features = stats['gram'].shape[0]
+    support = np.ones(n_features, dtype=bool)
+    ranking = np.ones(n_features, dtype=int)
+    coef = np.zeros(n_features)
+    scores = []
+    refit = True
+
+    while np.sum(support) > n_features_to_select:
+        features = np.arange(n_features)[support]
+        if refit:
+            coef[features] = fit_lasso(stats, features, alpha, coef_init=coef[features])
+        ranks = np.argsort(coef[features] ** 2)
+
+        threshold = min(step, np.sum(support) - n_features_to_select)
+        if test_stats is not None:
+            scores.append(r2_from_statistics(stats, test_stats, features, coef[features]))
+        eliminated = features[ranks][:threshold]
+        support[eliminated] = False
+        ranking[np.logical_not(support)] += 1
+        # removing features with a zero coefficient leaves the Lasso solution unchanged
+        refit = np.any(coef[eliminated] != 0)
+
+    if test_stats is not None:
+        features = np.arange(n_features)[support]
+        if refit:
+            coef[features] = fit_lasso(stats, features, alpha, coef_init=coef[features])
+        scores.append(r2_from_statistics(stats, test_stats, features, coef[features]))
+    return support, ranking, scores
+
+def fold_scores(X, y, train, test, alpha, step, min_features_to_select):
+    """
+    Runs the feature elimination on the training part of a fold and scores every
+    iteration on its validation part.
+
+    Returns
+    -------
+    list
+        The validation R² from all features down to min_features_to_select.
+    """
+    stats = gram_statistics(X[train], y[train])
+    test_stats = validation_statistics(stats, X[test], y[test])
+    return eliminate_features(stats, alpha, step, min_features_to_select, test_stats)[2]
+
+class LassoRFECV(SelectorMixin, BaseEstimator):
+    """
+    Recursive feature elimination with cross-validated selection of the number of features,
+    giving the same selection as RFECV(Lasso(alpha)) with the default KFold and R² scoring.
+
+    Each Lasso fit of the elimination reuses the Gram matrix of its fold and warm starts
+    from the previous fit, and the validation R² of each iteration is computed from the
+    Gram matrix of the validation fold, so no fit ever touches the raw rows. The folds
+    are run in parallel.
+
+    Parameters
+    ----------
+    alpha : float, optional
+        The Lasso regularization strength (default is 1.0).
+    step : int or float, optional
+        The number (>= 1) or share (< 1) of features removed at each iteration (default is 1).
+    cv : int, optional
+        The number of folds (default is 5).
+    min_features_to_select : int, optional
+        The minimum number of features to keep (default is 1).
+    n_jobs : int, optional
+        The number of worker processes over the folds, -1 uses all cores (default is config.N_JOBS).
+    """
+    def __init__(self, alpha=1.0, step=1, cv=5, min_features_to_select=1, n_jobs=config.N_JOBS):
+        self.alpha = alpha
+        self.step = step
+        self.cv = cv
+        self.min_features_to_select = min_features_to_select
+        self.n_jobs = n_jobs
+
+    @profiled(rows=1)
+    def fit(self, X, y):
+        X, y = self._validate_data(X, y, ensure_min_features=2, dtype=np.float64, y_numeric=True)
+        n_features = X.shape[1]
+        step = int(max(1, self.step * n_features)) if 0.0 < self.step < 1.0 else int(self.step)
+
+        folds = KFold(n_splits=self.cv).split(X)
+        scores = np.array(Parallel(n_jobs=self.n_jobs)(
+            delayed(fold_scores)(X, y, train, test, self.alpha, step, self.min_features_to_select)
+            for train, test in folds
+        ))
+
+        # the smallest number of features with the best mean score, as RFECV
+        scores_sum = np.sum(scores, axis=0)
+        argmax_idx = len(scores_sum) - np.argmax(scores_sum[::-1]) - 1
+        n_features_to_select = max(n_features - (argmax_idx * step), self.min_features_to_select)
+
+        self.support_, self.ranking_, _ = eliminate_features(gram_statistics(X, y), self.alpha, step, n_features_to_select)
+        self.n_features_ = self.support_.sum()
+        self.estimator_ = Lasso(alpha=self.alpha).fit(X[:, self.support_], y)
+
+        scores_rev = scores[:, ::-1]
+        self.cv_results_ = {'mean_test_score': np.mean(scores_rev, axis=0), 'std_test_score': np.std(scores_rev, axis=0)}
+        for i in range(scores.shape[0]):
+            self.cv_results_[f'split{i}_test_score'] = scores_rev[i]
+        return self
+
+    def _get_support_mask(self):
+        return self.support_
+
+class PassthroughSelector(SelectorMixin, BaseEstimator):
+    """
+    Runs a feature selector on all the columns of a dataframe except the passthrough ones,
+    which are always kept, e.g. the integer category codes of the tree preprocessor, whose
+    linear coefficients have no meaning. The columns keep their order.
+
+    Parameters
+    ----------
+    selector : SelectorMixin
+        The feature selector (e.g. LassoRFECV), cloned and fitted on the other columns.
+    passthrough : list of str
+        The columns always kept.
+    """
+    def __init__(self, selector, passthrough):
+        self.selector = selector
+        self.passthrough = passthrough
+
+    def fit(self, X, y):
+        """
+        Fits the selector on the columns not passed through.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The preprocessed training data.
+        y : array-like
+            The training target.
+
+        Returns
+        -------
+        PassthroughSelector
+            The fitted selector.
+        """
+        kept = np.isin(X.columns, self.passthrough)
+        self.selector_ = clone(self.selector).fit(X.loc[:, ~kept], y)
+        self.support_ = kept.copy()
+        self.support_[~kept] = self.selector_.get_support()
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def _get_support_mask(self):
+        return self.support_
+
+    def _more_tags(self):
+        # unseen categories are coded as NaN in the passthrough columns
+        return {'allow_nan': True}
@@ -2,11 +2,14 @@ import pandas as pd
 import joblib
 import os
 from src import config
+from src.profiling import profiled, record_cv
+from src.artifacts import save_model
+from src.storage import load_frame
 from sklearn.model_selection import cross_validate
-from sklearn.pipeline import make_pipeline
 from sklearn.linear_model import Ridge
-from src.preprocessor import create_preprocessor
+from src.preprocessor import create_preprocessor, make_cached_pipeline, reduce_transformer_cache, MODEL_FEATURES
 
+@profiled(report=True)
 def main():
     """
     Main function to develop and train the linear model. 
@@ -21,12 +24,12 @@ def main():
         return  # exit function
     
     # load data
-    X_train = pd.read_csv(config.X_TRAIN_DATA)
-    y_train = pd.read_csv(config.Y_TRAIN_DATA)
+    X_train = load_frame(config.X_TRAIN_DATA, columns=MODEL_FEATURES)
+    y_train = load_frame(config.Y_TRAIN_DATA)
     
     # train model
     preprocessor = create_preprocessor()
-    pipe_ridge = make_pipeline(preprocessor, Ridge())
+    pipe_ridge = make_cached_pipeline(preprocessor, Ridge())
 
     cv_ridge = pd.DataFrame(cross_validate(pipe_ridge, 
                                         X_train, 
@@ -35,6 +38,7 @@ def main():
                                         return_train_score=True, cv=10))
 
  
+    record_cv('Ridge', cv_ridge)
     cv_results = {'Ridge': cv_ridge.agg(['mean', 'std']).round(3).T}
     print(cv_results)
     
@@ -42,7 +46,8 @@ def main():
 
     # save results
     joblib.dump(cv_results, config.CV_LINEAR_PATH)
-    joblib.dump(pipe_ridge, config.LINEAR_PATH) 
+    save_model(pipe_ridge.set_params(memory=None), config.LINEAR_PATH) 
+    reduce_transformer_cache()
 
 if __name__ == "__main__":
     os.makedirs(config.RESULTS_OUTPUT_DIR, exist_ok=True)
@@ -2,25 +2,32 @@ import pandas as pd
 import joblib
 import os
 from src import config
+from src.profiling import profiled, record_cv
+from src.artifacts import save_model
+from src.storage import load_frame
 from sklearn.model_selection import cross_validate
-from sklearn.pipeline import make_pipeline
 from sklearn.feature_selection import SelectFromModel, RFECV
 from sklearn.linear_model import Lasso
+from src.models.feature_selection import LassoRFECV, PassthroughSelector
 from lightgbm import LGBMRegressor
+from sklearn.pipeline import make_pipeline
 
-from src.preprocessor import create_preprocessor
+from src.preprocessor import create_preprocessor, create_tree_preprocessor, CategoricalCodes, make_cached_pipeline, reduce_transformer_cache, MODEL_FEATURES, TREE_CATEGORICAL_FEATURES
 
 
-def rfecv_model_development(X_train, y_train): 
+def create_rfecv_pipeline(cache=True):
     """
-    This function trains the rfecv model and provides the cross-validation results. 
-    
+    Creates the unfitted RFECV model: the preprocessor, the feature selection and the LGBM regressor. 
+
+    Parameters
+    ----------
+    cache : bool, optional
+        If True, the fitted transformers are cached on disk (see make_cached_pipeline) (default is True).
+
     Returns
-    -------   
-    tuple
-        A tuple containing: 
-        - the cross-validation results (dict) 
-        - the trained rfecv model (scikit-learn Pipeline object)
+    -------
+    sklearn.Pipeline
+        The rfecv model. 
     """
     # hyperparameters
     alpha = 0.001
@@ -30,31 +37,58 @@ def rfecv_model_development(X_train, y_train):
     reg_l = 100
 
     # model
+    lgbm = LGBMRegressor(random_state=123, 
+                         verbosity = 0, 
+                         learning_rate=lr, 
+                         max_depth=max_depth, 
+                         num_leaves=num_leaves, 
+                         reg_lambda=reg_l)
+
+    if config.FAST_RFECV:
+        rfecv = LassoRFECV(alpha=alpha, step=config.RFECV_STEP, n_jobs=config.N_JOBS)
+    else:
+        rfecv = RFECV(Lasso(alpha=alpha), step=config.RFECV_STEP, n_jobs=config.N_JOBS)
+
+    pipeline = make_cached_pipeline if cache else make_pipeline
+    if config.TREE_CATEGORICAL:
+        # the Lasso only ranks the numeric columns, the category codes are always kept for LGBM. 
+        # The selector returns the codes as floats, so the category dtype is set after it
+        preprocessor = create_tree_preprocessor()
+        selector = PassthroughSelector(rfecv, TREE_CATEGORICAL_FEATURES)
+        return pipeline(preprocessor, selector.set_output(transform='pandas'), CategoricalCodes(), lgbm)
     preprocessor = create_preprocessor()
-    rfecv = RFECV(Lasso(alpha=alpha))
-
-    pipe_rfecv = make_pipeline(
-        preprocessor, rfecv, LGBMRegressor(random_state=123, 
-                                           verbosity = 0, 
-                                           learning_rate=lr, 
-                                           max_depth=max_depth, 
-                                           num_leaves=num_leaves, 
-                                           reg_lambda=reg_l)
-    )
+    return pipeline(preprocessor, rfecv, lgbm)
+
+@profiled(rows=0)
+def rfecv_model_development(X_train, y_train): 
+    """
+    This function trains the rfecv model and provides the cross-validation results. 
+    
+    Returns
+    -------   
+    tuple
+        A tuple containing: 
+        - the cross-validation results (dict) 
+        - the trained rfecv model (scikit-learn Pipeline object)
+    """
+    pipe_rfecv = create_rfecv_pipeline()
     
     # obtain cv results 
     cv_rfecv = pd.DataFrame(cross_validate(pipe_rfecv, 
                                             X_train, 
                                             y_train,
                                             cv = 10, 
+                                            n_jobs = config.N_JOBS,
                                             return_train_score = True))
+    record_cv('RFECV', cv_rfecv)
     cv_results = {'RFECV' : cv_rfecv.agg(['mean', 'std']).round(3).T}
     print(cv_results)
     
     # fit entire training set 
     pipe_rfecv.fit(X_train, y_train)
 
-    return (cv_results, pipe_rfecv, preprocessor)
+    # the pipeline fits a copy of the preprocessor, so return the fitted one
+    return (cv_results, pipe_rfecv, pipe_rfecv.named_steps['columntransformer'])
 
 def rfecv_feature_importances(model_rfecv, preprocessor, X_train):
     """
@@ -65,7 +99,7 @@ def rfecv_feature_importances(model_rfecv, preprocessor, X_train):
     pd.DataFrame
         A pandas dataframe containing the selected features and their importances. 
     """
-    rfecv_fs = model_rfecv.named_steps["rfecv"]
+    rfecv_fs = model_rfecv.steps[1][1] # the selector follows the preprocessor (RFECV, LassoRFECV or PassthroughSelector)
     selected_features_mask = rfecv_fs.support_
 
     # features names after preprocessing
@@ -90,6 +124,7 @@ def rfecv_feature_importances(model_rfecv, preprocessor, X_train):
                             ).sort_values(by='Importance', ascending=False)
     return feat_imp_df, selected_features_mask, selected_features
 
+@profiled(report=True)
 def main():
     """
     Main function to ochestrate training of the RFECV model and identifying feature importances.    
@@ -102,8 +137,8 @@ def main():
             return  # exit function
     
     # Load data
-    X_train = pd.read_csv(config.X_TRAIN_DATA)
-    y_train = pd.read_csv(config.Y_TRAIN_DATA)
+    X_train = load_frame(config.X_TRAIN_DATA, columns=MODEL_FEATURES)
+    y_train = load_frame(config.Y_TRAIN_DATA)
     y_train = y_train.values.ravel()
 
     # create and train RFECV model 
@@ -113,10 +148,11 @@ def main():
     feat_imp_df, selected_features_mask, selected_features = rfecv_feature_importances(model_rfecv, preprocessor, X_train)
 
     # Save model, cv results, feature importances 
-    joblib.dump(model_rfecv, config.RFECV_PATH)
+    save_model(model_rfecv.set_params(memory=None), config.RFECV_PATH)
     joblib.dump(cv_results, config.CV_RFECV_PATH)
     feat_imp_df.to_csv(config.FEAT_IMP_PATH, index=False)
     joblib.dump((selected_features_mask, selected_features), config.SELECTED_FEAT_PATH)
+    reduce_transformer_cache()
 
 if __name__ == "__main__":
     os.makedirs(config.RESULTS_OUTPUT_DIR, exist_ok=True)
@@ -0,0 +1,175 @@
+import pandas as pd
+import lightgbm
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import RandomizedSearchCV, HalvingRandomSearchCV, train_test_split
+from xgboost import XGBRegressor
+from lightgbm import LGBMRegressor
+from src import config
+
+class EarlyStoppingRegressor(BaseEstimator, RegressorMixin):
+    """
+    Wraps an XGBoost or LGBM regressor so that it holds out part of its training data
+    and stops adding trees once the validation error stops improving. n_estimators of
+    the wrapped model becomes an upper bound on the number of trees.
+
+    Parameters
+    ----------
+    estimator : XGBRegressor or LGBMRegressor
+        The boosting model to fit.
+    early_stopping_rounds : int, optional
+        The number of rounds without improvement before stopping (default is config.EARLY_STOPPING_ROUNDS).
+    validation_fraction : float, optional
+        The share of the training data held out for early stopping (default is config.EARLY_STOPPING_FRACTION).
+    random_state : int, optional
+        The seed of the held-out split (default is 123).
+    """
+    def __init__(self, estimator, early_stopping_rounds=config.EARLY_STOPPING_ROUNDS,
+                 validation_fraction=config.EARLY_STOPPING_FRACTION, random_state=123):
+        self.estimator = estimator
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """
+        Fits a clone of the wrapped model on the training data without the held-out share,
+        stopping when the error on the held-out share has not improved for
+        early_stopping_rounds rounds.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame or np.ndarray
+            The training features.
+        y : array-like
+            The training target.
+
+        Returns
+        -------
+        EarlyStoppingRegressor
+            The fitted regressor, with the number of trees kept in best_iteration_.
+
+        Raises
+        ------
+        TypeError
+            If the wrapped model is not an XGBRegressor or LGBMRegressor.
+        """
+        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=self.validation_fraction,
+                                                          random_state=self.random_state)
+        self.estimator_ = clone(self.estimator)
+        if isinstance(self.estimator_, XGBRegressor):
+            self.estimator_.set_params(early_stopping_rounds=self.early_stopping_rounds)
+            self.estimator_.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+            self.best_iteration_ = self.estimator_.best_iteration + 1
+        elif isinstance(self.estimator_, LGBMRegressor):
+            self.estimator_.fit(X_train, y_train, eval_set=[(X_val, y_val)],
+                                callbacks=[lightgbm.early_stopping(self.early_stopping_rounds, verbose=False)])
+            self.best_iteration_ = self.estimator_.best_iteration_
+        else:
+            raise TypeError(f"Early stopping is not supported for {type(self.estimator).__name__}")
+        return self
+
+    def predict(self, X):
+        """
+        Predicts with the early-stopped model, using its best iteration.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame or np.ndarray
+            The features.
+
+        Returns
+        -------
+        np.ndarray
+            The predictions.
+        """
+        return self.estimator_.predict(X)
+
+def early_stopping_params(param_dist, step_name):
+    """
+    Renames a search space written for a plain model step so that it applies to the
+    model wrapped by EarlyStoppingRegressor.
+
+    Parameters
+    ----------
+    param_dist : dict
+        The search space keyed by '<step_name>__<param>'.
+    step_name : str
+        The pipeline step name of the plain model, e.g. 'xgbregressor'.
+
+    Returns
+    -------
+    dict
+        The search space keyed by 'earlystoppingregressor__estimator__<param>'.
+    """
+    return {key.replace(f'{step_name}__', 'earlystoppingregressor__estimator__', 1): value
+            for key, value in param_dist.items()}
+
+def make_search(pipe, param_dist, n_iter, cv, mode=config.SEARCH_MODE, **kwargs):
+    """
+    Creates the hyperparameter search for a pipeline. 'random' evaluates every candidate
+    on the full training data, 'halving' evaluates all candidates on a small sample and
+    keeps the best third at each round while the sample size triples.
+
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        The pipeline to tune.
+    param_dist : dict
+        The search space.
+    n_iter : int
+        The number of candidates to sample.
+    cv : int
+        The number of cross-validation folds.
+    mode : str, optional
+        Either 'random' or 'halving' (default is config.SEARCH_MODE).
+    **kwargs
+        Further arguments passed to the search, e.g. verbose.
+
+    Returns
+    -------
+    RandomizedSearchCV or HalvingRandomSearchCV
+        The unfitted search.
+    """
+    if mode == 'random':
+        return RandomizedSearchCV(estimator=pipe, param_distributions=param_dist, n_iter=n_iter,
+                                  scoring='r2', cv=cv, n_jobs=-1, random_state=123, return_train_score=True, **kwargs)
+    if mode == 'halving':
+        return HalvingRandomSearchCV(estimator=pipe, param_distributions=param_dist, n_candidates=n_iter,
+                                     resource='n_samples', min_resources='exhaust', factor=3, scoring='r2', cv=cv,
+                                     n_jobs=-1, random_state=123, return_train_score=True, **kwargs)
+    raise ValueError(f"Unknown search mode: {mode}")
+
+def search_results(search):
+    """
+    Extracts the cross-validation scores of the best candidate of a fitted search.
+
+    Parameters
+    ----------
+    search : RandomizedSearchCV or HalvingRandomSearchCV
+        The fitted search.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The mean and std of the test and train scores of the best candidate.
+    """
+    best_results = pd.DataFrame(search.cv_results_).loc[search.best_index_]
+    return pd.DataFrame({
+        'mean': [best_results['mean_test_score'], best_results['mean_train_score']],
+        'std': [best_results['std_test_score'], best_results['std_train_score']]
+    }, index=['test_score', 'train_score']).round(3)
+
+def print_best_params(search):
+    """
+    Prints the best hyperparameters of a fitted search without their pipeline prefixes.
+
+    Parameters
+    ----------
+    search : RandomizedSearchCV or HalvingRandomSearchCV
+        The fitted search.
+    """
+    print("Best Hyperparameters:")
+    for param, value in search.best_params_.items():
+        param_name = param.rsplit('__', 1)[-1]
+        print(f" - {param_name}: {value}")
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import glob
+import os
+import re
+import time
+from joblib import Parallel, delayed
+from src import config
+from src.profiling import profiled
+from src.clean_and_engineer import clean_listings, engineer_features
+from src.storage import load_frame, write_frame
+
+def city_name(path):
+    """
+    Derives the city name from a raw listings file name, e.g. 'AB_NYC_2019.csv' -> 'nyc'. 
+
+    Parameters
+    ----------
+    path : str
+        The path to the raw listings file.
+
+    Returns
+    -------
+    str
+        The lower case city name. 
+    """
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    name = re.sub(r'^ab_', '', name)
+    name = re.sub(r'_\d{4}$', '', name)
+    return name
+
+def city_files(pattern):
+    """
+    Lists the raw listings files matching a directory or glob pattern. 
+
+    Parameters
+    ----------
+    pattern : str
+        A directory containing one CSV per city, or a glob pattern.
+
+    Returns
+    -------
+    list
+        The sorted file paths. 
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(glob.glob(pattern))
+
+@profiled
+def clean_and_engineer_city(path, output_dir, reference_date=None):
+    """
+    Cleans one city's raw listings, engineers the features using that city's center and 
+    reference date and writes the result to the city's partition of the output dataset. 
+
+    Parameters
+    ----------
+    path : str
+        The path to the city's raw listings.
+    output_dir : str
+        The root directory of the partitioned dataset.
+    reference_date : str or datetime, optional
+        The date used for 'days_since_last_review' (default is the city's date in 
+        config.CITY_REFERENCE_DATES, or else its latest review).
+
+    Returns
+    -------
+    tuple
+        The city name, number of listings written and the seconds taken. 
+    """
+    start = time.perf_counter()
+    city = city_name(path)
+    df = clean_listings(load_frame(path))
+
+    center = config.CITY_CENTERS.get(city)
+    if center is None:
+        # no known center, fall back to the median listing location
+        center = (float(np.median(df['latitude'])), float(np.median(df['longitude'])))
+        print(f"No center configured for '{city}', using the median listing location {center}")
+
+    if reference_date is None:
+        reference_date = config.CITY_REFERENCE_DATES.get(city)
+    if reference_date is None:
+        # no known scrape date, fall back to the latest review (listings without reviews are dated 1900-01-01)
+        reviewed = df['last_review'][df['last_review'] != pd.Timestamp('1900-01-01')]
+        reference_date = reviewed.max() if len(reviewed) else config.REFERENCE_DATE
+        print(f"No reference date configured for '{city}', using the latest review {pd.Timestamp(reference_date).date()}")
+
+    # anchors are city specific, so only the distance to the center is computed
+    df = engineer_features(df, reference_date, center=center, anchors={})
+
+    partition_dir = os.path.join(output_dir, f'city={city}')
+    os.makedirs(partition_dir, exist_ok=True)
+    write_frame(df, os.path.join(partition_dir, f'part-0.{config.DATA_FORMAT}'))
+    return city, len(df), time.perf_counter() - start
+
+@profiled(report=True)
+def main(pattern=config.RAW_CITY_DATA, output_dir=config.CITY_FEAT_ENG_DIR, n_jobs=config.N_JOBS):
+    """
+    Main function to clean and engineer the features of many cities in parallel, writing a 
+    dataset partitioned by city (e.g. output_dir/city=nyc/part-0.parquet). 
+
+    Parameters
+    ----------
+    pattern : str, optional
+        A directory or glob of raw listings files, one per city (default is config.RAW_CITY_DATA).
+    output_dir : str, optional
+        The root directory of the partitioned dataset (default is config.CITY_FEAT_ENG_DIR).
+    n_jobs : int, optional
+        The number of worker processes, -1 uses all cores (default is config.N_JOBS).
+    """
+    files = city_files(pattern)
+    if not files:
+        print(f"Error: no raw listings files match {pattern}")
+        return  # exit function
+
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_jobs)(delayed(clean_and_engineer_city)(f, output_dir) for f in files)
+    for city, n_rows, seconds in results:
+        print(f"{city}: {n_rows} listings in {seconds:.2f}s")
+    print(f"Processed {len(files)} cities in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    os.makedirs(config.CITY_FEAT_ENG_DIR, exist_ok=True)
+    main()
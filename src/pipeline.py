@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import os
+import runpy
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src import config
+from src.profiling import profiled
+from src.storage import file_hash
+
+Stage = namedtuple('Stage', ['module', 'inputs', 'outputs', 'params', 'code'])
+
+X_Y_TRAIN = [config.X_TRAIN_DATA, config.Y_TRAIN_DATA]
+X_Y_TEST = [config.X_TEST_DATA, config.Y_TEST_DATA]
+DATA_CODE = ['src/storage.py']
+MODEL_CODE = ['src/storage.py', 'src/preprocessor.py', 'src/spatial_features.py', 'src/artifacts.py']
+
+# Every stage of the analysis with the files it reads and writes, the config values it 
+# depends on and the source files whose changes should make it rerun 
+STAGES = {
+    'eda_plots': Stage('src.eda_plots', [config.RAW_DATA], 
+        [config.CAT_BAR_PATH, config.NUM_DENSITY_PATH, config.TAR_DIST_PATH, 
+         config.TAR_CAT_PATH, config.TAR_NUM_PATH, config.CORR_PATH], 
+        ['EDA_AGGREGATE', 'EDA_SAMPLE_ROWS', 'CORR_CHUNKSIZE'], DATA_CODE + ['src/correlations.py', 'src/render.py']),
+    'clean_and_engineer': Stage('src.clean_and_engineer', [config.RAW_DATA], 
+        [config.FEAT_ENG_DATA], 
+        ['DATA_FORMAT', 'CLEAN_CHUNKSIZE', 'INCREMENTAL_FEATURES', 'REFERENCE_DATE', 'CITY_CENTER', 'DISTANCE_ANCHORS'], 
+        DATA_CODE),
+    'updated_correlations': Stage('src.updated_correlations', [config.FEAT_ENG_DATA], 
+        [config.CORR_UPDATED_PATH], 
+        ['CORR_CHUNKSIZE'], DATA_CODE + ['src/eda_plots.py', 'src/correlations.py', 'src/render.py']),
+    'transform_split': Stage('src.transform_split', [config.FEAT_ENG_DATA], 
+        X_Y_TRAIN + X_Y_TEST, 
+        ['DATA_FORMAT', 'SPLIT_MODE', 'SPLIT_CHUNKSIZE'], DATA_CODE),
+    'baseline': Stage('src.models.baseline', X_Y_TRAIN, 
+        [config.DUMMY_PATH, config.CV_DUMMY_PATH], 
+        ['SPATIAL_FEATURES', 'MODEL_COMPRESS'], MODEL_CODE),
+    'linear': Stage('src.models.linear', X_Y_TRAIN, 
+        [config.LINEAR_PATH, config.CV_LINEAR_PATH], 
+        ['SPATIAL_FEATURES', 'MODEL_COMPRESS'], MODEL_CODE),
+    'rfecv': Stage('src.models.rfecv', X_Y_TRAIN, 
+        [config.RFECV_PATH, config.CV_RFECV_PATH, config.FEAT_IMP_PATH, config.SELECTED_FEAT_PATH], 
+        ['SPATIAL_FEATURES', 'TREE_CATEGORICAL', 'FAST_RFECV', 'RFECV_STEP', 'MODEL_COMPRESS'], 
+        MODEL_CODE + ['src/models/feature_selection.py']),
+    'ensemble_models_cv': Stage('src.models.ensemble_models_cv', X_Y_TRAIN, 
+        [config.CV_RF_PATH, config.CV_XGB_PATH, config.CV_LGBM_PATH], 
+        ['SPATIAL_FEATURES', 'TREE_CATEGORICAL'], MODEL_CODE + ['src/models/cv_engine.py']),
+    'ensemble_models_tuned': Stage('src.models.ensemble_models_tuned', X_Y_TRAIN, 
+        [config.CV_RF_TUNED_PATH, config.CV_XGB_TUNED_PATH, config.CV_LGBM_TUNED_PATH], 
+        ['SPATIAL_FEATURES', 'TREE_CATEGORICAL', 'SEARCH_MODE', 'EARLY_STOPPING_ROUNDS', 'EARLY_STOPPING_FRACTION'], 
+        MODEL_CODE + ['src/models/search.py']),
+    'evaluate': Stage('src.evaluate', X_Y_TEST + list(config.EVAL_MODELS.values()), 
+        [config.FINAL_R2_PATH, config.MAE_PATH, config.EVAL_REPORT_PATH], 
+        ['EVAL_MODELS', 'BOOTSTRAP_RESAMPLES', 'BOOTSTRAP_CONFIDENCE', 'BOOTSTRAP_SEED'], DATA_CODE + ['src/artifacts.py']),
+    'shap_values': Stage('src.shap_values', X_Y_TEST + [config.RFECV_PATH, config.SELECTED_FEAT_PATH], 
+        [config.SHAP_SUM_PATH, config.SHAP_LESS_PATH, config.SHAP_GR_PATH], 
+        ['SHAP_MAX_ROWS', 'SHAP_SEED'], DATA_CODE + ['src/artifacts.py']),
+}
+
+# The stages run by default (the main pipeline, as in `make all`)
+DEFAULT_TARGETS = ['eda_plots', 'updated_correlations', 'evaluate', 'shap_values']
+
+STATE_PATH = os.path.join(config.DATA_OUTPUT_DIR, 'pipeline_state.json')
+
+def stage_fingerprint(stage):
+    """
+    Computes the fingerprint of a stage from the hashes of its inputs, its code and its parameters. 
+
+    Parameters
+    ----------
+    stage : Stage
+        The stage.
+
+    Returns
+    -------
+    str
+        The fingerprint. 
+    """
+    module_file = '/'.join(stage.module.split('.')) + '.py'
+    code = [module_file] + list(stage.code)
+    fingerprint = {
+        'inputs': {path: file_hash(path) for path in stage.inputs},
+        'code': {path: file_hash(os.path.join(config.ROOT_DIR, path)) for path in code},
+        'params': {name: repr(getattr(config, name)) for name in stage.params},
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+def dependencies(stages):
+    """
+    Identifies the stages each stage depends on, i.e. the stages producing its inputs. 
+
+    Parameters
+    ----------
+    stages : dict
+        The stages keyed by name.
+
+    Returns
+    -------
+    dict
+        The set of upstream stage names for each stage. 
+    """
+    producers = {output: name for name, stage in stages.items() for output in stage.outputs}
+    return {name: {producers[path] for path in stage.inputs if path in producers} for name, stage in stages.items()}
+
+def required_stages(targets, deps):
+    """
+    Collects the target stages and all of the stages upstream of them. 
+
+    Parameters
+    ----------
+    targets : list
+        The names of the target stages.
+    deps : dict
+        The upstream stages of each stage.
+
+    Returns
+    -------
+    set
+        The names of the stages to consider. 
+    """
+    required = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in required:
+            required.add(name)
+            pending.extend(deps[name])
+    return required
+
+def run_stage(module):
+    """
+    Runs a stage's module as if called with `python -m <module>`, in a worker process. 
+
+    Parameters
+    ----------
+    module : str
+        The module name.
+
+    Returns
+    -------
+    float
+        The wall time of the stage in seconds. 
+
+    Raises
+    ------
+    RuntimeError
+        If the stage exits with a non-zero status (e.g. sys.exit(1) or an argparse error), 
+        so the runner marks it failed instead of stopping. 
+    """
+    start = time.perf_counter()
+    try:
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"{module} exited with status {e.code}") from None
+    return time.perf_counter() - start
+
+@profiled
+def run_pipeline(targets=DEFAULT_TARGETS, jobs=config.N_JOBS, force=False, stages=STAGES):
+    """
+    Runs the target stages and their upstream stages, running independent stages in parallel 
+    worker processes and skipping stages whose inputs, code and parameters are unchanged. 
+
+    Parameters
+    ----------
+    targets : list, optional
+        The names of the stages to bring up to date (default is DEFAULT_TARGETS).
+    jobs : int, optional
+        The number of worker processes, -1 uses all cores (default is config.N_JOBS).
+    force : bool, optional
+        If True, every required stage is rerun (default is False).
+    stages : dict, optional
+        The stages keyed by name (default is STAGES).
+
+    Returns
+    -------
+    dict
+        The (status, seconds) of each required stage. 
+    """
+    deps = dependencies(stages)
+    pending = required_stages(targets, deps)
+    state = {}
+    if os.path.isfile(STATE_PATH) and not force:
+        with open(STATE_PATH) as f:
+            state = json.load(f)
+
+    jobs = os.cpu_count() if jobs == -1 else jobs
+    summary = {}
+    running = {}
+    fingerprints = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            # schedule every stage whose upstream stages have finished
+            for name in sorted(pending):
+                if deps[name] & (pending | set(running.values())):
+                    continue
+                pending.discard(name)
+                if any(summary[dep][0] in ('failed', 'blocked') for dep in deps[name]):
+                    summary[name] = ('blocked', 0.0)
+                    continue
+                stage = stages[name]
+                fingerprints[name] = stage_fingerprint(stage)
+                if state.get(name) == fingerprints[name] and all(os.path.isfile(path) for path in stage.outputs):
+                    summary[name] = ('skipped', 0.0)
+                    continue
+                print(f"Running {name}")
+                running[pool.submit(run_stage, stage.module)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    print(f"Error in {name}: {e!r}")
+                    summary[name] = ('failed', 0.0)
+                    continue
+                if not all(os.path.isfile(path) for path in stages[name].outputs):
+                    print(f"Error: {name} did not produce all of its outputs")
+                    summary[name] = ('failed', seconds)
+                    continue
+                state[name] = fingerprints[name]
+                summary[name] = ('ran', seconds)
+
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(STATE_PATH, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    return summary
+
+def print_summary(summary):
+    """
+    Prints the status and wall time of each stage. 
+
+    Parameters
+    ----------
+    summary : dict
+        The (status, seconds) of each stage.
+    """
+    print(f"\n{'stage':<24} {'status':<8} {'seconds':>8}")
+    for name, (status, seconds) in sorted(summary.items(), key=lambda item: -item[1][1]):
+        print(f"{name:<24} {status:<8} {seconds:>8.2f}")
+    total = sum(seconds for _, seconds in summary.values())
+    print(f"{'total (stage time)':<33} {total:>8.2f}")
+
+def main():
+    """
+    Main function to run the pipeline from the command line. 
+    """
+    parser = argparse.ArgumentParser(description="Run the Airbnb analysis pipeline.")
+    parser.add_argument('targets', nargs='*', help=f"stages to bring up to date, from: {', '.join(STAGES)} (default: the main pipeline)")
+    parser.add_argument('--jobs', type=int, default=config.N_JOBS, help="number of worker processes (-1 for all cores)")
+    parser.add_argument('--force', action='store_true', help="rerun stages even if they are up to date")
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    summary = run_pipeline(args.targets or DEFAULT_TARGETS, jobs=args.jobs, force=args.force)
+    print_summary(summary)
+    print(f"{'wall time':<33} {time.perf_counter() - start:>8.2f}")
+    if any(status in ('failed', 'blocked') for status, _ in summary.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,216 @@
+import numpy as np
+import pandas as pd
+from joblib import Memory
+from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
 from sklearn.compose import ColumnTransformer, make_column_transformer
+from src import config
+from src.spatial_features import SpatialNeighbourFeatures, SPATIAL_INPUTS
 
-def create_preprocessor():
+CATEGORICAL_FEATURES = ['room_type', 'neighbourhood_group']
+
+NUMERIC_FEATURES = ['latitude', 'longitude', 'minimum_nights', 
+    'calculated_host_listings_count', 'reviews_per_month', 
+    'estimated_listed_months', 'availability_ratio', 
+    'days_since_last_review', 'distance_from_city_center']
+
+# Categorical columns passed to XGBoost/LGBM as integer codes when config.TREE_CATEGORICAL is set, 
+# neighbourhood is only usable this way as it would one-hot encode into hundreds of columns
+TREE_CATEGORICAL_FEATURES = CATEGORICAL_FEATURES + ['neighbourhood']
+
+# Columns not used by the models, dropped by the preprocessor
+DROP_FEATURES = [ 'last_review', 'id', 'name', 'host_id', 
+    'host_name', 'availability_365', 
+    'number_of_reviews', 'neighbourhood']
+
+# The only columns the model scripts need to load
+MODEL_FEATURES = NUMERIC_FEATURES + (TREE_CATEGORICAL_FEATURES if config.TREE_CATEGORICAL else CATEGORICAL_FEATURES)
+
+def create_preprocessor(spatial=config.SPATIAL_FEATURES):
     """
     Creates the preprocessor for transforming features in the dataset.
 
+    Parameters
+    ----------
+    spatial : bool, optional
+        If True, the k-nearest-neighbour price, density and room type mix features are 
+        added (default is config.SPATIAL_FEATURES).
+
     Returns
     -------
     ColumnTransformer
         A scikit-learn ColumnTransformer object that applies transformations 
         to the specified columns in the input dataframe.
     """
-    categorical_features = ['room_type', 'neighbourhood_group']
-    
-    numeric_features = ['latitude', 'longitude', 'minimum_nights', 
-        'calculated_host_listings_count', 'reviews_per_month', 
-        'estimated_listed_months', 'availability_ratio', 
-        'days_since_last_review', 'distance_from_city_center']
-    
-    drop_features = [ 'last_review', 'id', 'name', 'host_id', 
-        'host_name', 'availability_365', 
-        'number_of_reviews', 'neighbourhood']
-
     numeric_transformer = make_pipeline(StandardScaler())
     categorical_transformer = make_pipeline(OneHotEncoder(handle_unknown="ignore", sparse_output=False))
 
+    transformers = [
+        (numeric_transformer, NUMERIC_FEATURES),
+        (categorical_transformer, CATEGORICAL_FEATURES)
+    ]
+    if spatial:
+        # fitted on the training fold only, so no target leaks into validation folds
+        spatial_transformer = make_pipeline(SpatialNeighbourFeatures(), StandardScaler())
+        transformers.append((spatial_transformer, SPATIAL_INPUTS))
+
     preprocessor = make_column_transformer(
-        (numeric_transformer, numeric_features),
-        (categorical_transformer, categorical_features), 
-        ('drop', drop_features)
+        *transformers,
+        remainder='drop' # DROP_FEATURES, so they do not need to be loaded
     )
 
     return preprocessor
 
+def create_tree_preprocessor(spatial=config.SPATIAL_FEATURES):
+    """
+    Creates the preprocessor for the tree models that handle categorical features natively. 
+    The numeric features are transformed as in create_preprocessor, while the categorical 
+    features are encoded as integer codes (NaN for unseen categories) instead of one-hot 
+    columns. The output is a dataframe, to be followed by CategoricalCodes. 
+
+    Parameters
+    ----------
+    spatial : bool, optional
+        If True, the k-nearest-neighbour price, density and room type mix features are 
+        added (default is config.SPATIAL_FEATURES).
+
+    Returns
+    -------
+    ColumnTransformer
+        A scikit-learn ColumnTransformer object with pandas output. 
+    """
+    numeric_transformer = make_pipeline(StandardScaler())
+    categorical_transformer = make_pipeline(OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=np.nan))
+
+    transformers = [
+        (numeric_transformer, NUMERIC_FEATURES),
+        (categorical_transformer, TREE_CATEGORICAL_FEATURES)
+    ]
+    if spatial:
+        spatial_transformer = make_pipeline(SpatialNeighbourFeatures(), StandardScaler())
+        transformers.append((spatial_transformer, SPATIAL_INPUTS))
+
+    preprocessor = make_column_transformer(
+        *transformers,
+        remainder='drop',
+        verbose_feature_names_out=False # keep the column names, so CategoricalCodes can find them
+    )
+    return preprocessor.set_output(transform='pandas')
+
+class CategoricalCodes(BaseEstimator, TransformerMixin):
+    """
+    Casts integer-coded columns of a dataframe to the pandas category dtype, with the categories 
+    fixed at fit time so that training and prediction data share the same codes. LightGBM 
+    detects category columns automatically, XGBoost needs enable_categorical=True. Columns 
+    not present in the dataframe (e.g. removed by RFECV) are skipped. 
+
+    Parameters
+    ----------
+    columns : list of str, optional
+        The columns to cast (default is TREE_CATEGORICAL_FEATURES).
+    """
+    def __init__(self, columns=TREE_CATEGORICAL_FEATURES):
+        self.columns = columns
+
+    def fit(self, X, y=None):
+        """
+        Records the sorted integer codes of each column present in the dataframe. 
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The preprocessed training data.
+        y : None
+            Ignored.
+
+        Returns
+        -------
+        CategoricalCodes
+            The fitted transformer. 
+        """
+        self.categories_ = {col: np.sort(X[col].dropna().unique()).astype('int64') for col in self.columns if col in X}
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        return self
+
+    def transform(self, X):
+        """
+        Casts the fitted columns to categories with the codes seen in fit, codes not seen in 
+        fit become missing. 
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The preprocessed data.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A copy of the data with the category columns. 
+        """
+        X = X.copy()
+        for col, categories in self.categories_.items():
+            X[col] = pd.Categorical(X[col].astype('Int64'), categories=categories)
+        return X
+
+    def get_feature_names_out(self, input_features=None):
+        """
+        Returns the names of the output columns, which are the input columns. 
+
+        Parameters
+        ----------
+        input_features : array-like, optional
+            Ignored, the names seen in fit are returned.
+
+        Returns
+        -------
+        np.ndarray
+            The column names. 
+        """
+        return self.feature_names_in_
+
+def transformer_cache():
+    """
+    Returns the on-disk cache shared by the model pipelines for fitted transformers and the 
+    transformed data, or None if caching is disabled. 
+
+    Returns
+    -------
+    joblib.Memory or None
+        The cache at config.TRANSFORMER_CACHE_DIR. 
+    """
+    if not config.TRANSFORMER_CACHE:
+        return None
+    return Memory(config.TRANSFORMER_CACHE_DIR, verbose=0)
+
+def make_cached_pipeline(*steps):
+    """
+    Creates a pipeline like make_pipeline, but where the fit of every step before the final 
+    estimator is cached on disk. A transformer with the same parameters fitted on the same 
+    data (e.g. the same CV fold in another model, search candidate or script) is loaded from 
+    the cache, together with its transformed data, instead of being refitted. 
+
+    Parameters
+    ----------
+    *steps : list
+        The estimators of the pipeline.
+
+    Returns
+    -------
+    sklearn.Pipeline
+        The pipeline. 
+    """
+    return make_pipeline(*steps, memory=transformer_cache())
+
+def reduce_transformer_cache():
+    """
+    Evicts the least recently used entries of the transformer cache until it is below 
+    config.TRANSFORMER_CACHE_BYTES. 
+    """
+    memory = transformer_cache()
+    if memory is not None:
+        memory.reduce_size(bytes_limit=config.TRANSFORMER_CACHE_BYTES)
+
 def main():
     """
     Main function to create the preprocessor used in the models. 
@@ -0,0 +1,382 @@
+import argparse
+import functools
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from src import config
+
+try:
+    import resource
+except ImportError: # not available on Windows, the peak RSS is then not recorded
+    resource = None
+
+# Profiling is switched on for the whole process by the environment variable, e.g.
+# `AIRBNB_PROFILE=1 make all`; a value other than 1 is the output directory of the traces
+SETTING = os.environ.get(config.PROFILE_ENV, '')
+ENABLED = SETTING not in ('', '0')
+OUTPUT_DIR = config.PROFILE_OUTPUT_DIR if SETTING in ('', '0', '1') else SETTING
+
+# The traces of a run, i.e. a process and the processes it starts (which inherit the run id),
+# are written to OUTPUT_DIR/<run id>, so traces of earlier runs are never merged with them
+RUN_ID = os.environ.get(config.PROFILE_RUN_ENV) or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+if ENABLED:
+    os.environ[config.PROFILE_RUN_ENV] = RUN_ID
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1e6 if sys.platform == 'darwin' else 1e3
+
+EVENTS = []
+LANES = {} # timeline rows of the recorded spans, by name
+LOCAL = threading.local()
+
+def reset_after_fork():
+    """
+    Clears the events and open spans inherited by a forked worker process (e.g. a pipeline
+    stage), so it writes its own trace when its outermost span ends.
+    """
+    global LOCAL
+    EVENTS.clear()
+    LANES.clear()
+    LOCAL = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process so far (MB), or None if unknown.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_UNIT
+
+def count_rows(value):
+    """
+    Returns the number of rows of a dataframe or array, or None for other values.
+    """
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+class Span:
+    """
+    Records the wall time, CPU time, peak RSS and rows processed of a block of code as a
+    Chrome trace event. The rows can be set on the span inside the block. When the outermost
+    span of the process ends, the trace of the process is written to OUTPUT_DIR.
+
+    Parameters
+    ----------
+    name : str
+        The name of the span.
+    rows : int, optional
+        The number of rows processed.
+    report : bool, optional
+        If True, the summary table of the process is printed when the span ends (default is False).
+    **args
+        Extra values shown with the event.
+    """
+    __slots__ = ('name', 'rows', 'report', 'args', 'start', 'start_us', 'cpu', 'rss', 'first_event')
+
+    def __init__(self, name, rows=None, report=False, **args):
+        self.name = name
+        self.rows = rows
+        self.report = report
+        self.args = args
+
+    def __enter__(self):
+        LOCAL.depth = getattr(LOCAL, 'depth', 0) + 1
+        self.first_event = len(EVENTS)
+        self.rss = peak_rss_mb()
+        self.cpu = time.process_time()
+        self.start_us = time.time_ns() // 1000 # wall clock, so traces of several processes line up
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        rss = peak_rss_mb()
+        args = {'cpu_s': round(cpu, 6), **self.args}
+        if rss is not None:
+            args.update(peak_rss_mb=round(rss, 1), rss_growth_mb=round(rss - self.rss, 1))
+        if self.rows is not None:
+            args.update(rows=self.rows, rows_per_s=round(self.rows / seconds) if seconds > 0 else None)
+        add_event(self.name, self.start_us, seconds, threading.get_ident(), args)
+
+        LOCAL.depth -= 1
+        if LOCAL.depth == 0:
+            write_trace()
+            if self.report: # only this span's events, as worker processes can run several stages
+                print_summary(EVENTS[self.first_event:])
+        return False
+
+class NullSpan:
+    """
+    The span returned when profiling is disabled: entering and leaving it does nothing.
+    """
+    __slots__ = ()
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass # rows set on a disabled span are dropped
+
+NULL_SPAN = NullSpan()
+
+def add_event(name, start_us, seconds, lane, args):
+    """
+    Appends a complete ('X') Chrome trace event.
+    """
+    EVENTS.append({'name': name, 'ph': 'X', 'ts': start_us, 'dur': round(seconds * 1e6),
+                   'pid': os.getpid(), 'tid': lane, 'args': args})
+
+def span(name, rows=None, report=False, **args):
+    """
+    Returns a context manager recording a span, or a shared no-op one when profiling is disabled.
+
+    Parameters
+    ----------
+    name : str
+        The name of the span.
+    rows : int, optional
+        The number of rows processed, can also be set on the returned span.
+    report : bool, optional
+        If True, the summary table is printed when the span ends (default is False).
+    **args
+        Extra values shown with the event.
+
+    Returns
+    -------
+    Span or NullSpan
+        The context manager.
+    """
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, rows, report, **args)
+
+def qualified_name(func):
+    """
+    Returns the module and qualified name of a function, with the real module name of the
+    scripts run with `python -m`.
+    """
+    module = sys.modules.get(func.__module__)
+    module_name = getattr(getattr(module, '__spec__', None), 'name', None) or func.__module__
+    return f'{module_name}.{func.__qualname__}'
+
+def profiled(func=None, *, name=None, rows=None, report=False):
+    """
+    Decorates a function to record each call as a span. When profiling is disabled the
+    function is returned unchanged, so the decorator costs nothing.
+
+    Parameters
+    ----------
+    func : callable
+        The function.
+    name : str, optional
+        The name of the span (default is the module and name of the function).
+    rows : 'result' or int, optional
+        Where the number of rows comes from: the length of the result or of the positional
+        argument at this index.
+    report : bool, optional
+        If True, the summary table is printed after the call, for the main functions (default is False).
+
+    Returns
+    -------
+    callable
+        The decorated function.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name, rows=rows, report=report)
+    if not ENABLED:
+        return func
+    label = name or qualified_name(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with Span(label, report=report) as current:
+            result = func(*args, **kwargs)
+            if rows == 'result':
+                current.rows = count_rows(result)
+            elif isinstance(rows, int) and len(args) > rows:
+                current.rows = count_rows(args[rows])
+            return result
+    return wrapper
+
+def record(name, seconds, lane=None, end_us=None, **args):
+    """
+    Records a duration measured elsewhere, e.g. in a worker process, as a span ending now.
+
+    Parameters
+    ----------
+    name : str
+        The name of the span.
+    seconds : float
+        The duration.
+    lane : str, optional
+        The name of the timeline row of the span, to show parallel work side by side (default is the span name).
+    end_us : int, optional
+        The end of the span in microseconds since the epoch (default is now).
+    **args
+        Extra values shown with the event.
+    """
+    if not ENABLED:
+        return
+    lane = lane or name
+    if lane not in LANES:
+        LANES[lane] = len(LANES) + 1
+        EVENTS.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': LANES[lane], 'args': {'name': lane}})
+    end_us = time.time_ns() // 1000 if end_us is None else end_us
+    add_event(name, end_us - round(seconds * 1e6), seconds, LANES[lane], args)
+
+def record_cv(label, cv_results):
+    """
+    Records the fit and score time of every fold of a cross-validation. The folds may have
+    run in parallel worker processes, so each is shown in its own lane, ending when the
+    results were returned.
+
+    Parameters
+    ----------
+    label : str
+        The name of the model.
+    cv_results : dict
+        The per-fold 'fit_time' and 'score_time', as returned by cross_validate.
+    """
+    if not ENABLED:
+        return
+    for i, (fit_time, score_time) in enumerate(zip(cv_results['fit_time'], cv_results['score_time'])):
+        record(f'{label} fold {i}', fit_time + score_time,
+               fit_s=round(float(fit_time), 6), score_s=round(float(score_time), 6))
+
+def record_search(label, search):
+    """
+    Records the total fit and score time of every candidate of a fitted hyperparameter
+    search (its mean times per fold times the number of folds), with its parameters. The
+    candidates are laid end to end in one lane ending now, whether or not they ran in parallel.
+
+    Parameters
+    ----------
+    label : str
+        The name of the model.
+    search : RandomizedSearchCV or HalvingRandomSearchCV
+        The fitted search.
+    """
+    if not ENABLED:
+        return
+    results = search.cv_results_
+    durations = [(fit + score) * search.n_splits_ for fit, score in zip(results['mean_fit_time'], results['mean_score_time'])]
+    end_us = time.time_ns() // 1000 - round(sum(durations) * 1e6)
+    for i, params in enumerate(results['params']):
+        args = {'mean_fit_s': round(float(results['mean_fit_time'][i]), 6),
+                'mean_score_s': round(float(results['mean_score_time'][i]), 6),
+                'params': {key.rsplit('__', 1)[-1]: str(value) for key, value in params.items()}}
+        if 'n_resources' in results: # successive halving
+            args['rows'] = int(results['n_resources'][i])
+        end_us += round(durations[i] * 1e6)
+        record(f'{label} candidate {i}', durations[i], lane=f'{label} search', end_us=end_us, **args)
+
+def write_trace(events=None, path=None):
+    """
+    Writes the events of this process as a Chrome trace (open it in chrome://tracing or
+    https://ui.perfetto.dev), by default to OUTPUT_DIR/<run id>/trace_<pid>.json.
+    """
+    events = EVENTS if events is None else events
+    path = path or os.path.join(OUTPUT_DIR, RUN_ID, f'trace_{os.getpid()}.json')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    process = {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': ' '.join(sys.argv)}}
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': [process] + events, 'displayTimeUnit': 'ms'}, f)
+
+def summarise(events):
+    """
+    Aggregates the spans by name.
+
+    Parameters
+    ----------
+    events : list
+        The Chrome trace events.
+
+    Returns
+    -------
+    list
+        For each name, sorted by total wall time: the calls, wall time (s), CPU time (s),
+        peak RSS (MB) and rows per second (None when unknown).
+    """
+    totals = {}
+    for event in events:
+        if event.get('ph') != 'X':
+            continue
+        args = event['args']
+        total = totals.setdefault(event['name'], {'name': event['name'], 'calls': 0, 'wall_s': 0.0,
+                                                  'cpu_s': None, 'peak_rss_mb': None, 'rows': 0})
+        total['calls'] += 1
+        total['wall_s'] += event['dur'] / 1e6
+        if 'cpu_s' in args: # not known for the durations measured in worker processes
+            total['cpu_s'] = (total['cpu_s'] or 0.0) + args['cpu_s']
+        if args.get('peak_rss_mb') is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0.0, args['peak_rss_mb'])
+        total['rows'] += args.get('rows') or 0
+    for total in totals.values():
+        total['rows_per_s'] = total['rows'] / total['wall_s'] if total['rows'] and total['wall_s'] > 0 else None
+    return sorted(totals.values(), key=lambda total: -total['wall_s'])
+
+def print_summary(events, limit=30):
+    """
+    Prints the spans with the largest total wall time.
+    """
+    print(f"{'span':<56} {'calls':>6} {'wall (s)':>9} {'cpu (s)':>9} {'peak RSS (MB)':>14} {'rows/s':>12}")
+    for total in summarise(events)[:limit]:
+        cpu = f"{total['cpu_s']:9.3f}" if total['cpu_s'] is not None else f"{'':>9}"
+        rss = f"{total['peak_rss_mb']:14.1f}" if total['peak_rss_mb'] is not None else f"{'':>14}"
+        rows = f"{total['rows_per_s']:12,.0f}" if total['rows_per_s'] is not None else f"{'':>12}"
+        print(f"{total['name'][:56]:<56} {total['calls']:6d} {total['wall_s']:9.3f} {cpu} {rss} {rows}")
+
+def latest_run(directory):
+    """
+    Returns the directory of the most recently written run in directory, or None.
+    """
+    runs = [path for path in glob.glob(os.path.join(directory, '*')) if glob.glob(os.path.join(path, 'trace_*.json'))]
+    return max(runs, key=lambda path: max(os.path.getmtime(trace) for trace in glob.glob(os.path.join(path, 'trace_*.json'))), default=None)
+
+def main(directory=OUTPUT_DIR, run=None):
+    """
+    Main function to merge the traces of all processes of a run (pipeline stages and
+    workers) into one timeline, directory/timeline.json, and print the summary table.
+
+    Parameters
+    ----------
+    directory : str, optional
+        The directory of the runs (default is config.PROFILE_OUTPUT_DIR).
+    run : str, optional
+        The id of the run (default is the most recent run).
+    """
+    run_dir = os.path.join(directory, run) if run else latest_run(directory)
+    paths = sorted(glob.glob(os.path.join(run_dir, 'trace_*.json'))) if run_dir else []
+    if not paths:
+        print(f"Error: no traces in {run_dir or directory}, run with {config.PROFILE_ENV}=1 first.")
+        return  # exit function
+
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.load(f)['traceEvents'])
+    path = os.path.join(directory, 'timeline.json')
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f"Merged {len(paths)} traces of run {os.path.basename(run_dir)} into {path}")
+    print_summary(events)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the profiling traces of a run into one timeline and summarise them.")
+    parser.add_argument('directory', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--run', default=None, help="run id, a subdirectory of the directory (default is the latest run)")
+    args = parser.parse_args()
+    main(args.directory, args.run)
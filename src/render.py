@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import time
+import joblib
+import altair as alt
+import vegafusion
+import vl_convert
+from joblib import Parallel, delayed
+from src import config
+from src.storage import file_hash
+from src.profiling import profiled, record
+
+def chart_fingerprint(chart, inputs=()):
+    """
+    Computes the fingerprint of a chart from the hashes of its input files, its spec and
+    data (hashed together with the chart object) and the versions of the rendering libraries.
+
+    Parameters
+    ----------
+    chart : alt.TopLevelMixin
+        The chart.
+    inputs : list, optional
+        The data files the chart is built from.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    fingerprint = {
+        'inputs': {os.path.relpath(path, config.ROOT_DIR): file_hash(path) for path in inputs},
+        'chart': joblib.hash(chart),
+        'versions': [alt.__version__, vegafusion.__version__, vl_convert.__version__],
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+def state_path(path, cache_dir=config.RENDER_CACHE_DIR):
+    """
+    Returns the file recording the fingerprint of the chart last saved to path. Each chart
+    has its own file, so scripts rendering in parallel never write the same one.
+    """
+    name = os.path.relpath(path, config.ROOT_DIR).replace(os.sep, '__')
+    return os.path.join(cache_dir, f'{name}.json')
+
+def is_current(path, fingerprint):
+    """
+    Checks whether path was saved from a chart with this fingerprint and is unchanged since.
+    """
+    state = state_path(path)
+    if not os.path.isfile(path) or not os.path.isfile(state):
+        return False
+    with open(state) as f:
+        saved = json.load(f)
+    return saved['fingerprint'] == fingerprint and saved['output'] == file_hash(path)
+
+def save_chart(chart, path):
+    """
+    Saves a chart, as chart.save with the vegafusion data transformer, in a worker process.
+
+    Returns
+    -------
+    tuple
+        The wall time of the export (s) and when it ended (microseconds since the epoch).
+    """
+    alt.data_transformers.enable("vegafusion")
+    start = time.perf_counter()
+    chart.save(path)
+    return time.perf_counter() - start, time.time_ns() // 1000
+
+@profiled
+def render_charts(charts, inputs=(), n_jobs=config.N_JOBS, force=False):
+    """
+    Exports independent charts concurrently in a pool of worker processes, skipping the
+    charts whose fingerprint (see chart_fingerprint) is unchanged since they were last
+    saved, unless the file was modified or deleted since.
+
+    Parameters
+    ----------
+    charts : dict
+        The chart to save at each path.
+    inputs : list, optional
+        The data files the charts are built from.
+    n_jobs : int, optional
+        The number of worker processes, -1 uses all cores (default is config.N_JOBS).
+    force : bool, optional
+        If True, every chart is saved (default is False).
+
+    Returns
+    -------
+    list
+        The paths of the saved charts.
+    """
+    fingerprints = {path: chart_fingerprint(chart, inputs) for path, chart in charts.items()}
+    stale = [path for path in charts if force or not is_current(path, fingerprints[path])]
+    for path in charts:
+        if path not in stale:
+            print(f"Unchanged, not rendered: {os.path.relpath(path, config.ROOT_DIR)}")
+    if not stale:
+        return []
+
+    times = Parallel(n_jobs=min(n_jobs, len(stale)) if n_jobs > 0 else n_jobs)(
+        delayed(save_chart)(charts[path], path) for path in stale
+    )
+
+    os.makedirs(config.RENDER_CACHE_DIR, exist_ok=True)
+    for path, (seconds, end_us) in zip(stale, times):
+        record(f'render {os.path.basename(path)}', seconds, lane=f'render {os.path.basename(path)}', end_us=end_us)
+        with open(state_path(path), 'w') as f:
+            json.dump({'fingerprint': fingerprints[path], 'output': file_hash(path)}, f, indent=2)
+    return stale
@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import numpy as np
+import pandas as pd
+from src import config
+from src.artifacts import load_model
+from src.clean_and_engineer import impute_missing, engineer_features
+from src.models.compiled import compile_pipeline
+from src.preprocessor import MODEL_FEATURES
+
+# Raw listing fields (AB_NYC_2019 schema) the model needs, the review fields may be null for listings without reviews
+REQUIRED_FIELDS = ['latitude', 'longitude', 'room_type', 'neighbourhood_group', 'minimum_nights',
+    'number_of_reviews', 'calculated_host_listings_count', 'availability_365'] + (
+    ['neighbourhood'] if config.TREE_CATEGORICAL else [])
+OPTIONAL_FIELDS = ['last_review', 'reviews_per_month']
+NUMERIC_FIELDS = ['latitude', 'longitude', 'minimum_nights', 'number_of_reviews',
+    'calculated_host_listings_count', 'availability_365', 'reviews_per_month']
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+def validate_records(body):
+    """
+    Checks a request body and returns its listings.
+
+    Parameters
+    ----------
+    body : dict or list
+        The decoded JSON body: one listing or a list of listings.
+
+    Returns
+    -------
+    list of dict
+        The listings.
+
+    Raises
+    ------
+    ValueError
+        If the body is not a listing or a list of listings, or a listing misses a required
+        field or has a non-numeric value or an unparseable last_review date, which would
+        otherwise be imputed as missing.
+    """
+    records = [body] if isinstance(body, dict) else body
+    if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+        raise ValueError("expected a listing object or a non-empty list of listing objects")
+    for i, record in enumerate(records):
+        missing = [field for field in REQUIRED_FIELDS if record.get(field) is None]
+        if missing:
+            raise ValueError(f"listing {i} is missing: {', '.join(missing)}")
+        invalid = [field for field in NUMERIC_FIELDS if record.get(field) is not None and not is_number(record[field])]
+        if invalid:
+            raise ValueError(f"listing {i} has non-numeric values for: {', '.join(invalid)}")
+        if record.get('last_review') is not None and not is_date(record['last_review']):
+            raise ValueError(f"listing {i} has an invalid last_review date: {record['last_review']!r}")
+    return records
+
+def is_number(value):
+    """
+    Checks whether a JSON value is a finite number or a string holding one.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return False
+    try:
+        return bool(np.isfinite(float(value)))
+    except ValueError:
+        return False
+
+def is_date(value):
+    """
+    Checks whether a JSON value is a date string, as parsed by clean_and_engineer.
+    """
+    return isinstance(value, str) and not pd.isna(pd.to_datetime(value, errors='coerce'))
+
+def prepare_listings(records):
+    """
+    Turns raw listings into the model features, with the same imputation and engineered
+    features as clean_and_engineer.
+
+    Parameters
+    ----------
+    records : list of dict
+        The raw listings.
+
+    Returns
+    -------
+    pd.DataFrame
+        The model features of the listings.
+    """
+    df = pd.DataFrame.from_records(records, columns=REQUIRED_FIELDS + OPTIONAL_FIELDS)
+    df[NUMERIC_FIELDS] = df[NUMERIC_FIELDS].apply(pd.to_numeric)
+    df = engineer_features(impute_missing(df))
+    return df[MODEL_FEATURES]
+
+def predict_prices(model, records):
+    """
+    Predicts the prices of raw listings.
+
+    Parameters
+    ----------
+    model : sklearn.Pipeline or CompiledPredictor
+        The fitted model, predicting log-prices.
+    records : list of dict
+        The raw listings.
+
+    Returns
+    -------
+    np.ndarray
+        The predicted prices.
+    """
+    return np.exp(model.predict(prepare_listings(records)))
+
+class MicroBatcher:
+    """
+    Groups the listings of concurrent requests into batches predicted together. A batch is
+    closed when it holds max_batch listings or its first request has waited max_wait seconds,
+    and requests arriving while a batch is being predicted join the next one. The prediction
+    runs in a worker thread so the event loop keeps accepting requests.
+
+    Parameters
+    ----------
+    predict : callable
+        Maps a list of raw listings to an array of prices.
+    max_batch : int
+        The most listings in one batch.
+    max_wait : float
+        The longest a request waits for others to join its batch, in seconds.
+    """
+    def __init__(self, predict, max_batch, max_wait):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+
+    async def submit(self, records):
+        """
+        Queues the listings of a request and waits for their prices.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        return await future
+
+    async def run(self):
+        """
+        Collects and predicts batches until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            await self.predict_batch(batch)
+
+    async def predict_batch(self, batch):
+        """
+        Predicts a batch and resolves the future of each of its requests.
+        """
+        loop = asyncio.get_running_loop()
+        records = [record for request, _ in batch for record in request]
+        try:
+            prices = await loop.run_in_executor(None, self.predict, records)
+        except Exception:
+            # one bad listing fails the whole batch, so predict each request on its own
+            for request, future in batch:
+                try:
+                    prices = await loop.run_in_executor(None, self.predict, request)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(prices)
+            return
+
+        start = 0
+        for request, future in batch:
+            if not future.done(): # the client may have disconnected
+                future.set_result(prices[start:start + len(request)])
+            start += len(request)
+
+async def route(method, path, body, batcher):
+    """
+    Handles a request and returns its status code and JSON payload.
+    """
+    if method == 'GET' and path == '/health':
+        return 200, {'status': 'ok'}
+    if method != 'POST' or path != '/predict':
+        return 404, {'error': f"no route for {method} {path}"}
+    try:
+        records = validate_records(json.loads(body))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    try:
+        prices = await batcher.submit(records)
+    except (ValueError, TypeError) as e: # e.g. a non-numeric value
+        return 400, {'error': str(e)}
+    except Exception as e:
+        return 500, {'error': repr(e)}
+    return 200, {'prices': prices.tolist()}
+
+async def handle_connection(reader, writer, batcher):
+    """
+    Serves the HTTP/1.1 requests of one connection, keeping it open between requests.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, version = request_line.decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            status, payload = await route(method, path, body, batcher)
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            content = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass # malformed request or client gone
+    finally:
+        writer.close()
+
+async def serve(model, host, port, max_batch, max_wait):
+    """
+    Runs the prediction server until interrupted.
+    """
+    batcher = MicroBatcher(functools.partial(predict_prices, model), max_batch, max_wait)
+    batch_worker = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(functools.partial(handle_connection, batcher=batcher), host, port)
+    print(f"Serving price predictions on http://{host}:{port}/predict")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_worker.cancel()
+
+def main(host=config.SERVE_HOST, port=config.SERVE_PORT, max_batch=config.SERVE_MAX_BATCH, max_wait_ms=config.SERVE_MAX_WAIT_MS):
+    """
+    Main function to serve price predictions of the RFECV model over HTTP.
+
+    POST /predict takes one raw listing or a list of them as JSON, and returns
+    {"prices": [...]}. GET /health returns {"status": "ok"}.
+
+    Parameters
+    ----------
+    host : str, optional
+        The address to listen on (default is config.SERVE_HOST).
+    port : int, optional
+        The port to listen on (default is config.SERVE_PORT).
+    max_batch : int, optional
+        The most listings predicted together (default is config.SERVE_MAX_BATCH).
+    max_wait_ms : float, optional
+        The longest a request waits for others to join its batch (default is config.SERVE_MAX_WAIT_MS).
+    """
+    if not os.path.isfile(config.RFECV_PATH):
+        print(f"Error no file: {config.RFECV_PATH} ")
+        return  # exit function
+
+    model = load_model(config.RFECV_PATH)
+    if config.COMPILED_PREDICTOR:
+        try:
+            model = compile_pipeline(model)
+        except ValueError as e:
+            print(f"Serving the sklearn pipeline, as it cannot be compiled: {e}")
+    try:
+        asyncio.run(serve(model, host, port, max_batch, max_wait_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve price predictions of the RFECV model.")
+    parser.add_argument('--host', default=config.SERVE_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVE_PORT)
+    parser.add_argument('--max-batch', type=int, default=config.SERVE_MAX_BATCH, help="most listings per micro-batch")
+    parser.add_argument('--max-wait-ms', type=float, default=config.SERVE_MAX_WAIT_MS, help="longest wait for a micro-batch to fill")
+    args = parser.parse_args()
+    main(args.host, args.port, args.max_batch, args.max_wait_ms)
@@ -1,70 +1,243 @@
-import pandas as pd 
+import pandas as pd
 import numpy as np
+import hashlib
 import joblib
+import json
 import os
+import lightgbm
+from joblib import Parallel, delayed
+from numpy.lib.format import open_memmap
 from src import config
-from src.preprocessor import create_preprocessor
-import shap 
-from sklearn.pipeline import make_pipeline
-from sklearn.feature_selection import SelectFromModel, RFECV
-from sklearn.linear_model import Lasso
-from lightgbm import LGBMRegressor
+from src.profiling import profiled
+from src.artifacts import load_model
+from src.storage import load_frame, file_hash
+from src.preprocessor import MODEL_FEATURES
+import shap
 import matplotlib.pyplot as plt
 
+SHAP_VALUES_PATH = os.path.join(config.SHAP_CACHE_DIR, 'shap_values.npy')
+SHAP_META_PATH = os.path.join(config.SHAP_CACHE_DIR, 'shap_values.json')
 
+def encode_test_set(pipe_rfecv, X_test, selected_features_mask, selected_features):
+    """
+    Transforms the test set into the features seen by the LGBM regressor of the RFECV model.
+
+    Parameters
+    ----------
+    pipe_rfecv : sklearn.Pipeline
+        The fitted rfecv model.
+    X_test : pd.DataFrame
+        The test set features.
+    selected_features_mask : np.ndarray
+        The mask of the preprocessed features selected by the RFECV.
+    selected_features : list
+        The names of the selected features.
+
+    Returns
+    -------
+    pd.DataFrame
+        The preprocessed test set with the selected features.
+    """
+    preprocessor = pipe_rfecv.named_steps['columntransformer']
+    data = np.asarray(preprocessor.transform(X_test))
+    data_rfecv = data[:, selected_features_mask]
+    X_test_enc = pd.DataFrame(data=data_rfecv, columns=selected_features, index=X_test.index)
+    if 'categoricalcodes' in pipe_rfecv.named_steps:
+        X_test_enc = pipe_rfecv.named_steps['categoricalcodes'].transform(X_test_enc)
+    return X_test_enc
+
+def stratified_rows(y, n_rows=None, n_bins=10, seed=config.SHAP_SEED):
+    """
+    Samples the positions of at most n_rows listings, the same share from each price decile,
+    so the explained listings cover the whole price range.
+
+    Parameters
+    ----------
+    y : np.ndarray
+        The target values (log-prices).
+    n_rows : int, optional
+        The number of listings to sample, None keeps all of them (default is None).
+    n_bins : int, optional
+        The number of price quantiles sampled from (default is 10).
+    seed : int, optional
+        The random seed (default is config.SHAP_SEED).
+
+    Returns
+    -------
+    np.ndarray
+        The sorted positions of the sampled listings.
+    """
+    if n_rows is None or n_rows >= len(y):
+        return np.arange(len(y))
+    bins = pd.qcut(y, n_bins, labels=False, duplicates='drop')
+    rng = np.random.default_rng(seed)
+    rows = []
+    for b in np.unique(bins):
+        members = np.flatnonzero(bins == b)
+        size = min(len(members), round(n_rows * len(members) / len(y)))
+        rows.append(rng.choice(members, size=size, replace=False))
+    return np.sort(np.concatenate(rows))
+
+def shap_fingerprint(rows):
+    """
+    Computes the fingerprint of the SHAP values from the hashes of the model, the selected
+    features and the test set, the explained rows and the LightGBM version.
+
+    Parameters
+    ----------
+    rows : np.ndarray
+        The positions of the explained test listings.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    digest = hashlib.sha256()
+    for path in [config.RFECV_PATH, config.SELECTED_FEAT_PATH, config.X_TEST_DATA]:
+        digest.update(file_hash(path).encode())
+    digest.update(joblib.hash(rows).encode())
+    digest.update(lightgbm.__version__.encode())
+    return digest.hexdigest()
+
+def explain_chunk(model, X, path, start):
+    """
+    Computes the SHAP values of a chunk of listings with LightGBM's TreeSHAP (the same
+    path-dependent algorithm as shap.TreeExplainer) and writes them into the cache.
+
+    Parameters
+    ----------
+    model : LGBMRegressor
+        The fitted regressor.
+    X : pd.DataFrame
+        The encoded listings of the chunk.
+    path : str
+        The .npy file of the SHAP values.
+    start : int
+        The row of the chunk's first listing.
+    """
+    values = open_memmap(path, mode='r+')
+    values[start:start + len(X)] = model.predict(X, pred_contrib=True)
+    values.flush()
+
+@profiled(rows=1)
+def compute_shap_values(model, X_enc, path=SHAP_VALUES_PATH, chunksize=config.SHAP_CHUNKSIZE, n_jobs=config.N_JOBS):
+    """
+    Computes the SHAP values of the listings in chunks run in parallel, each worker writing its
+    chunk into a memory-mapped .npy file.
+
+    Parameters
+    ----------
+    model : LGBMRegressor
+        The fitted regressor.
+    X_enc : pd.DataFrame
+        The encoded listings.
+    path : str, optional
+        The .npy file of the SHAP values (default is SHAP_VALUES_PATH).
+    chunksize : int, optional
+        The number of listings per task (default is config.SHAP_CHUNKSIZE).
+    n_jobs : int, optional
+        The number of worker processes, -1 uses all cores (default is config.N_JOBS).
+
+    Returns
+    -------
+    np.memmap
+        The (n_listings, n_features + 1) SHAP values, the last column is the base value.
+    """
+    open_memmap(path, mode='w+', dtype=np.float64, shape=(len(X_enc), X_enc.shape[1] + 1)).flush()
+    Parallel(n_jobs=n_jobs)(
+        delayed(explain_chunk)(model, X_enc.iloc[start:start + chunksize], path, start)
+        for start in range(0, len(X_enc), chunksize)
+    )
+    return np.load(path, mmap_mode='r')
+
+def cached_shap_values(model, X_enc, fingerprint, values_path=SHAP_VALUES_PATH, meta_path=SHAP_META_PATH):
+    """
+    Loads the SHAP values from the cache if they were computed for the same fingerprint and
+    features, otherwise computes and caches them.
+
+    Parameters
+    ----------
+    model : LGBMRegressor
+        The fitted regressor.
+    X_enc : pd.DataFrame
+        The encoded listings.
+    fingerprint : str
+        The fingerprint of the model and data (see shap_fingerprint).
+    values_path : str, optional
+        The .npy file of the SHAP values (default is SHAP_VALUES_PATH).
+    meta_path : str, optional
+        The JSON file with the fingerprint of the cached values (default is SHAP_META_PATH).
+
+    Returns
+    -------
+    np.memmap
+        The (n_listings, n_features + 1) SHAP values, the last column is the base value.
+    """
+    meta = {'fingerprint': fingerprint, 'features': list(X_enc.columns), 'rows': len(X_enc)}
+    if os.path.isfile(meta_path) and os.path.isfile(values_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f"Using the cached SHAP values in {values_path}")
+                return np.load(values_path, mmap_mode='r')
+
+    # the metadata is written last, so an interrupted computation is never used
+    os.makedirs(os.path.dirname(values_path), exist_ok=True)
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)
+    values = compute_shap_values(model, X_enc, values_path)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return values
+
+@profiled(report=True)
 def main():
     """
-    Main function to ochestrate generating the shap value plots. 
+    Main function to ochestrate generating the shap value plots.
     """
-    # Check files exist 
+    # Check files exist
     files = [config.RFECV_PATH, config.X_TEST_DATA, config.Y_TEST_DATA, config.SELECTED_FEAT_PATH]
-    for f in files: 
+    for f in files:
         if not os.path.isfile(f):
             print(f"Error no file: {f} ")
             return  # exit function
-    
+
     # Load files
-    X_test = pd.read_csv(config.X_TEST_DATA)
-    y_test = pd.read_csv(config.Y_TEST_DATA)
-    pipe_rfecv = joblib.load(config.RFECV_PATH)
+    X_test = load_frame(config.X_TEST_DATA, columns=MODEL_FEATURES)
+    y_test = load_frame(config.Y_TEST_DATA).values.ravel()
+    pipe_rfecv = load_model(config.RFECV_PATH)
     selected_features_mask, selected_features = joblib.load(config.SELECTED_FEAT_PATH)
 
-    # Set up data
-    preprocessor = pipe_rfecv.named_steps['columntransformer']
-    data = preprocessor.transform(X_test)
-    data_rfecv = data[:, selected_features_mask]
-    X_test_enc = pd.DataFrame(data=data_rfecv, columns=selected_features, index=X_test.index)
+    # Set up data, optionally a stratified sample of the test set
+    rows = stratified_rows(y_test, config.SHAP_MAX_ROWS)
+    X_test_enc = encode_test_set(pipe_rfecv, X_test.iloc[rows], selected_features_mask, selected_features)
 
-    # Calculate SHAP values
-    explainer = shap.TreeExplainer(pipe_rfecv.named_steps["lgbmregressor"])
-    shap_val = explainer.shap_values(X_test_enc)
+    # Calculate SHAP values once, or load them from the cache
+    values = cached_shap_values(pipe_rfecv.named_steps["lgbmregressor"], X_test_enc, shap_fingerprint(rows))
+    explanation = shap.Explanation(values=np.asarray(values[:, :-1]), base_values=np.asarray(values[:, -1]),
+                                   data=X_test_enc.values, feature_names=list(X_test_enc.columns))
 
-    # Create & save plot 
+    # Create & save plot
     plt.figure()
-    shap.summary_plot(shap_val, X_test_enc, show=False)
+    shap.summary_plot(explanation.values, X_test_enc, show=False)
     plt.savefig(config.SHAP_SUM_PATH)
     plt.close()
 
-    # Individual Prediction Plots  
-    explanation = explainer(X_test_enc)
-
-    # obtain examples of a low and high priced listing  
-    y_test_reset = y_test.squeeze().reset_index(drop=True)
-    avg_val = y_test_reset.mean()
-    less_ind = y_test_reset[y_test_reset <= avg_val].index.tolist()
-    gr_ind = y_test_reset[y_test_reset > avg_val].index.tolist()
-    ex_less_ind = less_ind[100]
-    ex_gr_ind = gr_ind[100]
-    less_pred = pipe_rfecv.predict(X_test)[ex_less_ind] # a small predicted value 
-    gr_pred = pipe_rfecv.predict(X_test)[ex_gr_ind] # a large predicted value 
+    # obtain examples of a low and high priced listing
+    y_explained = pd.Series(y_test[rows])
+    avg_val = y_explained.mean()
+    less_ind = y_explained[y_explained <= avg_val].index.tolist()
+    gr_ind = y_explained[y_explained > avg_val].index.tolist()
+    ex_less_ind = less_ind[min(100, len(less_ind) - 1)]
+    ex_gr_ind = gr_ind[min(100, len(gr_ind) - 1)]
 
     # Create & save plots
     index = [ex_less_ind, ex_gr_ind]
     path = [config.SHAP_LESS_PATH, config.SHAP_GR_PATH]
     for i, p in zip(index, path):
-        plt.figure(figsize=(12, 8))  
-        shap.plots.waterfall(explanation[i], show=False) 
-        plt.savefig(p, bbox_inches='tight') 
+        plt.figure(figsize=(12, 8))
+        shap.plots.waterfall(explanation[i], show=False)
+        plt.savefig(p, bbox_inches='tight')
         plt.close()
 
 if __name__ == "__main__":
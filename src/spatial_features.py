@@ -0,0 +1,161 @@
+import pandas as pd
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from scipy.spatial import cKDTree
+from src.profiling import profiled
+
+EARTH_RADIUS_KM = 6371
+
+# Columns the spatial features are computed from
+SPATIAL_INPUTS = ['latitude', 'longitude', 'room_type']
+
+def unit_vectors(lat, lon):
+    """
+    Converts latitudes and longitudes to 3-D points on the unit sphere, where euclidean 
+    (chord) distance increases monotonically with great-circle distance. 
+
+    Parameters
+    ----------
+    lat : array-like
+        The latitudes in degrees.
+    lon : array-like
+        The longitudes in degrees.
+
+    Returns
+    -------
+    np.ndarray
+        An array of shape (n, 3). 
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+class SpatialNeighbourFeatures(BaseEstimator, TransformerMixin):
+    """
+    Computes local market features for each listing from its nearest neighbours among the 
+    training listings: the median target (log-price) of the k nearest neighbours, the listing 
+    density (listings per km² within the radius of the k-th neighbour) and the room type mix 
+    of the k nearest neighbours. 
+
+    A KD-tree over the training coordinates is built in fit and queried for a fixed k, so 
+    fitting and transforming scale in O(n log n). Only the listings seen in fit (and their 
+    targets) are used as neighbours, so inside a pipeline the features of a validation fold 
+    never use its own targets. When transforming the training data itself (in fit_transform, 
+    or in a later transform or predict of the same rows in the same order, e.g. train scores) 
+    each listing is left out of its own neighbourhood, so its own target never leaks into its 
+    features. Other subsets of the training rows are not detected. 
+
+    Parameters
+    ----------
+    n_neighbors : int, optional
+        The number of nearest neighbours aggregated (default is 20).
+    n_jobs : int, optional
+        The number of threads used for the neighbour queries, -1 uses all cores (default is -1).
+    """
+    def __init__(self, n_neighbors=20, n_jobs=-1):
+        self.n_neighbors = n_neighbors
+        self.n_jobs = n_jobs
+
+    @profiled(rows=1)
+    def fit(self, X, y=None):
+        """
+        Builds the KD-tree over the training listings and stores their targets and room types. 
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The training data with 'latitude', 'longitude' and 'room_type' columns.
+        y : array-like
+            The training target (log-price).
+
+        Returns
+        -------
+        SpatialNeighbourFeatures
+            The fitted transformer. 
+        """
+        if y is None:
+            raise ValueError("SpatialNeighbourFeatures requires the target to be fitted")
+        X = pd.DataFrame(X, columns=SPATIAL_INPUTS) if not hasattr(X, 'columns') else X
+
+        self.tree_ = cKDTree(unit_vectors(X['latitude'], X['longitude']))
+        self.target_ = np.asarray(y, dtype=np.float64).ravel()
+        self.room_types_ = np.array(sorted(pd.unique(X['room_type'].astype(str))))
+        self.room_codes_ = self._room_codes(X)
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def fit_transform(self, X, y=None):
+        """
+        Fits the transformer and computes the features of the training listings, leaving 
+        each listing out of its own neighbourhood. 
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The training data with 'latitude', 'longitude' and 'room_type' columns.
+        y : array-like
+            The training target (log-price).
+
+        Returns
+        -------
+        np.ndarray
+            The neighbourhood features. 
+        """
+        return self.fit(X, y)._neighbour_features(X, exclude_self=True)
+
+    def transform(self, X):
+        """
+        Computes the neighbourhood features of the listings in X from the training listings. 
+        If X holds the training listings (same coordinates in the same order), each listing 
+        is left out of its own neighbourhood, as in fit_transform. 
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The data with 'latitude', 'longitude' and 'room_type' columns.
+
+        Returns
+        -------
+        np.ndarray
+            The neighbourhood features. 
+        """
+        return self._neighbour_features(X, exclude_self=None)
+
+    def get_feature_names_out(self, input_features=None):
+        """
+        Returns the names of the neighbourhood features. 
+        """
+        names = ['knn_median_log_price', 'knn_listing_density'] 
+        names += [f'knn_share_{room_type}' for room_type in self.room_types_]
+        return np.array(names, dtype=object)
+
+    def _room_codes(self, X):
+        return pd.Categorical(X['room_type'].astype(str), categories=self.room_types_).codes
+
+    def _neighbour_features(self, X, exclude_self):
+        X = pd.DataFrame(X, columns=SPATIAL_INPUTS) if not hasattr(X, 'columns') else X
+        points = unit_vectors(X['latitude'], X['longitude'])
+        n_rows = len(points)
+        if exclude_self is None: # the training listings, whose points the tree was built on
+            exclude_self = n_rows == self.tree_.n and np.array_equal(points, self.tree_.data)
+        extra = 1 if exclude_self else 0
+        k = min(self.n_neighbors + extra, len(self.target_))
+
+        # k nearest training listings
+        dist, ind = self.tree_.query(points, k=k, workers=self.n_jobs)
+        dist, ind = dist.reshape(n_rows, k), ind.reshape(n_rows, k)
+        if exclude_self:
+            keep = ind != np.arange(n_rows)[:, np.newaxis]
+            # drop the furthest neighbour where the listing was not among its own neighbours
+            keep[keep.all(axis=1), -1] = False
+            dist, ind = dist[keep].reshape(n_rows, k - 1), ind[keep].reshape(n_rows, k - 1)
+
+        # listings per km² within the great-circle radius of the k-th neighbour
+        radius_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(dist[:, -1] / 2, 1))
+        density = ind.shape[1] / (np.pi * np.maximum(radius_km, 0.01)**2) # at least 10m, for stacked listings
+
+        median_price = np.median(self.target_[ind], axis=1)
+        neighbour_rooms = self.room_codes_[ind]
+        room_shares = [(neighbour_rooms == code).mean(axis=1) for code in range(len(self.room_types_))]
+
+        return np.column_stack([median_price, density] + room_shares)
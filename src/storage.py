@@ -0,0 +1,361 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src import config
+from src.profiling import profiled
+
+# Explicit column types for the data handed between stages, so the typed 
+# formats (parquet/feather) keep e.g. 'last_review' as a datetime. Columns not 
+# listed here (e.g. extra distance anchors) keep the type inferred from pandas. 
+SCHEMA = {
+    'id': pa.int64(),
+    'name': pa.string(),
+    'host_id': pa.int64(),
+    'host_name': pa.string(),
+    'neighbourhood_group': pa.dictionary(pa.int32(), pa.string()),
+    'neighbourhood': pa.dictionary(pa.int32(), pa.string()),
+    'latitude': pa.float64(),
+    'longitude': pa.float64(),
+    'room_type': pa.dictionary(pa.int32(), pa.string()),
+    'price': pa.float64(),
+    'minimum_nights': pa.int64(),
+    'number_of_reviews': pa.int64(),
+    'last_review': pa.timestamp('ns'),
+    'reviews_per_month': pa.float64(),
+    'calculated_host_listings_count': pa.int64(),
+    'availability_365': pa.int64(),
+    'estimated_listed_months': pa.float64(),
+    'availability_ratio': pa.float64(),
+    'days_since_last_review': pa.int64(),
+    'distance_from_city_center': pa.float64(),
+}
+
+FORMATS = ('csv', 'parquet', 'feather')
+
+# Memory-compact loading: low-cardinality strings are loaded as categories, integers 
+# are downcast and the free-text columns never used by the analysis are skipped. 
+CATEGORY_COLUMNS = ['neighbourhood_group', 'neighbourhood', 'room_type']
+UNUSED_COLUMNS = ['name', 'host_name']
+
+def file_format(path):
+    """
+    Identifies the storage format of a file from its extension. 
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    str
+        One of 'csv', 'parquet' or 'feather'.
+    """
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported data format '{fmt}' for {path}, expected one of {FORMATS}")
+    return fmt
+
+def file_hash(path):
+    """
+    Computes the SHA-256 hash of a file's contents. 
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    str
+        The hex digest, or None if the file does not exist. 
+    """
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def arrow_schema(df):
+    """
+    Builds the arrow schema for the dataframe (df), using the declared SCHEMA types where available. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to be written.
+
+    Returns
+    -------
+    pyarrow.Schema
+        The schema of the dataframe. 
+    """
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = [pa.field(field.name, SCHEMA.get(field.name, field.type)) for field in inferred]
+    return pa.schema(fields, metadata=inferred.metadata)
+
+def to_table(df, schema=None):
+    """
+    Converts the dataframe (df) to an arrow table with an explicit schema. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to convert.
+    schema : pyarrow.Schema, optional
+        The schema to use (default is built with arrow_schema).
+
+    Returns
+    -------
+    pyarrow.Table
+        The typed table. 
+    """
+    schema = schema or arrow_schema(df)
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+@profiled(rows=0)
+def write_frame(df, path):
+    """
+    Writes the dataframe (df) in the format given by the path's extension. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame or pandas.Series
+        The data to write.
+    path : str
+        The output path ending in .csv, .parquet or .feather.
+    """
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    fmt = file_format(path)
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'parquet':
+        pq.write_table(to_table(df), path)
+    else:
+        with pa.ipc.new_file(path, arrow_schema(df)) as writer:
+            writer.write_table(to_table(df))
+
+def read_frame(path, columns=None):
+    """
+    Reads a dataframe written by write_frame, loading only the requested columns. 
+
+    Parameters
+    ----------
+    path : str
+        The path ending in .csv, .parquet or .feather.
+    columns : list, optional
+        The columns to load (default is all columns).
+
+    Returns
+    -------
+    pd.DataFrame
+        The loaded dataframe, with columns in the requested order. 
+    """
+    fmt = file_format(path)
+    if fmt == 'csv':
+        df = pd.read_csv(path, encoding="utf-8", usecols=columns, float_precision="round_trip")
+    elif fmt == 'parquet':
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_feather(path, columns=columns)
+
+    if columns is not None:
+        df = df[columns]
+    return df
+
+def file_columns(path):
+    """
+    Reads the column names of a file without loading its data. 
+
+    Parameters
+    ----------
+    path : str
+        The path ending in .csv, .parquet or .feather.
+
+    Returns
+    -------
+    list
+        The column names. 
+    """
+    fmt = file_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, encoding="utf-8", nrows=0).columns.tolist()
+    elif fmt == 'parquet':
+        return pq.read_schema(path).names
+    else:
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+
+def iter_arrow_chunks(path, columns, chunksize):
+    """
+    Reads a parquet or feather file lazily, one chunk of rows at a time. 
+
+    Parameters
+    ----------
+    path : str
+        The path ending in .parquet or .feather.
+    columns : list
+        The columns to load.
+    chunksize : int
+        The maximum number of rows per chunk.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next chunk of rows. 
+    """
+    if file_format(path) == 'parquet':
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for start in range(0, batch.num_rows, chunksize):
+                    yield batch.slice(start, chunksize).to_pandas()
+
+def compact_frame(df):
+    """
+    Converts the dataframe (df) to memory-compact dtypes: CATEGORY_COLUMNS become categories 
+    and integer columns are downcast to the smallest integer type that holds their values. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to convert.
+
+    Returns
+    -------
+    pd.DataFrame
+        The converted dataframe. 
+    """
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+def memory_report(df, label):
+    """
+    Prints the memory used by the compact dataframe (df) and by the same columns with 
+    pandas' default dtypes (int64/float64/object). Skipped columns are not counted. 
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The compact dataframe.
+    label : str
+        The name of the dataframe in the report.
+    """
+    after = df.memory_usage(deep=True, index=False).sum()
+    before = 0
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            before += df[col].astype(object).memory_usage(deep=True, index=False)
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            before += len(df) * 8
+        else:
+            before += df[col].memory_usage(deep=True, index=False)
+    print(f"{label}: {before / 1e6:.1f} MB with default dtypes -> {after / 1e6:.1f} MB ({before / after:.1f}x smaller)")
+
+@profiled(rows='result')
+def load_frame(path, columns=None, chunksize=None, report=config.REPORT_MEMORY):
+    """
+    The shared loader for all pipeline stages. Reads only the requested columns (by default 
+    all but UNUSED_COLUMNS) with memory-compact dtypes. 
+
+    Parameters
+    ----------
+    path : str
+        The path ending in .csv, .parquet or .feather.
+    columns : list, optional
+        The columns to load (default is all columns except UNUSED_COLUMNS).
+    chunksize : int, optional
+        If set, the file is read lazily in chunks of at most this many rows. 
+    report : bool, optional
+        If True, prints the memory use before and after compaction (default is config.REPORT_MEMORY).
+
+    Returns
+    -------
+    pd.DataFrame or iterator
+        The loaded dataframe, or an iterator of dataframes if chunksize is set. 
+    """
+    if columns is None:
+        columns = [col for col in file_columns(path) if col not in UNUSED_COLUMNS]
+
+    if file_format(path) == 'csv':
+        dtypes = {col: 'category' for col in CATEGORY_COLUMNS if col in columns}
+        df = pd.read_csv(path, encoding="utf-8", usecols=columns, dtype=dtypes, 
+                         float_precision="round_trip", chunksize=chunksize)
+        if chunksize:
+            return (compact_frame(chunk[columns]) for chunk in df)
+        df = df[columns]
+    elif chunksize:
+        return (compact_frame(chunk) for chunk in iter_arrow_chunks(path, columns, chunksize))
+    else:
+        df = read_frame(path, columns)
+
+    df = compact_frame(df)
+    if report:
+        memory_report(df, os.path.basename(path))
+    return df
+
+class FrameWriter:
+    """
+    Appends dataframes chunk by chunk to a single output file, in the format given by 
+    the path's extension. Every chunk is written with the schema of the first chunk. 
+
+    Parameters
+    ----------
+    path : str
+        The output path ending in .csv, .parquet or .feather.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.format = file_format(path)
+        self.schema = None
+        self._writer = None
+
+    def write(self, df):
+        """
+        Appends the dataframe (df) to the output file. 
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The chunk to append.
+        """
+        if self.format == 'csv':
+            first = self.schema is None
+            df.to_csv(self.path, index=False, mode='w' if first else 'a', header=first)
+            self.schema = self.schema or list(df.columns)
+            return
+
+        if self.schema is None:
+            self.schema = arrow_schema(df)
+            if self.format == 'parquet':
+                self._writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self.schema)
+        self._writer.write_table(to_table(df, self.schema))
+
+    def close(self):
+        """
+        Closes the output file. 
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
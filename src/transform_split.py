@@ -1,11 +1,64 @@
 import pandas as pd
 import numpy as np
 from src import config
+from src.profiling import profiled
+from src.storage import load_frame, write_frame, FrameWriter
 import os 
 from sklearn.model_selection import train_test_split
 
+def hash_test_mask(ids, test_size=0.3):
+    """
+    Assigns each listing to the test set from a stable hash of its id, so a listing keeps 
+    its side of the split regardless of row order, dataset size or later refreshes. 
 
-def main(DATA_PATH, OUTPUT_PATH):
+    Parameters
+    ----------
+    ids : pandas.Series
+        The listing ids.
+    test_size : float, optional
+        The expected proportion of listings in the test set (default is 0.3).
+
+    Returns
+    -------
+    np.ndarray
+        A boolean mask which is True for test set listings. 
+    """
+    hashes = pd.util.hash_pandas_object(ids.astype('int64'), index=False).to_numpy()
+    return (hashes % 10_000) < round(test_size * 10_000)
+
+@profiled
+def stream_hash_split(DATA_PATH, OUTPUT_PATH, chunksize, test_size=0.3):
+    """
+    Log transforms the target and splits the dataset with hash_test_mask one chunk at a 
+    time, appending each chunk to the train and test files so memory use stays bounded. 
+
+    Parameters
+    ----------
+    DATA_PATH : str
+        The path to the feature engineered data.
+    OUTPUT_PATH : str
+        The path where to save the split datasets.
+    chunksize : int
+        The number of rows read per chunk.
+    test_size : float, optional
+        The expected proportion of listings in the test set (default is 0.3).
+    """
+    names = ['X_train', 'y_train', 'X_test', 'y_test']
+    writers = {name: FrameWriter(os.path.join(OUTPUT_PATH, f'{name}.{config.DATA_FORMAT}')) for name in names}
+    try:
+        for df in load_frame(DATA_PATH, chunksize=chunksize):
+            df['price'] = np.log(df['price'].astype('float64'))
+            test = hash_test_mask(df['id'], test_size)
+            writers['X_train'].write(df[~test].drop(columns=['price']))
+            writers['y_train'].write(df.loc[~test, ['price']])
+            writers['X_test'].write(df[test].drop(columns=['price']))
+            writers['y_test'].write(df.loc[test, ['price']])
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+@profiled(report=True)
+def main(DATA_PATH, OUTPUT_PATH, split_mode=config.SPLIT_MODE):
     """
     Main function to orchestrate target variable transformation and splitting the dataset into train and test sets. 
     
@@ -15,16 +68,23 @@ def main(DATA_PATH, OUTPUT_PATH):
         The path to the feature engineered data.
     OUTPUT_PATH : str
         The path where to save the split datasets.
+    split_mode : str, optional
+        'random' for train_test_split or 'hash' for the streaming split on the listing id 
+        (default is config.SPLIT_MODE).
     """
     # Check feature engineered data exists
     if not os.path.isfile(DATA_PATH):
         print(f"Error: The feature engineered data does not exist.")
         return  # exit function
 
-    df = pd.read_csv(DATA_PATH, encoding="utf-8")
+    if split_mode == 'hash':
+        stream_hash_split(DATA_PATH, OUTPUT_PATH, config.SPLIT_CHUNKSIZE)
+        return
+
+    df = load_frame(DATA_PATH)
     
     # log transform on target
-    df['price'] = np.log(df['price'])
+    df['price'] = np.log(df['price'].astype('float64'))
 
     # split data
     train_df, test_df = train_test_split(df, test_size=0.3, random_state=123)
@@ -34,10 +94,10 @@ def main(DATA_PATH, OUTPUT_PATH):
     y_test = test_df['price']
 
     # output data
-    X_train.to_csv(os.path.join(OUTPUT_PATH, 'X_train.csv'), index=False)
-    y_train.to_csv(os.path.join(OUTPUT_PATH, 'y_train.csv'), index=False)
-    X_test.to_csv(os.path.join(OUTPUT_PATH, 'X_test.csv'), index=False)
-    y_test.to_csv(os.path.join(OUTPUT_PATH, 'y_test.csv'), index=False)
+    write_frame(X_train, os.path.join(OUTPUT_PATH, f'X_train.{config.DATA_FORMAT}'))
+    write_frame(y_train, os.path.join(OUTPUT_PATH, f'y_train.{config.DATA_FORMAT}'))
+    write_frame(X_test, os.path.join(OUTPUT_PATH, f'X_test.{config.DATA_FORMAT}'))
+    write_frame(y_test, os.path.join(OUTPUT_PATH, f'y_test.{config.DATA_FORMAT}'))
 
 if __name__ == "__main__":
     DATA_PATH = config.FEAT_ENG_DATA
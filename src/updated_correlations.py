@@ -4,24 +4,31 @@ import altair_ally as aly
 import vegafusion
 import os 
 from src import config
+from src.profiling import profiled
+from src.storage import load_frame
 from src.eda_plots import corr_plot
+from src.correlations import correlation_matrices, numeric_columns
+from src.render import render_charts
 
 alt.data_transformers.enable("vegafusion")
 aly.alt.data_transformers.enable('vegafusion')
 
+@profiled(report=True)
 def main():
     """
     Main function to plot the updated correlations. 
     """
-    df = pd.read_csv(config.FEAT_ENG_DATA)
+    df = load_frame(config.FEAT_ENG_DATA)
     
-    # Correlation Plot
-    pear_corr_plot = corr_plot(df, exclude_cols=['id', 'host_id', 'availability_365', 'number_of_reviews'], title='Pearson Correlations')
-    spear_corr_plot = corr_plot(df, corr_type='spearman', exclude_cols=['id', 'host_id', 'availability_365', 'number_of_reviews'], title='Spearman Correlations')
+    # Correlation Plot (both methods from one pass over the ranked columns)
+    corr_cols = numeric_columns(df, exclude=['id', 'host_id', 'availability_365', 'number_of_reviews'])
+    corr = correlation_matrices(config.FEAT_ENG_DATA, corr_cols, df)
+    pear_corr_plot = corr_plot(df, title='Pearson Correlations', corr=corr['pearson'])
+    spear_corr_plot = corr_plot(df, corr_type='spearman', title='Spearman Correlations', corr=corr['spearman'])
     combined_corr = alt.hconcat(pear_corr_plot, spear_corr_plot)
     
-    # Save plots
-    combined_corr.save(config.CORR_UPDATED_PATH) 
+    # Save plots, skipped if unchanged
+    render_charts({config.CORR_UPDATED_PATH: combined_corr}, inputs=[config.FEAT_ENG_DATA])
 
 if __name__ == "__main__":
     os.makedirs(config.IMG_OUTPUT_DIR, exist_ok=True)